@@ -0,0 +1,72 @@
+'''
+Benchmark of reading .prov files from their binary sidecar (.prov.bin)
+versus parsing the xml file.
+
+A synthetic document (see synthetic_prov.py) is written and loaded once,
+then its sidecar is written. Each run is repeated and the best time is
+reported:
+- lxml: only parse the xml file with lxml (no dataprov objects)
+- xml: Dataprov(file) without sidecar (parse and build all objects)
+- lazy: Dataprov(file, lazy=True) without sidecar (objects built on access)
+- sidecar: Dataprov(file) with sidecar (all objects)
+
+The hash cache is disabled, so the sidecar runs include hashing the xml file.
+
+Usage (with dataprov installed or on the PYTHONPATH):
+    python benchmarks/binary_sidecar.py --operations 10000 /tmp/large.prov
+'''
+import os
+import time
+import argparse
+from lxml import etree
+from dataprov.elements.dataprov import Dataprov
+from dataprov.utils.binary import get_sidecar_path
+from dataprov.utils.hash_cache import configure_hash_cache
+from synthetic_prov import write_prov
+
+
+def best_time(function, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def count_operations(dataprov):
+    return sum(1 for operation in dataprov.iter_operations())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark binary sidecars of provenance documents.')
+    parser.add_argument('path', help="synthetic .prov file")
+    parser.add_argument('--operations', type=int, default=10000,
+                        help="number of operations in the history")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="number of reads per run")
+    args = parser.parse_args()
+
+    configure_hash_cache(enabled=False)
+    write_prov(args.path, args.operations)
+    sidecar = get_sidecar_path(args.path)
+    if os.path.exists(sidecar):
+        os.remove(sidecar)
+
+    runs = [("lxml", lambda: etree.parse(args.path)),
+            ("xml", lambda: count_operations(Dataprov(args.path, validate=False))),
+            ("lazy", lambda: count_operations(Dataprov(args.path, validate=False, lazy=True)))]
+    results = [(name, best_time(function, args.repeat)) for name, function in runs]
+
+    Dataprov(args.path, validate=False).write_sidecar(args.path)
+    results.append(("sidecar", best_time(lambda: count_operations(Dataprov(args.path)), args.repeat)))
+
+    print("Document size: {:.1f} MB, sidecar: {:.1f} MB".format(os.path.getsize(args.path) / (1024 * 1024),
+                                                           os.path.getsize(sidecar) / (1024 * 1024)))
+    print("{:<8} {:>10} {:>16}".format("run", "best s", "ms / operation"))
+    for name, seconds in results:
+        print("{:<8} {:>10.3f} {:>16.4f}".format(name, seconds, 1000 * seconds / args.operations))
+
+
+if __name__ == '__main__':
+    main()
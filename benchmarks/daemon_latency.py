@@ -0,0 +1,77 @@
+'''
+Benchmark of the latency of dataprov calls with and without dataprovd.
+
+Each command is run through the client (python -m dataprov.client) several
+times, once in-process (DATAPROV_NO_DAEMON=1) and once via a daemon started
+on a temporary socket. Median and 95th percentile of the wall time are
+reported. The run command wraps `true` with one input and one output file,
+so the time is dominated by start-up, probing, hashing and writing.
+
+A small synthetic document (see synthetic_prov.py) is used for validate.
+
+Usage (with dataprov installed or on the PYTHONPATH):
+    python benchmarks/daemon_latency.py --repeat 50 /tmp/daemon_bench
+'''
+import os
+import sys
+import time
+import argparse
+import subprocess
+from synthetic_prov import write_prov
+
+
+def latencies(command, env, cwd, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return sorted(times)
+
+
+def wait_for_socket(path, timeout=30):
+    start = time.perf_counter()
+    while not os.path.exists(path):
+        if time.perf_counter() - start > timeout:
+            raise RuntimeError("dataprovd did not start")
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dataprov calls with and without dataprovd.')
+    parser.add_argument('directory', help="working directory for the benchmark files")
+    parser.add_argument('--repeat', type=int, default=50,
+                        help="number of calls per command and mode")
+    args = parser.parse_args()
+
+    directory = os.path.abspath(args.directory)
+    os.makedirs(directory, exist_ok=True)
+    prov_file = os.path.join(directory, 'small.prov')
+    write_prov(prov_file, 10)
+    with open(os.path.join(directory, 'input.txt'), 'w') as input_file:
+        input_file.write("input\n")
+    socket_path = os.path.join(directory, 'dataprovd.sock')
+
+    client = [sys.executable, '-m', 'dataprov.client']
+    commands = [("validate", client + ['validate', prov_file]),
+                ("run", client + ['-i', 'input.txt', '-o', 'output.txt', 'run', 'true'])]
+
+    env = dict(os.environ, DATAPROV_SOCKET=socket_path)
+    in_process_env = dict(env, DATAPROV_NO_DAEMON='1')
+    daemon = subprocess.Popen([sys.executable, '-m', 'dataprov.daemon', '--socket', socket_path],
+                              env=env, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_socket(socket_path)
+        print("{:<10} {:<12} {:>10} {:>10}".format("command", "mode", "median ms", "p95 ms"))
+        for name, command in commands:
+            for mode, mode_env in (("in-process", in_process_env), ("daemon", env)):
+                times = latencies(command, mode_env, directory, args.repeat)
+                print("{:<10} {:<12} {:>10.1f} {:>10.1f}".format(
+                    name, mode, 1000 * times[len(times) // 2], 1000 * times[int(len(times) * 0.95) - 1]))
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+if __name__ == '__main__':
+    main()
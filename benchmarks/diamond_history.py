@@ -0,0 +1,74 @@
+'''
+Benchmark of combining histories in a diamond shaped pipeline.
+
+Each level of the pipeline splits the current file into two files with two
+operations and joins them again with a third operation, so both inputs of
+the join share the complete history of the previous levels. Without
+deduplication the history of the join doubles with every level. With
+content IDs each operation is only stored once and the history grows
+linearly.
+
+The number of operations of the concatenated histories is counted without
+building them, the deduplicated history is built and serialized.
+
+Usage (with dataprov installed or on the PYTHONPATH):
+    python benchmarks/diamond_history.py --depth 20
+'''
+import time
+import argparse
+from lxml import etree
+from dataprov.elements.dataprov import Dataprov
+from dataprov.elements.history import History
+from dataprov.elements.operation import Operation
+from synthetic_prov import operation_element
+
+
+def new_operation(inputs, targets, message):
+    operation = Operation()
+    operation.from_xml(operation_element(inputs, targets, message), validate=False)
+    return operation
+
+
+def new_provenance(prov_data, operation):
+    '''
+    Return a Dataprov object whose history combines the given provenance
+    data and the operation.
+    '''
+    history = History()
+    history.combine_histories(prov_data, operation)
+    prov = Dataprov()
+    prov.data['history'] = history
+    return prov
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark histories of a diamond shaped pipeline.')
+    parser.add_argument('--depth', type=int, default=20,
+                        help="number of diamonds in the pipeline")
+    args = parser.parse_args()
+
+    print("{:>6} {:>14} {:>16} {:>10}".format("depth", "operations", "concatenated", "seconds"))
+    source = new_provenance({}, new_operation([], ["level0.out"], "Source"))
+    concatenated = 1
+    start = time.perf_counter()
+    for level in range(args.depth):
+        name = "level%d.out" % level
+        left = new_provenance({name: source},
+                              new_operation([name], ["left%d.out" % level], "Left %d" % level))
+        right = new_provenance({name: source},
+                               new_operation([name], ["right%d.out" % level], "Right %d" % level))
+        source = new_provenance({"left": left, "right": right},
+                                new_operation(["left%d.out" % level, "right%d.out" % level],
+                                              ["level%d.out" % (level + 1)], "Join %d" % level))
+        concatenated = 2 * (concatenated + 1) + 1
+        operations = len(source.data['history'].data['operation'])
+        print("{:>6} {:>14} {:>16} {:>10.3f}".format(level + 1, operations, concatenated,
+                                                     time.perf_counter() - start))
+
+    start = time.perf_counter()
+    xml = etree.tostring(source.data['history'].to_xml())
+    print("Serialized history: {:.1f} KB in {:.3f} s".format(len(xml) / 1024, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+'''
+Benchmark of the Merkle tree computation of dataprov.elements.directory
+on a synthetic directory tree.
+
+The tree (per default 1,000,000 small files in 1,000 directories) is created
+once in the given directory and reused by later runs. Every measurement runs
+in a fresh process and reports the wall time and the peak resident memory.
+The first run hashes all files, the second run reuses the digests from the
+.shalist. The runs are repeated with batch sizes larger than the tree, i.e.
+without spilling sorted runs to temporary files.
+
+Usage (with dataprov installed or on the PYTHONPATH):
+    python benchmarks/directory_tree.py --files 1000000 /data/tmp/tree
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+
+def create_tree(root, files, files_per_dir):
+    '''
+    Create a tree with the given number of small files, unless it exists.
+    '''
+    marker = os.path.join(root, ".complete")
+    if os.path.exists(marker):
+        return
+    for i in range(files):
+        directory = os.path.join(root, "d%03d" % (i // files_per_dir // 100),
+                                 "d%05d" % (i // files_per_dir))
+        if i % files_per_dir == 0:
+            os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "f%07d" % i), 'w') as f:
+            f.write("%d\n" % i)
+    with open(marker, 'w') as f:
+        f.write("%d\n" % files)
+
+
+def measure(root, batch_size):
+    '''
+    Compute the Merkle tree in this process and print the result as JSON.
+    '''
+    from dataprov.elements.directory import Directory
+    from dataprov.utils.hash_cache import configure_hash_cache
+    # Measure hashing and reuse via the shalist, not the persistent cache
+    configure_hash_cache(enabled=False)
+    Directory.batch_size = batch_size
+    start = time.perf_counter()
+    directory = Directory(root)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is given in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'sha1': directory.data['sha1'], 'seconds': seconds, 'peakMB': peak}))
+
+
+def run(root, batch_size):
+    output = subprocess.check_output([sys.executable, __file__, '--measure',
+                                      '--batch-size', str(batch_size), root])
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Merkle tree computation of large directories.')
+    parser.add_argument('root', help="directory of the synthetic tree")
+    parser.add_argument('--files', type=int, default=1000000,
+                        help="number of files in the tree")
+    parser.add_argument('--files-per-dir', type=int, default=1000,
+                        help="number of files per directory")
+    parser.add_argument('--batch-size', type=int, default=100000,
+                        help="number of entries held in memory")
+    parser.add_argument('--measure', default=False, action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.root, args.batch_size)
+        return
+
+    start = time.perf_counter()
+    create_tree(args.root, args.files, args.files_per_dir)
+    print("Created tree in {:.1f} s".format(time.perf_counter() - start))
+
+    print("{:<12} {:<8} {:>10} {:>10}".format("batch size", "run", "seconds", "peak MB"))
+    digests = set()
+    for batch_size in (args.batch_size, 2 * args.files):
+        shalist = os.path.join(args.root, ".shalist")
+        if os.path.exists(shalist):
+            os.remove(shalist)
+        for name in ("hash", "reuse"):
+            result = run(args.root, batch_size)
+            digests.add(result['sha1'])
+            print("{:<12} {:<8} {:>10.2f} {:>10.1f}".format(batch_size, name, result['seconds'], result['peakMB']))
+    if len(digests) != 1:
+        print("Runs computed different digests: ", digests, file=sys.stderr)
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+'''
+Micro-benchmark of the hashing I/O strategies in dataprov.utils.hashing.
+
+A test file is written to each given directory (per default /dev/shm as
+tmpfs and the current working directory as disk) and hashed with every
+strategy. The first run of each strategy reads from the page cache, use
+--drop-caches (needs root) to measure cold reads on disk.
+
+Usage (with dataprov installed or on the PYTHONPATH):
+    python benchmarks/hash_io.py --size 512 --repeat 3 /dev/shm /data/tmp
+'''
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from dataprov.utils import hashing
+
+
+def write_test_file(directory, size_mb):
+    '''
+    Write a file with random content and return its path.
+    '''
+    fd, path = tempfile.mkstemp(prefix="dataprov_hash_io_", dir=directory)
+    chunk = os.urandom(1024 * 1024)
+    with os.fdopen(fd, 'wb') as f:
+        for i in range(size_mb):
+            f.write(chunk)
+    return path
+
+
+def drop_caches():
+    '''
+    Drop the page cache of the whole system.
+    '''
+    subprocess.check_call(['sync'])
+    with open('/proc/sys/vm/drop_caches', 'w') as f:
+        f.write('3\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark hashing I/O strategies.')
+    parser.add_argument('directories', nargs='*',
+                        default=['/dev/shm', os.getcwd()],
+                        help="directories to write the test file to")
+    parser.add_argument('--size', type=int, default=256,
+                        help="size of the test file in MB")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="number of runs per strategy")
+    parser.add_argument('--algorithm', default='sha1',
+                        help="hash algorithm")
+    parser.add_argument('--drop-caches', default=False, action='store_true',
+                        help="drop the page cache before each run (needs root)")
+    args = parser.parse_args()
+
+    # Use mmap for the test file, regardless of its size,
+    # and keep the pages in the page cache unless asked otherwise
+    hashing.configure_hashing(mmap_min_size=1, drop_page_cache=args.drop_caches)
+
+    print("{:<30} {:<10} {:<8} {:>10} {:>10}".format("directory", "fs", "strategy", "best s", "MB/s"))
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            print("Skip missing directory: ", directory, file=sys.stderr)
+            continue
+        path = write_test_file(directory, args.size)
+        fs_type = hashing.get_filesystem_type(path)
+        try:
+            digests = set()
+            for strategy in hashing.io_strategies:
+                times = []
+                for i in range(args.repeat):
+                    if args.drop_caches:
+                        drop_caches()
+                    start = time.perf_counter()
+                    digests.add(hashing.hash_file(path, args.algorithm, strategy))
+                    times.append(time.perf_counter() - start)
+                best = min(times)
+                print("{:<30} {:<10} {:<8} {:>10.3f} {:>10.1f}".format(directory, str(fs_type), strategy,
+                                                                       best, args.size / best))
+            if len(digests) != 1:
+                print("Strategies computed different digests: ", digests, file=sys.stderr)
+                exit(1)
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+'''
+Benchmark of the start-up time of the dataprov command line interface.
+
+Each command runs in a fresh interpreter several times, the best and the
+median wall time are reported, the median is compared to the target. With --importtime the modules
+with the highest cumulative import time (python -X importtime) are listed
+for the first command.
+
+A small synthetic document (see synthetic_prov.py) is used for validate.
+
+Usage (with dataprov installed or on the PYTHONPATH):
+    python benchmarks/startup.py --target 0.15 /tmp/small.prov
+'''
+import sys
+import time
+import argparse
+import subprocess
+from synthetic_prov import write_prov
+
+
+def wall_times(command, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return sorted(times)
+
+
+def import_times(command, count):
+    '''
+    Return the modules with the highest cumulative import time (in ms).
+    '''
+    stderr = subprocess.run(command[:1] + ['-X', 'importtime'] + command[1:],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE).stderr.decode()
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        modules.append((int(cumulative_us) / 1000, module.rstrip()))
+    return sorted(modules, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the start-up time of dataprov.')
+    parser.add_argument('path', help="synthetic .prov file")
+    parser.add_argument('--repeat', type=int, default=10,
+                        help="number of runs per command")
+    parser.add_argument('--target', type=float, default=0.15,
+                        help="target wall time in seconds")
+    parser.add_argument('--importtime', default=False, action='store_true',
+                        help="list the slowest imports of the first command")
+    args = parser.parse_args()
+
+    write_prov(args.path, 10)
+    commands = [("validate", [sys.executable, '-m', 'dataprov', 'validate', args.path]),
+                ("--help", [sys.executable, '-m', 'dataprov', '--help']),
+                ("python", [sys.executable, '-c', 'pass'])]
+
+    print("{:<10} {:>10} {:>10} {:>8}".format("command", "best s", "median s", "target"))
+    for name, command in commands:
+        times = wall_times(command, args.repeat)
+        median = times[len(times) // 2]
+        result = "ok" if median <= args.target else "missed"
+        print("{:<10} {:>10.3f} {:>10.3f} {:>8}".format(name, times[0], median,
+                                                        result if name != "python" else ""))
+
+    if args.importtime:
+        print("Slowest imports of validate (cumulative ms):")
+        for milliseconds, module in import_times(commands[0][1], 15):
+            print("{:>10.1f} {}".format(milliseconds, module))
+
+
+if __name__ == '__main__':
+    main()
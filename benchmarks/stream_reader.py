@@ -0,0 +1,67 @@
+'''
+Benchmark of reading large provenance documents: loading the whole document
+with Dataprov(file) versus streaming the operations with
+Dataprov(file, stream=True).iter_operations().
+
+A synthetic document (see synthetic_prov.py) is written first. Every
+measurement runs in a fresh process and reports the wall time and the peak
+resident memory.
+
+Usage (with dataprov installed or on the PYTHONPATH):
+    python benchmarks/stream_reader.py --operations 50000 /tmp/large.prov
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from synthetic_prov import write_prov
+
+
+def measure(path, mode, validate):
+    '''
+    Read the document in this process and print the result as JSON.
+    '''
+    from dataprov.elements.dataprov import Dataprov
+    start = time.perf_counter()
+    dataprov = Dataprov(path, validate=validate, stream=(mode == "stream"))
+    target = dataprov.target.get_uri()
+    operations = sum(1 for operation in dataprov.iter_operations())
+    seconds = time.perf_counter() - start
+    # ru_maxrss is given in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'target': target, 'operations': operations,
+                      'seconds': seconds, 'peakMB': peak}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark reading large provenance documents.')
+    parser.add_argument('path', help="synthetic .prov file")
+    parser.add_argument('--operations', type=int, default=50000,
+                        help="number of operations in the history")
+    parser.add_argument('--validate', default=False, action='store_true',
+                        help="validate the document while reading it")
+    parser.add_argument('--measure', choices=["load", "stream"],
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.path, args.measure, args.validate)
+        return
+
+    write_prov(args.path, args.operations)
+    print("Document size: {:.1f} MB".format(os.path.getsize(args.path) / (1024 * 1024)))
+    print("{:<8} {:>12} {:>10} {:>10}".format("mode", "operations", "seconds", "peak MB"))
+    for mode in ("load", "stream"):
+        command = [sys.executable, __file__, '--measure', mode, args.path]
+        if args.validate:
+            command.append('--validate')
+        result = json.loads(subprocess.check_output(command).decode().splitlines()[-1])
+        print("{:<8} {:>12} {:>10.2f} {:>10.1f}".format(mode, result['operations'],
+                                                        result['seconds'], result['peakMB']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+'''
+Synthetic provenance documents for the benchmarks.
+
+write_prov writes a .prov file whose history is a chain of operations,
+each reading the output of the previous one. The operations use the current
+element structure of dataprov, the content is made up.
+
+Usage (with dataprov installed or on the PYTHONPATH):
+    python benchmarks/synthetic_prov.py --operations 50000 /tmp/large.prov
+'''
+import hashlib
+import argparse
+from lxml import etree
+
+
+def file_object(parent, tag, name):
+    '''
+    Append a dataObject element describing a made up file.
+    '''
+    data_object = etree.SubElement(parent, tag, type="file")
+    file_ele = etree.SubElement(data_object, "file")
+    etree.SubElement(file_ele, "name").text = name
+    etree.SubElement(file_ele, "uri").text = "/data/pipeline/" + name
+    etree.SubElement(file_ele, "sha1").text = hashlib.sha1(name.encode()).hexdigest()
+    return data_object
+
+
+def operation_element(inputs, targets, message, hostname="node000"):
+    '''
+    Return an operation element reading the files named in inputs
+    and writing the files named in targets.
+    '''
+    op = etree.Element("operation")
+    if inputs:
+        input_list = etree.SubElement(op, "inputDataObjects")
+        for name in inputs:
+            file_object(input_list, "dataObject", name)
+    target_list = etree.SubElement(op, "targetDataObjects")
+    for name in targets:
+        file_object(target_list, "dataObject", name)
+    etree.SubElement(op, "startTime").text = "2020-01-01T00:00:00"
+    etree.SubElement(op, "endTime").text = "2020-01-01T00:01:00"
+    executor = etree.SubElement(op, "executor")
+    etree.SubElement(executor, "firstName").text = "Jane"
+    etree.SubElement(executor, "surname").text = "Doe"
+    etree.SubElement(executor, "mail").text = "jane.doe@example.org"
+    etree.SubElement(executor, "affiliation").text = "University"
+    host = etree.SubElement(op, "host")
+    for tag, text in (("system", "Linux"), ("dist", "Example"), ("version", "1.0"),
+                      ("codename", "example"), ("kernelVersion", "5.0.0"),
+                      ("machine", "x86_64"), ("processor", "x86_64"),
+                      ("hostname", hostname)):
+        etree.SubElement(host, tag).text = text
+    op_class = etree.SubElement(op, "opClass")
+    command_line = etree.SubElement(op_class, "commandLine")
+    etree.SubElement(command_line, "command").text = "tool " + " ".join(inputs)
+    etree.SubElement(command_line, "toolPath").text = "/usr/bin/tool"
+    etree.SubElement(command_line, "toolVersion").text = "1.0"
+    etree.SubElement(op, "message").text = message
+    return op
+
+
+def operation(index):
+    '''
+    Return an operation element reading step<index-1>.out and writing step<index>.out.
+    '''
+    inputs = ["step%d.out" % (index - 1)] if index > 0 else []
+    return operation_element(inputs, ["step%d.out" % index], "Step %d" % index,
+                             "node%03d" % (index % 100))
+
+
+def write_prov(path, operations):
+    '''
+    Write a .prov file with a chain of the given number of operations.
+    The document is written incrementally, so large histories can be written.
+    '''
+    with etree.xmlfile(path, encoding='utf-8') as xf:
+        xf.write_declaration()
+        with xf.element("dataprov"):
+            xf.write(file_object(etree.Element("root"), "target", "step%d.out" % (operations - 1)))
+            with xf.element("history"):
+                for index in range(operations):
+                    xf.write(operation(index))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic provenance document.')
+    parser.add_argument('path', help="output .prov file")
+    parser.add_argument('--operations', type=int, default=1000,
+                        help="number of operations in the history")
+    args = parser.parse_args()
+    write_prov(args.path, args.operations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+'''
+Benchmark of the XML schema validation of dataprov elements.
+
+The history of a .prov file is replicated to the given number of operations
+and parsed with validation of every element. The "compile" run clears the
+schema registry before every validation, i.e. every element compiles its
+schema again (the behaviour before the schema registry). The "registry" run
+reuses the compiled schemas.
+
+Usage (with dataprov installed or on the PYTHONPATH):
+    python benchmarks/validation.py --operations 100 examples/bwa/example_output/mapped_reads/A.bam.prov
+'''
+import sys
+import copy
+import time
+import argparse
+from lxml import etree
+from dataprov.elements.history import History
+from dataprov.utils.schemas import get_schema_registry
+
+
+def create_history(prov_file, operations):
+    '''
+    Return a history element with the given number of operations,
+    copied from the history of a .prov file.
+    '''
+    root = etree.parse(prov_file).getroot()
+    operation_eles = root.find('history').findall('operation')
+    history_ele = etree.Element('history')
+    for i in range(operations):
+        history_ele.append(copy.deepcopy(operation_eles[i % len(operation_eles)]))
+    return history_ele
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark XML schema validation.')
+    parser.add_argument('prov_file', nargs='?',
+                        default='examples/bwa/example_output/mapped_reads/A.bam.prov',
+                        help="provenance file the operations are copied from")
+    parser.add_argument('--operations', type=int, default=100,
+                        help="number of operations in the history")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="number of parses per run")
+    args = parser.parse_args()
+
+    history_ele = create_history(args.prov_file, args.operations)
+    registry = get_schema_registry()
+    try:
+        registry.get_schema(History.schema_file)
+    except etree.XMLSchemaParseError as e:
+        print("Cannot compile the dataprov schemas with this libxml2 version: ", e, file=sys.stderr)
+        exit(1)
+
+    get_schema = registry.get_schema
+
+    def get_schema_uncached(schema_file):
+        registry.clear()
+        return get_schema(schema_file)
+
+    print("{:<10} {:>10} {:>16}".format("run", "best s", "ms / operation"))
+    for name in ("compile", "registry"):
+        registry.get_schema = get_schema_uncached if name == "compile" else get_schema
+        times = []
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            History().from_xml(history_ele, validate=True)
+            times.append(time.perf_counter() - start)
+        best = min(times)
+        print("{:<10} {:>10.3f} {:>16.3f}".format(name, best, 1000 * best / args.operations))
+
+
+if __name__ == '__main__':
+    main()
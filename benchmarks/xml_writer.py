@@ -0,0 +1,83 @@
+'''
+Benchmark of writing large provenance documents: building the whole
+document and writing it with write_xml(dataprov.to_xml()) versus the
+streaming writer dataprov.write_xml(), which serializes one operation at a
+time.
+
+A synthetic document (see synthetic_prov.py) is written first. Every
+measurement runs in a fresh process, which loads the document (lazy or
+eager) and writes it again. The resident memory after loading and the peak
+resident memory while writing are reported.
+
+Usage (with dataprov installed or on the PYTHONPATH):
+    python benchmarks/xml_writer.py --operations 50000 /tmp/large.prov
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from synthetic_prov import write_prov
+
+
+def get_peak_memory():
+    '''
+    Return the peak resident memory of this process in MB.
+    '''
+    # ru_maxrss is given in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(path, mode, lazy):
+    '''
+    Load and write the document in this process and print the result as JSON.
+    '''
+    from dataprov.elements.dataprov import Dataprov
+    from dataprov.utils.io import write_xml
+    dataprov = Dataprov(path, validate=False, lazy=lazy)
+    loaded = get_peak_memory()
+    output_file = path + "." + mode
+    start = time.perf_counter()
+    if mode == "tree":
+        write_xml(dataprov.to_xml(), output_file)
+    else:
+        dataprov.write_xml(output_file)
+    seconds = time.perf_counter() - start
+    os.remove(output_file)
+    print(json.dumps({'seconds': seconds, 'loadedMB': loaded, 'peakMB': get_peak_memory()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark writing large provenance documents.')
+    parser.add_argument('path', help="synthetic .prov file")
+    parser.add_argument('--operations', type=int, default=50000,
+                        help="number of operations in the history")
+    parser.add_argument('--measure', choices=["tree", "stream"],
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--lazy', default=False, action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.path, args.measure, args.lazy)
+        return
+
+    write_prov(args.path, args.operations)
+    print("Document size: {:.1f} MB".format(os.path.getsize(args.path) / (1024 * 1024)))
+    print("{:<8} {:<8} {:>10} {:>12} {:>10} {:>14}".format("load", "write", "seconds", "loaded MB",
+                                                       "peak MB", "write peak MB"))
+    for lazy in (False, True):
+        for mode in ("tree", "stream"):
+            command = [sys.executable, __file__, '--measure', mode, args.path]
+            if lazy:
+                command.append('--lazy')
+            result = json.loads(subprocess.check_output(command).decode().splitlines()[-1])
+            print("{:<8} {:<8} {:>10.2f} {:>12.1f} {:>10.1f} {:>14.1f}".format(
+                "lazy" if lazy else "eager", mode, result['seconds'], result['loadedMB'],
+                result['peakMB'], result['peakMB'] - result['loadedMB']))
+
+
+if __name__ == '__main__':
+    main()
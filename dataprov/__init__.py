@@ -0,0 +1,8 @@
+# Public API: dataprov.record (see dataprov/recorder.py).
+# It is imported on first use, the command line client (dataprov/client.py)
+# imports this package on every call and only needs the standard library.
+def __getattr__(name):
+    if name in ('record', 'Recorder'):
+        from dataprov import recorder
+        return getattr(recorder, name)
+    raise AttributeError("module 'dataprov' has no attribute " + repr(name))
@@ -1,12 +1,86 @@
 import os
 import argparse
-import subprocess
 from collections import defaultdict
 from dataprov.elements.dataprov import Dataprov
+from dataprov.elements.file import File
 from dataprov.elements.executor import Executor
+from dataprov.elements.host import Host
+from dataprov.elements.data_object import DataObject
 from dataprov.elements.operation import Operation
 from dataprov.elements.op_class import OpClass
-from dataprov.utils.io import write_xml
+from dataprov.utils.io import find_prov_file, detect_compression, compressions
+from dataprov.utils.tracing import trace_methods
+from dataprov.utils.schemas import prewarm_schemas
+from dataprov.utils.binary import configure_sidecars, sidecars_enabled
+from dataprov.utils.object_store import configure_object_store, get_configured_object_store
+from dataprov.utils.hash_cache import configure_hash_cache, get_hash_cache, get_session_stats
+from dataprov.utils.hash_pool import configure_hash_pool, pool_types
+from dataprov.utils.hashing import configure_hashing, configure_digests, get_digest_algorithms
+from dataprov.utils.hashing import configure_fingerprint, read_fingerprint_config
+from dataprov.definitions import HASH_CACHE_FILE, TOOL_CACHE_FILE
+
+
+def read_input_provenance(input_data_objects_tmp, debug=False, link=False):
+    '''
+    Check which input data objects exist and read their provenance metadata.
+    Return a dictionary mapping the absolute path of each input data object
+    to its Dataprov object (None if there is no provenance metadata).
+    If link, the histories are linked and not read, only the targets are
+    read when they are needed.
+    Raises IOError if the provenance metadata cannot be read, including
+    missing or corrupted operations in an object store.
+    '''
+    input_data_objects = []
+    for input_data_object in input_data_objects_tmp:
+        # Check if input data objects and the corresponding provenance metadata exists
+        if not os.path.exists(input_data_object):
+            print("Input file specified by -i does not exist: ", input_data_object)
+            print("No provenance information will be considered for this file.")
+            continue
+        abs_path = os.path.abspath(input_data_object)
+        if abs_path not in input_data_objects:
+            input_data_objects.append(abs_path)
+            
+    if debug:
+        print("Input files: ", input_data_objects)
+        
+     # Read provenance data   
+    input_provenance_data = defaultdict()
+    for input_data_object in input_data_objects:
+        # .prov, .prov.gz or .prov.xz
+        input_prov_file = find_prov_file(input_data_object)
+        if input_prov_file is None:
+            print("Metadata for input file specified by -i does not exist: ", input_data_object)
+            input_provenance_data[input_data_object] = None
+            continue
+        print("Metadata for input file specified by -i does exist: ", input_data_object)
+        #Parse XML and store in dictionary
+        # Lazy: most of the inherited history is only copied to the new provenance
+        # Linked histories are not read at all
+        new_provenance_object = Dataprov(input_prov_file, stream=link, lazy=True)
+        new_provenance_object.check_references()
+        input_provenance_data[input_data_object] = new_provenance_object
+    
+    return input_provenance_data
+
+
+def read_input_data_objects(input_data_objects_tmp, debug=False, link=False):
+    '''
+    Read the provenance metadata of the input data objects (see
+    read_input_provenance) and create the data objects of the inputs without
+    provenance metadata, i.e. hash them.
+    Return the dictionary of provenance data and a dictionary mapping the
+    inputs without provenance metadata to their data objects.
+    '''
+    input_provenance_data = read_input_provenance(input_data_objects_tmp, debug, link)
+    data_objects = {}
+    for input_data_object, provenance_object in input_provenance_data.items():
+        if provenance_object is None:
+            data_objects[input_data_object] = DataObject(input_data_object)
+        else:
+            # Read the target of streamed provenance data
+            provenance_object.target
+    return input_provenance_data, data_objects
 
 
 def main():
@@ -32,6 +106,61 @@ def main():
                         help="personal information about executor added to recorded metadata.",
                         default=executor_default_config_file)
 
+    # Persistent cache of file digests
+    parser.add_argument('--hash-cache',
+                        help="path to the persistent hash cache.",
+                        default=HASH_CACHE_FILE)
+    parser.add_argument('--hash-cache-size', type=int,
+                        help="maximal number of digests kept in the hash cache.",
+                        default=None)
+    parser.add_argument('--no-hash-cache',
+                        help="always hash data objects, do not use the persistent hash cache.",
+                        default=False, action='store_true')
+
+    # Persistent cache of tool versions
+    parser.add_argument('--tool-cache',
+                        help="path to the persistent cache of tool versions.",
+                        default=TOOL_CACHE_FILE)
+    parser.add_argument('--no-tool-cache',
+                        help="always probe the version of the wrapped tool, do not use the tool cache.",
+                        default=False, action='store_true')
+    parser.add_argument('--tool-timeout', type=float,
+                        help="seconds a tool may take to print its version (default: 10).",
+                        default=None)
+
+    # Parallel hashing of directory content
+    parser.add_argument('--hash-workers', type=int,
+                        help="number of parallel workers hashing directory content (default: number of CPUs).",
+                        default=None)
+    parser.add_argument('--hash-pool', choices=pool_types,
+                        help="use threads or processes to hash directory content.",
+                        default="thread")
+
+    # I/O used to read data objects for hashing
+    parser.add_argument('--hash-mmap',
+                        help="use mmap to hash large files on local file systems.",
+                        default=False, action='store_true')
+    parser.add_argument('--hash-keep-page-cache',
+                        help="do not drop hashed pages of huge files from the page cache.",
+                        default=False, action='store_true')
+
+    # Digests recorded for files in addition to sha1
+    parser.add_argument('--digest', action='append',
+                        help="additional digest recorded for files, can be given multiple times (" + ", ".join(get_digest_algorithms()) + ").",
+                        default=[])
+
+    # Sampled fingerprints instead of full digests for very large files.
+    # The thresholds can also be set in the [fingerprint] section of the executor config file.
+    parser.add_argument('--fingerprint-min-size', type=int,
+                        help="describe files of at least this size (bytes) by a sampled fingerprint instead of a full digest.",
+                        default=None)
+    parser.add_argument('--fingerprint-chunks', type=int,
+                        help="number of chunks hashed for a sampled fingerprint (default: 16).",
+                        default=None)
+    parser.add_argument('--fingerprint-chunk-size', type=int,
+                        help="size of the chunks (bytes) hashed for a sampled fingerprint (default: 1 MiB).",
+                        default=None)
+
     # Path to output data object
     # This is the URI of the output data object of the wrapped command
     # If the user uses a workflow manager / workflow engine supported by this tool,
@@ -51,6 +180,44 @@ def main():
                         help='path to input data objects (file, directory) used by the wrapped command',
                         default=None)    
 
+    # Write the stdout of the wrapped command to a file and hash it on the fly.
+    # The file is recorded as output data object.
+    parser.add_argument('--stdout-to',
+                        help="write stdout of the wrapped command to this file and hash it while writing",
+                        default=None)
+
+    # Discover input/output data objects by tracing the file accesses of the wrapped command
+    parser.add_argument('--trace',
+                        help="record files read/written by the wrapped command as input/output data objects (Linux only)",
+                        default=False, action='store_true')
+    parser.add_argument('--trace-method', choices=trace_methods,
+                        help="trace with inotify or by polling /proc/<pid>/fd (default: inotify if available).",
+                        default="auto")
+    parser.add_argument('--trace-dir', action='append',
+                        help="only trace files below this directory, can be given multiple times (default: working directory).",
+                        default=[])
+
+    # Store operations in an object store instead of embedding them
+    parser.add_argument('--object-store',
+                        help="object store (e.g. .dataprov/objects) the operations of written .prov files are stored in. "
+                             "Per default .prov files are self-contained, stores are discovered for reading.",
+                        default=None)
+
+    # Link the .prov files of the inputs instead of copying their history
+    parser.add_argument('--link-history',
+                        help="link the .prov files of input data objects (path and sha1) instead of copying their history.",
+                        default=False, action='store_true')
+
+    # Compression of the written .prov files
+    parser.add_argument('--compress', choices=sorted(compressions),
+                        help="write compressed .prov files (.prov.gz, .prov.xz). Compressed files are detected when they are read.",
+                        default=None)
+
+    # Binary sidecars for faster reading of the written .prov files
+    parser.add_argument('--binary-sidecar',
+                        help="also write a binary sidecar (.prov.bin) that is read instead of the .prov file while it is up-to-date.",
+                        default=False, action='store_true')
+
     # Message incorporated into metadata
     parser.add_argument('-m', '--message',
                         help="message for operation metadata",
@@ -71,6 +238,38 @@ def main():
                                      help="Validate a xml-file")
     validate.add_argument('xml',
                           help="xml-file to validate")
+    validate.add_argument('--verify',
+                          help="check if the target data object still matches the recorded digest",
+                          default=False, action='store_true')
+
+    # This subcommand shows or purges the persistent hash cache
+    cache = subparsers.add_parser("cache",
+                                  help="Inspect or purge the persistent hash cache")
+    cache.add_argument('--purge',
+                       help="remove all cached digests",
+                       default=False, action='store_true')
+    cache.add_argument('--purge-tools',
+                       help="remove all cached tool versions",
+                       default=False, action='store_true')
+    cache.add_argument('--evict',
+                       help="remove least recently used digests exceeding the size limit",
+                       default=False, action='store_true')
+
+    # These subcommands convert between self-contained and referenced .prov files
+    pack = subparsers.add_parser("pack",
+                                 help="Embed the operations referenced by a .prov file (self-contained form)")
+    pack.add_argument('xml',
+                      help="xml-file to pack")
+    pack.add_argument('-o', '--output',
+                      help="packed xml-file (default: overwrite the input)",
+                      default=None)
+    unpack = subparsers.add_parser("unpack",
+                                   help="Move the operations of a .prov file into the object store (referenced form)")
+    unpack.add_argument('xml',
+                        help="xml-file to unpack")
+    unpack.add_argument('-o', '--output',
+                        help="unpacked xml-file (default: overwrite the input)",
+                        default=None)
 
     # This subcommand create DAG graph from an xml-file                  
     dag = subparsers.add_parser("dag",
@@ -83,8 +282,60 @@ def main():
     # Parse command line arguments
     args, remaining = parser.parse_known_args()
     debug = args.debug
+
+    configure_object_store(args.object_store)
+    configure_sidecars(write=args.binary_sidecar)
+    configure_hash_cache(path=args.hash_cache,
+                         max_entries=args.hash_cache_size,
+                         enabled=not args.no_hash_cache)
+    # The tool cache (and subprocess) is only needed to probe tools
+    if args.command in ("run", "cache"):
+        from dataprov.utils.tool_cache import configure_tool_cache, get_tool_cache
+        configure_tool_cache(path=args.tool_cache,
+                             enabled=not args.no_tool_cache,
+                             timeout=args.tool_timeout)
+    configure_hashing(strategy="mmap" if args.hash_mmap else "readinto",
+                      drop_page_cache=not args.hash_keep_page_cache)
+    try:
+        configure_digests(args.digest)
+        fingerprint_settings = read_fingerprint_config(args.executor)
+        if args.fingerprint_min_size is not None:
+            fingerprint_settings['min_size'] = args.fingerprint_min_size
+        if args.fingerprint_chunks is not None:
+            fingerprint_settings['chunks'] = args.fingerprint_chunks
+        if args.fingerprint_chunk_size is not None:
+            fingerprint_settings['chunk_size'] = args.fingerprint_chunk_size
+        configure_fingerprint(**fingerprint_settings)
+    except ValueError as e:
+        print(e)
+        exit(1)
+    configure_hash_pool(workers=args.hash_workers,
+                        pool=args.hash_pool,
+                        debug=debug)
     
-    if args.command == "validate":
+    if args.command == "cache":
+        if args.purge_tools:
+            tool_cache = get_tool_cache()
+            if tool_cache is not None:
+                print("Removed cached tool versions: ", tool_cache.purge())
+        hash_cache = get_hash_cache()
+        if hash_cache is None:
+            print("Hash cache is disabled.")
+            exit(0)
+        if args.purge:
+            removed = hash_cache.purge()
+            print("Removed cached digests: ", removed)
+        elif args.evict:
+            removed = hash_cache.evict()
+            print("Evicted cached digests: ", removed)
+        info = hash_cache.info()
+        print("Hash cache: ", info['path'])
+        print("Entries: ", info['entries'], "/", info['maxEntries'])
+        for algorithm, entries in sorted(info['algorithms'].items()):
+            print("  ", algorithm, ": ", entries)
+        print("Size on disk (bytes): ", info['size'])
+        exit(0)
+    elif args.command == "validate":
         abs_path = os.path.abspath(args.xml)
         # Read provenance data   
         if not os.path.exists(abs_path):
@@ -92,11 +343,33 @@ def main():
             exit(1)
         else:
             try:
-                Dataprov(file=abs_path)
+                # Stream the document, it is validated while it is read
+                dataprov = Dataprov(file=abs_path, stream=True)
+                sampled_files = dataprov.get_sampled_files()
                 print("XML is valid!")
+                # Sampled fingerprints only cover parts of the file content
+                for sampled_file in sampled_files:
+                    print("Described by a sampled fingerprint, not a full digest: ", sampled_file.get_uri())
+                if args.verify:
+                    target = dataprov.target.data['dataObject']
+                    if not isinstance(target, File):
+                        print("Verification is only supported for file targets.")
+                        exit(1)
+                    verified = target.verify()
+                    if verified is None:
+                        print("Target does not exist: ", target.get_uri())
+                        exit(1)
+                    elif not verified:
+                        print("Target does not match the recorded digest: ", target.get_uri())
+                        exit(1)
+                    elif target.is_sampled():
+                        print("Target matches the sampled fingerprint (content not fully verified): ", target.get_uri())
+                    else:
+                        print("Target matches the recorded sha1: ", target.get_uri())
                 exit(0)
-            except IOError:
-                print("XML is not valid!")             
+            except IOError as e:
+                print(e)
+                print("XML is not valid!")
                 exit(1)
     elif args.command == "dag":
         abs_path = os.path.abspath(args.xml)
@@ -107,7 +380,7 @@ def main():
             exit(1)
         else:
             try:
-                dataprov = Dataprov(file=abs_path)
+                dataprov = Dataprov(file=abs_path, stream=True)
                 dag = dataprov.to_dag()
                 #TODO Implement and save to output file
                 dag.render(filename=args.dag)
@@ -117,7 +390,34 @@ def main():
                 print(inst)          # __str__ allows args to be printed directly,
                 exit(1)
         exit(0)
+    elif args.command in ("pack", "unpack"):
+        from dataprov.utils.object_store import find_object_store, open_object_store, OBJECT_STORE_DIR
+        abs_path = os.path.abspath(args.xml)
+        if not os.path.exists(abs_path):
+            print("Specified XML file does not exist: ", abs_path)
+            exit(1)
+        try:
+            dataprov = Dataprov(file=abs_path, lazy=True)
+            # Report missing or corrupted objects before the file is replaced
+            dataprov.check_references()
+            if args.command == "pack":
+                object_store = None
+            else:
+                object_store = find_object_store(abs_path)
+                if object_store is None:
+                    object_store = open_object_store(os.path.join(os.getcwd(), OBJECT_STORE_DIR))
+                print("Object store: ", object_store.path)
+            # Keep the compression of the input file
+            dataprov.write_xml(args.output or abs_path, detect_compression(abs_path), object_store)
+        except IOError as e:
+            print(e)
+            exit(1)
+        exit(0)
     elif args.command == "run":
+        from dataprov.utils.probes import ProbeRunner
+        from dataprov.utils.tracing import create_tracer
+        # Compile the XML schemas while the wrapped command runs
+        prewarm_schemas(background=True)
         executor_config_file = args.executor
         message = args.message
         if args.output is not None:
@@ -140,56 +440,74 @@ def main():
     
         # Create a new provenance object
         new_operation = Operation()
-    
+
+        # Collect the metadata that does not depend on each other concurrently:
+        # host, operation class (tool versions, container inspection, ...) and
+        # the input data objects given on the command line (provenance and digests).
+        # Traced input data objects are only known after the run.
+        probes = ProbeRunner()
+        probes.submit("host", Host)
+        probes.submit("opClass", OpClass, remaining)
+        if not args.trace:
+            probes.submit("inputs", read_input_data_objects, command_input_data_objects, debug,
+                          args.link_history)
+
         # Record executor
-        executor = Executor(executor_config_file)
+        executor = probes.run("executor", Executor, executor_config_file)
         new_operation.record_executor(executor)
         # Record Host
-        new_operation.record_host()
+        new_operation.record_host(probes.result("host"))
         
         # Create the object describing this operation
-        op_class = OpClass(remaining)
+        try:
+            op_class = probes.result("opClass")
+        except ImportError as e:
+            print(e)
+            exit(1)
         # Record more details about operation (commandLine, snakemake, ...)
         new_operation.record_op_class(op_class)
+
+        # Capture stdout of the wrapped command
+        if args.stdout_to is not None:
+            stdout_file = os.path.abspath(args.stdout_to)
+            op_class.set_stdout_file(stdout_file)
+            command_output_data_objects.append(stdout_file)
         
         # Perform some pre-processing if needed
         op_class.pre_processing()    
     
+        # Trace the file accesses of the wrapped command
+        tracer = None
+        if args.trace:
+            try:
+                tracer = create_tracer(args.trace_method, args.trace_dir or None)
+            except OSError as e:
+                print(e)
+                exit(1)
+            op_class.set_tracer(tracer)
+
         # Combine input data objects specified on command line and data objects specified by
-        # the wrapped command (e.g. from CWL file's input binding)
-        input_data_objects_tmp = command_input_data_objects + op_class.get_input_data_objects()
-        input_data_objects = []
-        for input_data_object in input_data_objects_tmp:
-            # Check if input data objects and the corresponding provenance metadata exists
-            if not os.path.exists(input_data_object):
-                print("Input file specified by -i does not exist: ", input_data_object)
-                print("No provenance information will be considered for this file.")
-                continue
-            abs_path = os.path.abspath(input_data_object)
-            if abs_path not in input_data_objects:
-                input_data_objects.append(abs_path)
-                
-        if debug:
-            print("Input files: ", input_data_objects)
-            
-         # Read provenance data   
-        input_provenance_data = defaultdict()
-        for input_data_object in input_data_objects:
-            input_prov_file = input_data_object + '.prov'
-            if not os.path.exists(input_prov_file):
-                print("Metadata for input file specified by -i does not exist: ", input_data_object)
-                input_provenance_data[input_data_object] = None
-                continue
-            print("Metadata for input file specified by -i does exist: ", input_data_object)
-            #Parse XML and store in dictionary
-            new_provenance_object = Dataprov(input_prov_file)
-            input_provenance_data[input_data_object] = new_provenance_object
-        
+        # the wrapped command (e.g. from CWL file's input binding).
+        # Traced input data objects are only known after the run.
+        # The command is not run if the provenance of an input cannot be read
+        if tracer is None:
+            try:
+                input_provenance_data, input_objects = probes.result("inputs")
+                op_class_inputs = [input_data_object for input_data_object in op_class.get_input_data_objects()
+                                   if os.path.abspath(input_data_object) not in input_provenance_data]
+                if op_class_inputs:
+                    op_class_provenance_data, op_class_objects = probes.run(
+                        "opClassInputs", read_input_data_objects, op_class_inputs, debug, args.link_history)
+                    input_provenance_data.update(op_class_provenance_data)
+                    input_objects.update(op_class_objects)
+            except IOError as e:
+                print("Cannot read input provenance: ", e)
+                exit(1)
+            # Record input files
+            new_operation.record_input_data_objects(input_provenance_data, input_objects)
+        probes.shutdown()
         if debug:
-            print("Input Provenance Data: ", input_provenance_data)
-          
-        # Record input files
-        new_operation.record_input_data_objects(input_provenance_data)
+            probes.report()
         
         # Record message
         new_operation.record_message(message)
@@ -202,6 +520,16 @@ def main():
         
         # Record end time
         new_operation.record_end_time()
+
+        if tracer is not None:
+            input_data_objects = command_input_data_objects + op_class.get_input_data_objects()
+            try:
+                input_provenance_data = read_input_provenance(input_data_objects, debug, args.link_history)
+            except IOError as e:
+                print("Cannot read input provenance: ", e)
+                exit(1)
+            # Record input files
+            new_operation.record_input_data_objects(input_provenance_data)
     
         # Perform post processing
         # e.g. for workflows to annotate intermediate files that were generated during workflow execution
@@ -227,19 +555,33 @@ def main():
         result_dataprov_objects = []
         for output_data_object in output_data_objects:
             new_dataprov = Dataprov()
-            new_dataprov.create_provenance(output_data_object, input_provenance_data, new_operation)
+            new_dataprov.create_provenance(output_data_object, input_provenance_data, new_operation,
+                                           args.link_history)
             result_dataprov_objects.append(new_dataprov)
-        # Check if the create xml is valid, then write to file
-        for dataprov_object in result_dataprov_objects:            
-            dataprov_xml = dataprov_object.to_xml()
-            write_xml(dataprov_xml, "test.prov")
-            if not dataprov_object.validate_xml(dataprov_xml):
+        # Check if the new elements are valid, then write to file
+        # The inherited history was validated when it was read
+        # The files are written incrementally, the documents are not built in memory
+        operation_valid = new_operation.validate_xml(new_operation.to_xml())
+        for dataprov_object in result_dataprov_objects:
+            if not operation_valid or not dataprov_object.validate_target():
                 # TODO do this with an Error type
                 print("Resulting dataprov object is not valid!")
             else:
-                output_xml_file = dataprov_object.get_xml_file_path()
+                output_xml_file = dataprov_object.get_xml_file_path(args.compress)
                 print("Write resulting xml file to: ", output_xml_file)
-                write_xml(dataprov_xml, output_xml_file)
+                dataprov_object.write_xml(output_xml_file, args.compress, get_configured_object_store())
+                if sidecars_enabled():
+                    try:
+                        dataprov_object.write_sidecar(output_xml_file)
+                    except ValueError as e:
+                        print("Cannot write binary sidecar: ", e)
+
+        if debug:
+            stats = get_session_stats()
+            print("Digest requests: ", stats['requests'])
+            print("Files hashed: ", stats['hashed'])
+            print("Hashes avoided: ", stats['hashesAvoided'],
+                  "(in this run: ", stats['sessionHits'], ")")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
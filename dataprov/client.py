@@ -0,0 +1,165 @@
+'''
+Thin command line client of dataprovd (see dataprov/daemon.py).
+
+The client passes its arguments, working directory, environment, umask and
+standard streams to a running daemon, which runs the command in a forked
+process with compiled schemas and cached host and executor information.
+Without a running daemon the command runs in this process.
+This module is imported on every call, it only uses the standard library.
+'''
+import os
+import sys
+import stat
+import json
+import signal
+import socket
+import struct
+
+
+# Set to 1 to never use a running daemon
+NO_DAEMON_ENV = 'DATAPROV_NO_DAEMON'
+
+# Path of the socket of the daemon
+SOCKET_ENV = 'DATAPROV_SOCKET'
+
+# Length of a request and exit code of a command (network byte order)
+LENGTH = struct.Struct('!I')
+EXIT_CODE = struct.Struct('!i')
+
+# Credentials of the peer of a Unix socket: pid, uid, gid
+PEER_CREDENTIALS = struct.Struct('3i')
+
+# Signals forwarded to the command running in the daemon
+forwarded_signals = (signal.SIGINT, signal.SIGTERM, signal.SIGHUP)
+
+
+def get_private_dir():
+    '''
+    Return the directory of the socket if neither $DATAPROV_SOCKET nor
+    $XDG_RUNTIME_DIR is set: /tmp/dataprovd-<uid>, created by the daemon and
+    only accessible by the user (see check_private_dir).
+    '''
+    return os.path.join('/tmp', 'dataprovd-' + str(os.getuid()))
+
+
+def get_socket_path():
+    '''
+    Return the path of the socket of the daemon: $DATAPROV_SOCKET,
+    $XDG_RUNTIME_DIR/dataprovd.sock or /tmp/dataprovd-<uid>/dataprovd.sock.
+    '''
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'dataprovd.sock')
+    return os.path.join(get_private_dir(), 'dataprovd.sock')
+
+
+def check_private_dir(path):
+    '''
+    Raise OSError unless path is a directory (not a symbolic link) owned by
+    the user and not accessible by others. Anybody can create directories
+    in /tmp, e.g. to put their own socket in place of the daemon's.
+    '''
+    path_stat = os.lstat(path)
+    if (not stat.S_ISDIR(path_stat.st_mode) or path_stat.st_uid != os.getuid()
+            or path_stat.st_mode & 0o077):
+        raise OSError("Socket directory is not private: " + path)
+
+
+def get_peer_uid(connection):
+    '''
+    Return the uid of the process connected to a Unix socket.
+    '''
+    credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, PEER_CREDENTIALS.size)
+    return PEER_CREDENTIALS.unpack(credentials)[1]
+
+
+def connect(socket_path=None):
+    '''
+    Return a socket connected to the daemon, or None if no daemon is running.
+    The arguments and the environment are only sent to a daemon run by the
+    user, sockets of other users are not used.
+    '''
+    if os.environ.get(NO_DAEMON_ENV, '') not in ('', '0'):
+        return None
+    socket_path = socket_path or get_socket_path()
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+        peer_uid = get_peer_uid(connection)
+    except OSError:
+        connection.close()
+        return None
+    if peer_uid != os.getuid():
+        connection.close()
+        print("Ignoring dataprovd socket of another user: ", socket_path, file=sys.stderr)
+        return None
+    return connection
+
+
+def recv_exactly(connection, size):
+    '''
+    Read size bytes from a socket. Return None if the socket was closed before.
+    '''
+    data = b''
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def run_in_daemon(connection, argv):
+    '''
+    Run the command given by argv in the daemon and return its exit code.
+    '''
+    umask = os.umask(0)
+    os.umask(umask)
+    request = json.dumps({'argv': argv,
+                          'cwd': os.getcwd(),
+                          'env': dict(os.environ),
+                          'umask': umask}).encode('utf-8')
+    # Flush buffered output before the daemon writes to the same streams
+    sys.stdout.flush()
+    sys.stderr.flush()
+    socket.send_fds(connection, [LENGTH.pack(len(request))], [0, 1, 2])
+    connection.sendall(request)
+
+    # Signals of the job scheduler or the terminal are forwarded to the command
+    received_signals = []
+    def forward_signal(signum, frame):
+        received_signals.append(signum)
+        try:
+            connection.sendall(EXIT_CODE.pack(signum))
+        except OSError:
+            pass
+    for signum in forwarded_signals:
+        signal.signal(signum, forward_signal)
+
+    response = recv_exactly(connection, EXIT_CODE.size)
+    if response is None:
+        # The command was killed by a forwarded signal, exit like a shell would
+        if received_signals:
+            return 128 + received_signals[-1]
+        print("dataprovd closed the connection without an exit code", file=sys.stderr)
+        return 1
+    return EXIT_CODE.unpack(response)[0]
+
+
+def main():
+    connection = connect()
+    if connection is None:
+        # No daemon, run in this process
+        from dataprov.__main__ import main as run_in_process
+        run_in_process()
+        return
+    with connection:
+        exit_code = run_in_daemon(connection, sys.argv[1:])
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
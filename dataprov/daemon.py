@@ -0,0 +1,250 @@
+'''
+dataprovd: persistent dataprov process listening on a Unix socket.
+
+Every dataprov call pays interpreter start-up, imports, schema compilation,
+host probing and executor config parsing. The daemon does this once. Each
+request of the client (see dataprov/client.py) is run in a forked process,
+which inherits the warm state, runs dataprov.__main__.main with the
+arguments, working directory, environment and standard streams of the
+client and sends the exit code back. Forking keeps the per-call settings
+(configure_* functions, working directory, environment) of different calls
+apart, and a crashing call cannot take down the daemon.
+
+Usage:
+    dataprovd [--socket PATH] [--executor FILE]
+'''
+import os
+import sys
+import json
+import signal
+import socket
+import argparse
+import threading
+from dataprov.__main__ import main as dataprov_main
+from dataprov.client import get_socket_path, get_private_dir, check_private_dir, get_peer_uid
+from dataprov.client import recv_exactly, LENGTH, EXIT_CODE
+from dataprov.elements.executor import read_executor_config
+from dataprov.elements.host import get_local_host_info
+from dataprov.elements.op_class import op_class_registry, get_op_class
+from dataprov.utils.schemas import prewarm_schemas
+
+
+# Maximal size of a request (arguments and environment)
+MAX_REQUEST_SIZE = 16 * 1024 * 1024
+
+
+def warm_up(executor_config_file):
+    '''
+    Load the state shared by all calls: compiled schemas, host information,
+    the executor config and the available operation classes. No threads are
+    started and no files (e.g. the SQLite caches) are opened, the process
+    is forked for every call.
+    '''
+    prewarm_schemas()
+    get_local_host_info()
+    if os.path.exists(executor_config_file):
+        read_executor_config(executor_config_file)
+    for tag in op_class_registry:
+        try:
+            get_op_class(tag)
+        except ImportError:
+            continue
+
+
+def receive_request(connection):
+    '''
+    Receive a request: the standard streams of the client and
+    a dictionary with argv, cwd, env and umask.
+    Raises ValueError for invalid requests.
+    '''
+    header, fds, flags, address = socket.recv_fds(connection, LENGTH.size, 3)
+    if len(fds) != 3 or len(header) != LENGTH.size:
+        for fd in fds:
+            os.close(fd)
+        raise ValueError("Invalid request")
+    size = LENGTH.unpack(header)[0]
+    payload = recv_exactly(connection, size) if size <= MAX_REQUEST_SIZE else None
+    if payload is None:
+        for fd in fds:
+            os.close(fd)
+        raise ValueError("Invalid request")
+    return fds, json.loads(payload.decode('utf-8'))
+
+
+def forward_signals(connection, finished):
+    '''
+    Send signals forwarded by the client to the process group of the call,
+    which includes the wrapped command. If the client goes away (e.g. the
+    job was killed), the process group is terminated.
+    '''
+    while True:
+        try:
+            data = recv_exactly(connection, EXIT_CODE.size)
+        except OSError:
+            data = None
+        if finished.is_set():
+            return
+        signum = EXIT_CODE.unpack(data)[0] if data is not None else signal.SIGTERM
+        os.killpg(os.getpgrp(), signum)
+        if data is None:
+            return
+
+
+def run_request(connection, fds, request):
+    '''
+    Run a request in the forked process and return the exit code.
+    '''
+    # The call gets its own process group, forwarded signals reach the wrapped command
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdout.reconfigure(line_buffering=os.isatty(1))
+    os.chdir(request['cwd'])
+    os.environ.clear()
+    os.environ.update(request['env'])
+    os.umask(request['umask'])
+    sys.argv = ['dataprov'] + request['argv']
+
+    finished = threading.Event()
+    threading.Thread(target=forward_signals, args=(connection, finished), daemon=True).start()
+    try:
+        dataprov_main()
+        exit_code = 0
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except KeyboardInterrupt:
+        exit_code = 128 + signal.SIGINT
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        exit_code = 1
+    finished.set()
+    return exit_code
+
+
+def handle_connection(server, connection):
+    '''
+    Fork a process running the request of a connection.
+    Only connections of the user running the daemon are accepted.
+    '''
+    if get_peer_uid(connection) != os.getuid():
+        connection.close()
+        return
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid:
+        connection.close()
+        return
+    exit_code = 1
+    try:
+        server.close()
+        fds, request = receive_request(connection)
+        exit_code = run_request(connection, fds, request)
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            connection.sendall(EXIT_CODE.pack(exit_code))
+        finally:
+            os._exit(exit_code)
+
+
+def reap_children(signum, frame):
+    '''
+    Collect the exit status of finished calls.
+    '''
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0] > 0:
+            pass
+    except ChildProcessError:
+        pass
+
+
+def open_socket(socket_path):
+    '''
+    Return a listening socket at socket_path, only accessible by the user.
+    The default directory in /tmp is created first, it must be private.
+    A socket left behind by a daemon that is not running anymore is removed.
+    Raises OSError if another daemon is listening at socket_path or the
+    directory in /tmp is not private.
+    '''
+    socket_dir = os.path.dirname(socket_path)
+    if socket_dir == get_private_dir():
+        try:
+            os.mkdir(socket_dir, 0o700)
+        except FileExistsError:
+            pass
+        check_private_dir(socket_dir)
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            os.remove(socket_path)
+        else:
+            raise OSError("dataprovd is already running at " + socket_path)
+        finally:
+            probe.close()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(umask)
+    server.listen(128)
+    return server
+
+
+def terminate(signum, frame):
+    raise SystemExit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Persistent dataprov daemon.')
+    parser.add_argument('--socket',
+                        help="path of the Unix socket (default: $DATAPROV_SOCKET, $XDG_RUNTIME_DIR/dataprovd.sock "
+                             "or /tmp/dataprovd-<uid>/dataprovd.sock).",
+                        default=None)
+    home_dir = os.path.expanduser("~")
+    parser.add_argument('-e', '--executor',
+                        help="executor config file loaded in advance.",
+                        default=os.path.join(home_dir, ".dataprov/executor.conf"))
+    args = parser.parse_args()
+    socket_path = os.path.abspath(args.socket or get_socket_path())
+
+    warm_up(args.executor)
+    try:
+        server = open_socket(socket_path)
+    except OSError as e:
+        print(e)
+        exit(1)
+    signal.signal(signal.SIGCHLD, reap_children)
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGHUP, terminate)
+    print("dataprovd listening on ", socket_path)
+    sys.stdout.flush()
+    try:
+        while True:
+            connection, address = server.accept()
+            handle_connection(server, connection)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,4 +4,13 @@ import os
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Directory with xml-schema files
-XML_DIR = os.path.join(ROOT_DIR, 'xml')
\ No newline at end of file
+XML_DIR = os.path.join(ROOT_DIR, 'xml')
+
+# Directory with per-user dataprov files (executor config, caches, ...)
+DATAPROV_HOME = os.path.join(os.path.expanduser("~"), '.dataprov')
+
+# Default location of the persistent hash cache
+HASH_CACHE_FILE = os.path.join(DATAPROV_HOME, 'hashcache.sqlite')
+
+# Default location of the persistent cache of tool versions
+TOOL_CACHE_FILE = os.path.join(DATAPROV_HOME, 'toolcache.sqlite')
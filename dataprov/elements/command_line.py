@@ -1,6 +1,5 @@
 import os
 import shutil
-import subprocess
 from collections import defaultdict
 from dataprov.elements.generic_op import GenericOp
 from dataprov.elements.file_list import FileList
@@ -8,6 +7,7 @@ from dataprov.elements.data_object import DataObject
 from dataprov.elements.data_object_list import DataObjectList
 from lxml import etree
 from dataprov.definitions import XML_DIR
+from dataprov.utils.tool_cache import get_tool_version
 
 class CommandLine(GenericOp):
     '''
@@ -27,26 +27,8 @@ class CommandLine(GenericOp):
         if remaining is not None:
             # Command
             self.data['command'] = ' '.join(remaining)
-            # Tool Path
-            tool = remaining[0].split()[0]
-            toolPath = shutil.which(tool)
-            self.data['toolPath'] = toolPath
-            # Tool Version
-            FNULL = open(os.devnull, 'w')
-            try:
-                toolVersion1 = subprocess.check_output([tool,  '--version'], stderr=FNULL)
-            except:
-                toolVersion1 = None
-            try:
-                toolVersion2 = subprocess.check_output([tool,  '-v'], stderr=FNULL)
-            except:
-                toolVersion2 = None
-            if toolVersion1 is not None:
-                self.data['toolVersion'] = toolVersion1
-            elif toolVersion2 is not None:
-                self.data['toolVersion'] = toolVersion2
-            else:
-                self.data['toolVersion'] = 'unknown'
+            # Tool Path and Tool Version
+            self.record_tool(remaining[0].split()[0])
     
     def to_xml(self, root_tag=None):
         '''
@@ -81,13 +63,13 @@ class CommandLine(GenericOp):
         output_data_objects_ele = root.find('outputDataObjects')
         if input_data_objects_ele is not None:
             input_data_objects = DataObjectList()
-            input_data_objects.from_xml(input_data_objects_ele, validate)
+            input_data_objects.from_xml(input_data_objects_ele, validate=False)
             self.data['inputDataObjects'] = input_data_objects
         else:
             self.data['inputDataObjects'] = None
         if output_data_objects_ele is not None:
             output_data_objects = DataObjectList()
-            output_data_objects.from_xml(output_data_objects_ele, validate)
+            output_data_objects.from_xml(output_data_objects_ele, validate=False)
             self.data['outputDataObjects'] = output_data_objects
         else:
             self.data['outputDataObjects'] = None
@@ -97,22 +79,13 @@ class CommandLine(GenericOp):
         Set a command as well as toolPath and toolVersion
         '''
         self.data['command'] = command
-        tool = command.split()[0]
+        self.record_tool(command.split()[0])
+
+    def record_tool(self, tool):
+        '''
+        Record toolPath and toolVersion of a tool.
+        The version is only probed if it is not in the tool cache.
+        '''
         toolPath = shutil.which(tool)
         self.data['toolPath'] = toolPath
-        # Tool Version
-        FNULL = open(os.devnull, 'w')
-        try:
-            toolVersion1 = subprocess.check_output([tool,  '--version'], stderr=FNULL)
-        except:
-            toolVersion1 = None
-        try:
-            toolVersion2 = subprocess.check_output([tool,  '-v'], stderr=FNULL)
-        except:
-            toolVersion2 = None
-        if toolVersion1 is not None:
-            self.data['toolVersion'] = toolVersion1
-        elif toolVersion2 is not None:
-            self.data['toolVersion'] = toolVersion2
-        else:
-            self.data['toolVersion'] = 'unknown'
\ No newline at end of file
+        self.data['toolVersion'] = get_tool_version(toolPath)
\ No newline at end of file
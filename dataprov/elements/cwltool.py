@@ -23,6 +23,11 @@ class CWLTool(GenericOp):
     
     element_name = "cwltool"
     schema_file = os.path.join(XML_DIR, 'cwl/cwltool_element.xsd')
+
+    # The stdout of cwltool is needed to resolve output wildcards
+    supports_stdout_capture = False
+    # Input/output data objects are taken from the workflow description
+    supports_tracing = False
     
     def __init__(self, remaining=None):
         super().__init__()
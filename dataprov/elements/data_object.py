@@ -48,6 +48,17 @@ class DataObject(GenericElement):
                 exit(1)
             self.data['dataObject'] = data_object
     
+    @classmethod
+    def from_data(cls, data):
+        '''
+        Create a data object from its data, the type is given by the
+        described element (file or directory).
+        '''
+        data_object = cls()
+        data_object.data = data
+        data_object.type = data['dataObject'].element_name
+        return data_object
+
     def from_xml(self, root, validate=True):
         '''
         Populate data attribute from the root of a xml ElementTree object.
@@ -60,11 +71,11 @@ class DataObject(GenericElement):
         self.type = root.get('type')
         if self.type == "file":
             data_object = File()
-            data_object.from_xml(root[0], validate)
+            data_object.from_xml(root[0], validate=False)
             self.data['dataObject'] = data_object
         elif self.type == "directory":
             data_object = Directory()
-            data_object.from_xml(root[0], validate)
+            data_object.from_xml(root[0], validate=False)
             self.data['dataObject'] = data_object
         else:
             print("Unknown data object type: ", self.type)
@@ -74,6 +85,9 @@ class DataObject(GenericElement):
         '''
         Create a xml ElementTree object from the data attribute. 
         '''
+        # Re-emit an untouched subtree without parsing it
+        if self.is_deferred():
+            return self.copy_xml(root_tag)
         # Create root element with approbiate type
         root = etree.Element(self.element_name)
         if root_tag is not None:
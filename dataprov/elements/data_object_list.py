@@ -39,13 +39,16 @@ class DataObjectList(GenericElement):
             exit(1)
         for object_ele in root.findall('dataObject'):
             new_object = DataObject()
-            new_object.from_xml(object_ele, validate)
+            new_object.from_xml(object_ele, validate=False)
             self.data['objects'].append(new_object)
    
     def to_xml(self, root_tag=None):
         '''
         Create a xml ElementTree object from the data attribute. 
         '''
+        # Re-emit an untouched subtree without parsing it
+        if self.is_deferred():
+            return self.copy_xml(root_tag)
         if not root_tag:
             root = etree.Element(self.element_name)
         else:
@@ -71,6 +74,7 @@ class DataObjectList(GenericElement):
             if not isObject:
                 print("DataObject in DataObjectList is not a valid")
                 exit(1)
+        return True
     
     def add_object(self, new_object):
         '''
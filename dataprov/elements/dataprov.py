@@ -1,12 +1,21 @@
 import os
-import graphviz as gv
+import copy
 from collections import defaultdict
 from dataprov.elements.generic_element import GenericElement
 from dataprov.elements.data_object import DataObject
+from dataprov.elements.file import File
 from dataprov.elements.data_object_list import DataObjectList
 from dataprov.elements.history import History
+from dataprov.elements.operation import Operation
 from dataprov.definitions import XML_DIR
 from lxml import etree
+from dataprov.utils.io import iter_elements, open_xml, get_compression_suffix, PROV_SUFFIX
+from dataprov.utils.io import decompression_errors, atomic_write, write_indented
+from dataprov.utils.object_store import find_object_store
+from dataprov.utils.hash_cache import cached_digest, remember_digests
+from dataprov.utils.hashing import hash_file
+from dataprov.utils.binary import read_sidecar, write_sidecar, get_sidecar_path
+from dataprov.utils.schemas import get_schema_registry
 
 
 class Dataprov(GenericElement):
@@ -22,21 +31,48 @@ class Dataprov(GenericElement):
     element_name = "dataprov"
     schema_file = os.path.join(XML_DIR, 'dataprov_element.xsd')
     
-    def __init__(self, file=None, validate=True):
+    def __init__(self, file=None, validate=True, stream=False, lazy=False):
         '''
-        Initialize an empty object or read directly from file
+        Initialize an empty object or read directly from file.
+        In stream mode the file is not loaded. The target and the operations
+        are parsed when they are needed (see target and iter_operations), the
+        document is validated while it is read (see iter_elements).
+        In lazy mode the file is loaded, but the elements are only parsed
+        when they are accessed (see from_xml).
+        Raises IOError if the file is not valid or references operations
+        without an object store.
+        If the file has an up-to-date binary sidecar (see write_sidecar),
+        the sidecar is read instead of the file.
         '''
         super().__init__()
-        if file:
-            with open(file, 'r') as xml_file:
-                parser = etree.XMLParser()
+        # File read in stream mode
+        self.file = None
+        # File the provenance data was read from (needed to resolve links)
+        self.prov_file = os.path.abspath(file) if file else None
+        self.validate = validate
+        if file and stream:
+            self.file = file
+        elif file and self.read_sidecar(file):
+            pass
+        elif file:
+            # Compressed files are decompressed while they are parsed
+            with open_xml(file) as xml_file:
+                # Without whitespace, copied subtrees are pretty printed again
+                parser = etree.XMLParser(remove_blank_text=True)
                 tree = etree.parse(xml_file, parser)
-                try:
-                    self.from_xml(tree.getroot(), validate=validate)
-                except IOError as e:
-                    print(e)
+            history_ele = tree.getroot().find('history')
+            recorded_path = history_ele.get('objectStore') if history_ele is not None else None
+            self.from_xml(tree.getroot(), validate=validate, lazy=lazy,
+                          object_store=find_object_store(file, recorded_path))
         
-    def from_xml(self, root, validate=True): 
+    def from_xml(self, root, validate=True, lazy=False, object_store=None): 
+        '''
+        Populate data attribute from the root of a xml ElementTree object.
+        If lazy, the target and the operations keep their xml subtree and are
+        only parsed when they are accessed. Untouched subtrees are copied
+        verbatim when the provenance is written, e.g. inherited histories.
+        Referenced operations are resolved in the object store.
+        '''
         self.data = defaultdict()
         # Validate XML against schema
         if validate and not self.validate_xml(root):
@@ -45,18 +81,218 @@ class Dataprov(GenericElement):
         # Get the target from the xml
         target_ele = root.find('target')
         target = DataObject()
-        target.from_xml(target_ele, validate=False)
+        if lazy:
+            target.defer_xml(target_ele)
+        else:
+            target.from_xml(target_ele, validate=False)
         self.data['target'] = target
         
         # Get the history from xml
         history_ele = root.find('history')
         history = History()
-        history.from_xml(history_ele, validate=False)
+        history.from_xml(history_ele, validate=False, lazy=lazy, object_store=object_store)
         self.data['history'] = history
 
-    def to_xml(self):
+    def check_references(self):
+        '''
+        Load the operations the history references in an object store and
+        follow the linked .prov files, so missing, changed or corrupted
+        references are found before they are needed (e.g. before a wrapped
+        command is run). Loaded operations are kept.
+        Files read in stream mode are not checked, their history is only
+        linked (see create_provenance).
+        Raises IOError.
+        '''
+        if self.file is not None:
+            return
+        for operation in self.iter_operations():
+            if operation.is_deferred():
+                operation.get_deferred_root()
+
+    def read_sidecar(self, file):
+        '''
+        Populate the data attribute from the binary sidecar of a file.
+        The sidecar is only used if it was written for the current content of
+        the file. The file was validated before the sidecar was written.
+        Return False if there is no usable sidecar.
+        '''
+        if not os.path.exists(get_sidecar_path(file)):
+            return False
+        dataprov = read_sidecar(file, cached_digest(file, 'sha1', hash_file))
+        if not isinstance(dataprov, Dataprov):
+            return False
+        self.data = dataprov.data
+        return True
+
+    def write_sidecar(self, file):
+        '''
+        Write a binary sidecar (<file>.bin) for the file this object was
+        written to. Reading the sidecar is faster than parsing the xml file.
+        '''
+        xml_digest = hash_file(file)
+        remember_digests(file, {'sha1': xml_digest})
+        write_sidecar(self, file, xml_digest)
+
+    @property
+    def target(self):
+        '''
+        The data object whose provenance is described.
+        '''
+        if 'target' not in self.data and self.file is not None:
+            self.data['target'] = self.read_target()
+        return self.data['target']
+
+    def read_target(self):
+        '''
+        Parse the target of the file read in stream mode.
+        '''
+        elements = self.iter_elements('target')
+        try:
+            for target_ele in elements:
+                if target_ele.getparent().getparent() is not None:
+                    continue
+                target = DataObject()
+                target.from_xml(target_ele, validate=False)
+                return target
+        finally:
+            elements.close()
+        raise IOError("No target found in: " + self.file)
+
+    def iter_operations(self, resolve_links=True, visited_links=None):
+        '''
+        Yield the operations of the history one at a time.
+        In stream mode each operation is parsed when it is needed and its
+        subtree is discarded afterwards, so the memory usage does not depend
+        on the length of the history.
+        If resolve_links, the operations of linked .prov files are yielded
+        first (see resolve_link). Each linked file is only followed once,
+        visited_links is the set of links followed so far.
+        '''
+        if visited_links is None:
+            visited_links = set()
+        if self.file is None:
+            if resolve_links:
+                for link in self.data['history'].data['link']:
+                    yield from self.iter_linked_operations(link['path'], link['sha1'], visited_links)
+            yield from self.data['history'].data['operation']
+            return
+        object_store = None
+        for operation_ele in self.iter_elements(('operation', 'operationRef', 'historyLink')):
+            if operation_ele.getparent().tag != 'history':
+                continue
+            if operation_ele.tag == 'historyLink':
+                if resolve_links:
+                    yield from self.iter_linked_operations(operation_ele.get('path'),
+                                                           operation_ele.get('sha1'), visited_links)
+                continue
+            operation = Operation()
+            if operation_ele.tag == 'operationRef':
+                # Stored operations are checked against their id when they are loaded
+                if object_store is None:
+                    object_store = find_object_store(self.file, operation_ele.getparent().get('objectStore'))
+                if object_store is None:
+                    raise IOError("History references operations, but there is no object store: " + self.file)
+                operation.defer_reference(operation_ele.get('id'), object_store)
+                yield operation
+                continue
+            # The operation keeps its subtree (see Operation.to_xml)
+            operation_ele.getparent().remove(operation_ele)
+            operation.from_xml(operation_ele, validate=False)
+            yield operation
+
+    def iter_linked_operations(self, path, sha1, visited_links):
+        '''
+        Yield the operations of a linked .prov file, unless it was already visited.
+        '''
+        path = self.get_link_path(path)
+        if path in visited_links:
+            return
+        visited_links.add(path)
+        yield from self.resolve_link(path, sha1).iter_operations(visited_links=visited_links)
+
+    def get_link_path(self, path):
+        '''
+        Return the absolute path of a linked .prov file.
+        Relative paths are relative to the directory of this file.
+        '''
+        if self.prov_file is not None:
+            path = os.path.join(os.path.dirname(self.prov_file), path)
+        return os.path.abspath(path)
+
+    def resolve_link(self, path, sha1):
+        '''
+        Return the provenance data of a linked .prov file in stream mode.
+        Raises IOError if the file does not exist or does not match the
+        recorded sha1 sum, e.g. because it was overwritten by a later run.
+        '''
+        path = self.get_link_path(path)
+        if not os.path.exists(path):
+            raise IOError("Linked provenance file does not exist: " + path)
+        if cached_digest(path, 'sha1', hash_file) != sha1:
+            raise IOError("Linked provenance file does not match the recorded sha1: " + path)
+        return Dataprov(path, validate=self.validate, stream=True)
+
+    def get_file(self):
+        '''
+        Return the absolute path of the file the provenance data was read from
+        or None.
+        '''
+        return self.prov_file
+
+    def get_file_digest(self):
+        '''
+        Return the sha1 sum of the file the provenance data was read from.
+        '''
+        return cached_digest(self.prov_file, 'sha1', hash_file)
+
+    def iter_elements(self, tag):
+        '''
+        Yield the elements with the given tag of the file read in stream mode.
+        If validate, the whole document is validated against the schema while
+        it is streamed, in constant memory. The part of the document read so
+        far is valid when an element is yielded. Raises IOError if the
+        document is not valid.
+        '''
+        schema = None
+        if self.validate:
+            # The parser validates with its own context, the compiled schema
+            # is shared without the lock of the registry
+            schema = get_schema_registry().get_schema(self.schema_file)[0]
+        try:
+            with open_xml(self.file) as xml_file:
+                yield from iter_elements(xml_file, tag, schema)
+        except (etree.XMLSyntaxError,) + decompression_errors as e:
+            raise IOError("Cannot parse XML document " + self.file + ": " + str(e))
+
+    def validate_element(self, element, element_class):
+        '''
+        Validate an element (e.g. a new target) against the schema of its
+        element class.
+        '''
+        if element.tag != element_class.element_name:
+            # e.g. the target is a dataObject element with another name
+            element = copy.deepcopy(element)
+            element.tag = element_class.element_name
+        if not element_class().validate_xml(element):
+            raise IOError("XML document does not match XML-schema")
+
+    def validate_target(self):
+        '''
+        Validate the target against the schema of data objects.
+        '''
+        try:
+            self.validate_element(self.data['target'].to_xml("target"), DataObject)
+            return True
+        except IOError:
+            return False
+
+    def to_xml(self, object_store=None, output_file=None):
         '''
         Create a xml ElementTree object from the data attribute. 
+        If an object store is given, the history references the operations
+        in the store instead of embedding them. The path of the store is
+        recorded relative to the file the document is written to (output_file,
+        per default the file it was read from or the working directory).
         '''
         root = etree.Element(self.element_name)
         # Target
@@ -64,69 +300,131 @@ class Dataprov(GenericElement):
         #target_ele.tag = "target"
         root.append(target_ele)
         # History
-        root.append(self.data['history'].to_xml())
+        history_ele = self.data['history'].to_xml(object_store)
+        if object_store is not None:
+            store_path = self.get_object_store_path(object_store, output_file or self.prov_file)
+            history_ele.set('objectStore', store_path)
+        root.append(history_ele)
         return root
        
-    def create_provenance(self, target_file, input_prov_data, applied_operation):
+    @staticmethod
+    def get_object_store_path(object_store, output_file=None):
+        '''
+        Return the path of an object store relative to the directory of the
+        .prov file it is recorded in (see find_object_store).
+        '''
+        output_dir = os.path.dirname(os.path.abspath(output_file)) if output_file else os.getcwd()
+        return os.path.relpath(object_store.path, output_dir)
+
+    def write_xml(self, output_file, compression=None, object_store=None):
+        '''
+        Write the provenance data to a xml file, like write_xml(self.to_xml()).
+        The operations are serialized and written one at a time, the
+        document is never built as a whole. The file is replaced atomically
+        (see atomic_write).
+        If an object store is given, its path relative to the file is
+        recorded, so readers find the store (see find_object_store).
+        '''
+        history_attributes = {}
+        if object_store is not None:
+            history_attributes['objectStore'] = self.get_object_store_path(object_store, output_file)
+        with atomic_write(output_file, compression) as xml_file:
+            with etree.xmlfile(xml_file) as xf:
+                with xf.element(self.element_name):
+                    write_indented(xf, self.data['target'].to_xml("target"), 1)
+                    xf.write('\n  ')
+                    with xf.element(self.data['history'].element_name, history_attributes):
+                        for child in self.data['history'].iter_xml(object_store):
+                            write_indented(xf, child, 2)
+                        xf.write('\n  ')
+                    xf.write('\n')
+            xml_file.write(b'\n')
+
+    def create_provenance(self, target_file, input_prov_data, applied_operation, link=False):
         '''
         Create the final provenance object from the path to an output data object,
         A dictionary of input provenance data and the object describing the
-        applied operation
+        applied operation.
+        If link, the history links the .prov files of the inputs instead of
+        copying their operations.
         '''
         self.data = defaultdict()
+        self.file = None
+        self.prov_file = None
         # Target: Get this from the applied operation object
         self.data['target'] = applied_operation.get_target_data_object(target_file)
         # History: Combine the history of all input files with the applied operation
+        # Links are relative to the directory of the new .prov file (next to the target)
         new_history = History()
-        new_history.combine_histories(input_prov_data, applied_operation)
+        new_history.combine_histories(input_prov_data, applied_operation, link,
+                                      os.path.dirname(os.path.abspath(target_file)))
         self.data['history'] = new_history
         
-    def get_xml_file_path(self):
+    def get_sampled_files(self):
+        '''
+        Return the file elements of the target and the history that are
+        described by a sampled fingerprint instead of a full digest.
+        '''
+        data_objects = [self.target]
+        for operation in self.iter_operations():
+            for key in ('inputDataObjects', 'targetDataObjects'):
+                if operation.data[key] is not None:
+                    data_objects += operation.data[key].data['objects']
+        sampled_files = []
+        uris = set()
+        for data_object in data_objects:
+            element = data_object.data['dataObject']
+            if isinstance(element, File) and element.is_sampled() and element.get_uri() not in uris:
+                uris.add(element.get_uri())
+                sampled_files.append(element)
+        return sampled_files
+
+    def get_xml_file_path(self, compression=None):
         '''
         Return the path to the corresponding xml file.
+        The file name ends with the suffix of the compression (e.g. .prov.gz).
         '''
-        return self.data['target'].get_uri() + '.prov'
+        return self.target.get_uri() + PROV_SUFFIX + get_compression_suffix(compression)
     
     def to_dag(self):
         '''
         Create a graphical representation of the provenance metadata.
-        Input and output/target files are nodes. These nodes are connected by the tracket operations/workflow steps.
+        Input and output/target data objects are nodes. These nodes are connected by the tracked operations/workflow steps.
+        The operations are read one at a time, so this also works in stream mode.
         '''
+        # graphviz is only needed here, do not import it on start-up
+        import graphviz as gv
         # Create the empty graph        
         dag = gv.Digraph(format='svg')
         
-        # Dictionary of file objects with hash as key, name (not path!) as value
-        # These will be file nodes
-        file_dict = {}
         # Iterate over the operations and collect the stored information
         op_num = 0
-        for operation in self.data['history'].data['operation']:
+        for operation in self.iter_operations():
             op_num += 1
-            # Input files
-            if operation.data['inputFiles']:
-                input_files = operation.data['inputFiles']
-                for input_file in input_files.data['file']:
-                    file_dict[input_file.data['sha1']] = input_file.data['name']
-            # Output files
-            output_files = operation.data['targetFiles']
-            for output_file in output_files.data['file']:
-                file_dict[output_file.data['sha1']] = output_file.data['name']
-
-            for key, value in file_dict.items():
-                # Name of file node is <name>:<sha1>
-                node_name = value + ":" + key
-                #dag.node(node_name)
-                
+            # Name of a data object node is <name>:<sha1 or sampled fingerprint>
+            input_nodes = []
+            if operation.data['inputDataObjects'] is not None:
+                input_nodes = [self.get_node_name(data_object)
+                               for data_object in operation.data['inputDataObjects'].data['objects']]
+            output_nodes = [self.get_node_name(data_object)
+                            for data_object in operation.data['targetDataObjects'].data['objects']]
             # Edges
-            # For commandLine, connect each input node with the corresponding output node
-            # Label is the command?
-            command = operation.data['opClass'].data['opClass'].data['command']
-            if operation.data['inputFiles']:
-                for input_file in input_files.data['file']:
-                    for output_file in output_files.data['file']:
-                        in_node = input_file.data['name'] + ":" + input_file.data['sha1']
-                        out_node = output_file.data['name'] + ":" + output_file.data['sha1']
-                        label = "Op " + str(op_num)
-                        dag.edge(in_node, out_node, label=label)
-        dag.render("test.svg")
-        return
+            # Connect each input node with the corresponding output node
+            label = "Op " + str(op_num)
+            for in_node in input_nodes:
+                for out_node in output_nodes:
+                    dag.edge(in_node, out_node, label=label)
+        return dag
+
+    @staticmethod
+    def get_node_name(data_object):
+        '''
+        Return the name of the node of a data object in the dag.
+        Files described by a sampled fingerprint have no sha1, the
+        fingerprint identifies their content instead.
+        '''
+        element = data_object.data['dataObject']
+        digest = element.data['sha1']
+        if digest is None and element.data.get('fingerprint') is not None:
+            digest = element.data['fingerprint']['value']
+        return str(element.data['name']) + ":" + str(digest)
@@ -1,19 +1,46 @@
 import os
+import re
 import hashlib
+import itertools
 from dataprov.elements.generic_element import GenericElement
 from dataprov.elements.file import File
 from dataprov.definitions import XML_DIR
+from dataprov.utils.hash_cache import HashCache, cached_digest, remember_digests
+from dataprov.utils.hashing import hash_file, new_digest, get_extra_digests
+from dataprov.utils.hash_pool import hash_files
+from dataprov.utils.external_sort import ExternalSorter
 from lxml import etree
-from dataprov.utils.io import prettify
+from dataprov.utils.io import prettify, atomic_write
 
 
 class Directory(GenericElement):
     '''
     Class describing the a directory element.
+    The content of a directory is described by a Merkle tree: The digest of a
+    directory is the sha1 sum over the names and digests of its files and
+    subdirectories. The digests of all files and subdirectories are stored
+    in the '.shalist' file in the directory together with the file system
+    metadata used to detect unchanged files on the next run.
+    The tree is processed as a sorted stream, so the memory usage does not
+    depend on the number of files.
     '''
     
     element_name = "directory"
     schema_file = os.path.join(XML_DIR, 'directory_element.xsd')
+
+    shalist_name = ".shalist"
+    # Version 3 lists the entries in depth first order (see path_key),
+    # version 4 drops the mtime of directories, version 5 escapes paths
+    shalist_header = "# dataprov shalist version 5"
+    # Number of shalist entries held in memory while the tree is processed
+    batch_size = 100000
+    # Files modified less than this number of seconds before the shalist was
+    # written are hashed again, like racy entries of the hash cache
+    racy_window = HashCache.racy_window
+    # Characters of paths that are percent-encoded in the shalist, which is
+    # tab separated and lists one entry per line
+    shalist_escapes = str.maketrans({'%': '%25', '\t': '%09', '\n': '%0A', '\r': '%0D'})
+    shalist_escaped = re.compile('%([0-9A-F]{2})')
              
     def __init__(self, uri=None):
         '''
@@ -28,48 +55,280 @@ class Directory(GenericElement):
             basename = os.path.basename(uri)
             self.data['name'] = basename
             self.data['uri'] = uri
-            # Compute the shasum of each file in the directory.
-            # Sort the resulting shasums according to the filename.
-            filelist = []
-            for root, directories, filenames in os.walk(uri):
-                for filename in filenames: 
-                    filelist.append(os.path.join(root, filename))
-            file_hash_list = []
-            for file in filelist:
-                try:
-                    hash = self.compute_hash(file)
-                except:
-                    hash = "undefined"
-                file_hash_list.append((file, hash))
-            file_hash_list.sort()
-            # Write list to file (directory name with '.shalist' suffix)
-            shalist_file = os.path.join(uri, ".shalist")
-            # Create an empty file.
-            # This ensures that there is a shafile for an empty directory
-            open(shalist_file, 'a').close()
-            with open(shalist_file, "w") as shafile:
-                for file, hash in file_hash_list:
-                    shafile.write(file + ", " + hash)
+            # Compute the digests of the directory tree. Digests of unchanged
+            # files are taken from the previous shalist.
+            shalist_file = os.path.join(uri, self.shalist_name)
+            self.data['sha1'] = self.compute_tree(uri, shalist_file)
             self.data['shafile'] = File(shalist_file)
+
+
+    @staticmethod
+    def path_key(rel_path):
+        '''
+        Sort key of a path relative to the directory. Sorting by the path
+        components yields a depth first order, in which every directory is
+        directly followed by its subtree and siblings are sorted by name.
+        '''
+        if rel_path == '.':
+            return ()
+        return tuple(rel_path.split(os.sep))
+
+
+    @classmethod
+    def entry_key(cls, record):
+        return cls.path_key(record[0])
+
+
+    def compute_tree(self, uri, shalist_file):
+        '''
+        Compute the Merkle tree of the directory, write the shalist and
+        return the digest of the directory.
+        The tree is processed as a stream of (path, entry) records, where path
+        is relative to uri ('.' is the root directory) and entry is
+        ('F', sha1, size, mtime_ns, ctime_ns, inode) for files and
+        ('D', sha1) for directories. The mtime of a directory only changes
+        when entries are added, removed or renamed, not when a file in it is
+        written, so it cannot tell that a subtree is unchanged: every file is
+        checked by its own metadata. At most batch_size records are
+        held in memory, larger trees are sorted in runs spilled to temporary files.
+        '''
+        with ExternalSorter(self.entry_key, self.batch_size) as listing, \
+             ExternalSorter(self.entry_key, self.batch_size) as entries:
+            for record in self.scan_tree(uri):
+                listing.add(record)
+            previous = self.read_shalist(shalist_file)
+            reuse_limit = self.get_reuse_limit(shalist_file)
+            records = self.hash_entries(uri, self.reuse_entries(listing, previous, reuse_limit))
+            sha1 = self.build_tree(records, entries)
+            previous.close()
+            self.write_shalist(shalist_file, entries)
+        return sha1
+
+
+    def scan_tree(self, uri):
+        '''
+        Yield a record for each file and directory in the tree.
+        The digests are not computed yet. Symbolic links to directories are
+        not followed, unreadable directories are treated as empty.
+        '''
+        todo = ['.']
+        while todo:
+            rel_dir = todo.pop()
+            directory = uri if rel_dir == '.' else os.path.join(uri, rel_dir)
+            yield rel_dir, ('D', None)
+            try:
+                with os.scandir(directory) as scan:
+                    for dir_entry in scan:
+                        rel_path = dir_entry.name if rel_dir == '.' else os.path.join(rel_dir, dir_entry.name)
+                        try:
+                            is_dir = dir_entry.is_dir()
+                        except OSError:
+                            is_dir = False
+                        if is_dir:
+                            if not dir_entry.is_symlink():
+                                todo.append(rel_path)
+                            continue
+                        if dir_entry.name == self.shalist_name:
+                            continue
+                        try:
+                            stat = dir_entry.stat()
+                        except OSError:
+                            yield rel_path, ('F', "undefined", 0, 0, 0, 0)
+                            continue
+                        yield rel_path, ('F', None, stat.st_size, stat.st_mtime_ns,
+                                         stat.st_ctime_ns, stat.st_ino)
+            except OSError:
+                continue
+
+
+    def get_reuse_limit(self, shalist_file):
+        '''
+        Return the newest mtime (in nanoseconds) of files whose digest can be
+        taken from the shalist, None if there is no shalist. A file modified
+        shortly before it was hashed can be written again within the
+        resolution of the file system timestamps without changing its metadata.
+        '''
+        try:
+            written_ns = os.stat(shalist_file).st_mtime_ns
+        except OSError:
+            return None
+        return written_ns - int(self.racy_window * 1e9)
+
+
+    def reuse_entries(self, records, previous, reuse_limit=None):
+        '''
+        Take the digest of files whose metadata did not change from the
+        previous shalist. Both streams are sorted, so they are merged.
+        Only files with an mtime up to reuse_limit (see get_reuse_limit)
+        are reused.
+        '''
+        previous_record = next(previous, None)
+        for rel_path, entry in records:
+            key = self.path_key(rel_path)
+            while previous_record is not None and self.path_key(previous_record[0]) < key:
+                previous_record = next(previous, None)
+            if entry[0] == 'F' and entry[1] is None and \
+               previous_record is not None and previous_record[0] == rel_path:
+                previous_entry = previous_record[1]
+                if previous_entry[0] == 'F' and previous_entry[2:] == entry[2:] and \
+                   previous_entry[1] != "undefined" and \
+                   reuse_limit is not None and previous_entry[3] <= reuse_limit:
+                    entry = previous_entry
+            yield rel_path, entry
+
+
+    def hash_entries(self, uri, records):
+        '''
+        Hash the files without digest in batches of batch_size records,
+        the files of a batch are hashed in parallel.
+        '''
+        records = iter(records)
+        while True:
+            batch = list(itertools.islice(records, self.batch_size))
+            if not batch:
+                return
+            to_hash = [i for i, (rel_path, entry) in enumerate(batch)
+                       if entry[0] == 'F' and entry[1] is None]
+            hashes = hash_files([os.path.join(uri, batch[i][0]) for i in to_hash],
+                                self.compute_entry_hash)
+            for i, (file, sha1) in zip(to_hash, hashes):
+                rel_path, entry = batch[i]
+                batch[i] = (rel_path, ('F', sha1) + entry[2:])
+            yield from batch
+
+
+    def build_tree(self, records, entries):
+        '''
+        Compute the directory digests from the records in depth first order
+        and add all entries to the entries sorter. Return the digest of the
+        root directory.
+        Only the directories on the path to the current record are kept, each
+        with the digest over its children seen so far.
+        '''
+        stack = []
+        sha1 = None
+        for rel_path, entry in records:
+            if rel_path != '.':
+                parent = os.path.dirname(rel_path) or '.'
+                while stack[-1][0] != parent:
+                    self.close_directory(stack, entries)
+            if entry[0] == 'D':
+                stack.append((rel_path, hashlib.sha1()))
+            else:
+                entries.add((rel_path, entry))
+                stack[-1][1].update(self.tree_hash_line('F', entry[1], os.path.basename(rel_path)))
+        while stack:
+            sha1 = self.close_directory(stack, entries)
+        return sha1
+
+
+    def close_directory(self, stack, entries):
+        '''
+        Finish the digest of the innermost directory on the stack and add it
+        to the digest of its parent.
+        '''
+        rel_dir, tree_hash = stack.pop()
+        sha1 = tree_hash.hexdigest()
+        entries.add((rel_dir, ('D', sha1)))
+        if stack:
+            stack[-1][1].update(self.tree_hash_line('D', sha1, os.path.basename(rel_dir)))
+        return sha1
+
+
+    @staticmethod
+    def tree_hash_line(entry_type, sha1, name):
+        '''
+        Return the line of a child in the digest of a directory. The digest of
+        a directory is the sha1 sum over the lines of its children sorted by
+        name. It only depends on names and content, not on file system
+        metadata, so it can be verified everywhere.
+        '''
+        return (entry_type + " " + sha1 + " " + name + "\n").encode('utf-8', 'surrogateescape')
+
+
+    @classmethod
+    def escape_path(cls, rel_path):
+        '''
+        Percent-encode the characters of a path that separate fields and
+        lines in the shalist, and the percent sign itself.
+        '''
+        return rel_path.translate(cls.shalist_escapes)
+
+
+    @classmethod
+    def unescape_path(cls, field):
+        '''
+        Decode a path written by escape_path.
+        '''
+        if '%' not in field:
+            return field
+        return cls.shalist_escaped.sub(lambda match: chr(int(match.group(1), 16)), field)
+
+
+    def read_shalist(self, shalist_file):
+        '''
+        Yield the (path, entry) records of a shalist written by a previous run.
+        Nothing is yielded if there is no shalist or if it was written in an
+        older format.
+        '''
+        try:
+            with open(shalist_file, 'r', encoding='utf-8', errors='surrogateescape') as shafile:
+                if shafile.readline().rstrip('\n') != self.shalist_header:
+                    return
+                for line in shafile:
+                    fields = line.rstrip('\n').split('\t')
+                    if fields[0] == 'F' and len(fields) == 7:
+                        yield self.unescape_path(fields[6]), ('F', fields[1]) + tuple(int(f) for f in fields[2:6])
+                    elif fields[0] == 'D' and len(fields) == 3:
+                        yield self.unescape_path(fields[2]), ('D', fields[1])
+        except (OSError, ValueError):
+            return
+
+
+    def write_shalist(self, shalist_file, entries):
+        '''
+        Write the entries of the Merkle tree in depth first order to the shalist.
+        The shalist is hashed while it is written, so the File element
+        describing it does not have to read it again. It replaces the previous
+        shalist atomically, an interrupted run never leaves a partial shalist.
+        '''
+        algorithms = ['sha1'] + get_extra_digests()
+        digests = [new_digest(algorithm) for algorithm in algorithms]
+        with atomic_write(shalist_file) as shafile:
+            data = (self.shalist_header + "\n").encode('utf-8')
+            shafile.write(data)
+            for digest in digests:
+                digest.update(data)
+            for rel_path, entry in entries:
+                fields = [entry[0], entry[1]] + [str(f) for f in entry[2:]] + [self.escape_path(rel_path)]
+                data = ("\t".join(fields) + "\n").encode('utf-8', 'surrogateescape')
+                shafile.write(data)
+                for digest in digests:
+                    digest.update(data)
+        remember_digests(shalist_file,
+                         {algorithm: digest.hexdigest() for algorithm, digest in zip(algorithms, digests)})
+
     
+    def compute_entry_hash(self, file):
+        '''
+        Compute the sha1 hashsum of a file in the directory.
+        Files that cannot be read get the hash "undefined".
+        '''
+        try:
+            return self.compute_hash(file)
+        except:
+            return "undefined"
+
+
     def compute_hash(self, file):
         '''
-        Compute the sha1 hashsum of a file
-        '''
-        sha1 = hashlib.sha1()    
-        # BUF_SIZE is totally arbitrary, change for your app!
-        BUF_SIZE = 65536  # lets read stuff in 64kb chunks!
-        if os.path.isfile(file):
-            with open(file, 'rb') as f:
-                while True:
-                    data = f.read(BUF_SIZE)
-                    if not data:
-                        break
-                    sha1.update(data)
-                sha1sum = sha1.hexdigest()
-        else:
-            sha1sum = "undefined"
-        return sha1sum
+        Compute the sha1 hashsum of a file.
+        The digest is taken from the persistent hash cache if the file
+        was not changed since it was hashed the last time.
+        '''
+        if not os.path.isfile(file):
+            return "undefined"
+        return cached_digest(file, 'sha1', hash_file)
 
 
     def from_xml(self, root, validate=True):
@@ -83,7 +342,16 @@ class Directory(GenericElement):
         self.__init__()
         self.data['name'] = root.find('name').text
         self.data['uri'] = root.find('uri').text
-        self.data['shafile'] = File(root.find('sha1file').find('uri').text)
+        # The shafile element is named 'sha1file', the file schema does not apply
+        shafile = File()
+        shafile.from_xml(root.find('sha1file'), validate=False)
+        self.data['shafile'] = shafile
+        # Digest of the Merkle tree (minOccurs=0)
+        sha1_ele = root.find('sha1')
+        if sha1_ele is not None:
+            self.data['sha1'] = sha1_ele.text
+        else:
+            self.data['sha1'] = None
         return
     
     def to_xml(self, root_tag=None):
@@ -97,6 +365,8 @@ class Directory(GenericElement):
         etree.SubElement(root, "uri").text = self.data["uri"]
         shafile_ele = self.data['shafile'].to_xml("sha1file")
         root.append(shafile_ele)
+        if self.data.get('sha1') is not None:
+            etree.SubElement(root, "sha1").text = self.data["sha1"]
         return root    
     
     def get_uri(self):
@@ -63,7 +63,7 @@ class Docker(GenericOp):
         # Docker Container
         docker_container_ele = root.find('dockerContainer')
         docker_container = DockerContainer()
-        docker_container.from_xml(docker_container_ele, validate)
+        docker_container.from_xml(docker_container_ele, validate=False)
         self.data['dockerContainer'] = docker_container
 
     def to_xml(self):
@@ -1,4 +1,5 @@
 import os
+import copy
 import configparser
 from collections import defaultdict
 from dataprov.utils.io import mkdir_p
@@ -33,27 +34,14 @@ class Executor(GenericElement):
             print("Please fill this file with your personal information and try again.")
             self.create_empty_executor_config(config_file)
             exit(0)
-        else:
-            config = configparser.ConfigParser()
-            config.read(config_file)
-            self.data['title'] = config.get('executor', 'title')
-            self.data['firstName'] = config.get('executor', 'firstName')
-            self.data['middleName'] = config.get('executor', 'middleName')
-            self.data['surname'] = config.get('executor', 'surname')
-            self.data['suffix'] = config.get('executor', 'suffix')
-            self.data['mail'] = config.get('executor', 'mail')
-
-        # A person can have more than one affiliation
-        affiliation_list = []
-        affiliations = config.items('affiliations')
-        for key, affiliation in affiliations:
-            affiliation_list.append(affiliation)
-        self.data['affiliation'] = affiliation_list
+        for key, value in read_executor_config(config_file).items():
+            self.data[key] = copy.copy(value)
     
     
     def from_xml(self, root, validate=True):
         '''
         Cannot use the from_xml of the super class, because affiliation is a complex type.
+        Present but empty optional elements are kept as empty strings, to write them back.
         '''
         self.data = defaultdict()
         if validate and not self.validate_xml(root):
@@ -61,19 +49,19 @@ class Executor(GenericElement):
             return
         title_ele = root.find('title')
         if title_ele is not None:
-            self.data['title'] = title_ele.text
+            self.data['title'] = title_ele.text or ''
         else:
             self.data['title'] = None
         self.data['firstName'] = root.find('firstName').text
         middle_name_ele = root.find('middleName')
         if middle_name_ele is not None:
-            self.data['middleName'] = middle_name_ele.text
+            self.data['middleName'] = middle_name_ele.text or ''
         else:
             self.data['middleName'] = None
         self.data['surname'] = root.find('surname').text
         suffix_ele = root.find('suffix')
         if suffix_ele is not None:
-            self.data['suffix'] = suffix_ele.text
+            self.data['suffix'] = suffix_ele.text or ''
         else:
             self.data['suffix'] = None
         self.data['mail'] = root.find('mail').text
@@ -87,6 +75,9 @@ class Executor(GenericElement):
         '''
         Create a xml ElementTree object from the data attribute. 
         '''
+        # Re-emit an untouched subtree without parsing it
+        if self.is_deferred():
+            return self.copy_xml()
         root = etree.Element(self.element_name)
         if self.data['title'] is not None:
             etree.SubElement(root, "title").text = self.data["title"]
@@ -116,9 +107,46 @@ class Executor(GenericElement):
                               'suffix': '',
                               'mail': ''}
         config['affiliations'] = {'affiliation1': ''}
+        # Optional thresholds for sampled fingerprints of very large files
+        config['fingerprint'] = {'minSize': '',
+                                 'chunks': '',
+                                 'chunkSize': ''}
 
         # Create base directory if needed
         base_dir = os.path.dirname(path)
         mkdir_p(base_dir)
         with open(path, 'w') as configfile:
-            config.write(configfile)
\ No newline at end of file
+            config.write(configfile)
+
+
+# Parsed executor config files: path -> (stat key, executor data)
+_executor_configs = {}
+
+
+def read_executor_config(config_file):
+    '''
+    Return the executor data of a config file as dictionary.
+    A config file is only parsed again after it was changed.
+    '''
+    stat = os.stat(config_file)
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    cached = _executor_configs.get(config_file)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    data = {}
+    data['title'] = config.get('executor', 'title')
+    data['firstName'] = config.get('executor', 'firstName')
+    data['middleName'] = config.get('executor', 'middleName')
+    data['surname'] = config.get('executor', 'surname')
+    data['suffix'] = config.get('executor', 'suffix')
+    data['mail'] = config.get('executor', 'mail')
+    # A person can have more than one affiliation
+    affiliation_list = []
+    affiliations = config.items('affiliations')
+    for key, affiliation in affiliations:
+        affiliation_list.append(affiliation)
+    data['affiliation'] = affiliation_list
+    _executor_configs[config_file] = (key, data)
+    return data
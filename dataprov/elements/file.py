@@ -1,13 +1,18 @@
 import os
-import hashlib
+from collections import defaultdict
 from dataprov.elements.generic_element import GenericElement
 from dataprov.definitions import XML_DIR
+from dataprov.utils.hash_cache import cached_digest, cached_digests
+from dataprov.utils.hashing import hash_file, hash_file_digests, get_extra_digests
+from dataprov.utils.hashing import get_fingerprint_settings, fingerprint_file, fingerprint_name
 from lxml import etree
 
 
 class File(GenericElement):
     '''
     Class describing the a file element.
+    A file is described by its sha1 sum. If the fingerprint mode is enabled,
+    very large files are described by a sampled fingerprint instead.
     '''
     
     element_name = "file"
@@ -27,30 +32,125 @@ class File(GenericElement):
                 raise IOError("File not found: ", file)
             basename = os.path.basename(file)
             uri = file
-            sha1 = self.compute_hash(file)
             self.data['name'] = basename
             self.data['uri'] = uri
-            self.data['sha1'] = sha1
+            fingerprint_settings = None
+            if os.path.isfile(file):
+                fingerprint_settings = get_fingerprint_settings(os.path.getsize(file))
+            if fingerprint_settings is not None:
+                # Sampled fingerprint instead of reading the whole file
+                chunks, chunk_size = fingerprint_settings
+                self.data['sha1'] = None
+                self.data['fingerprint'] = self.compute_fingerprint(file, chunks, chunk_size)
+                self.data['digests'] = {}
+            else:
+                # sha1 and the configured additional digests in one pass
+                digests = self.compute_digests(file, ['sha1'] + get_extra_digests())
+                self.data['sha1'] = digests.pop('sha1')
+                self.data['fingerprint'] = None
+                self.data['digests'] = digests
         
     
     def compute_hash(self, file):
         '''
-        Compute the sha1 hashsum of a file
-        '''
-        sha1 = hashlib.sha1()    
-        # BUF_SIZE is totally arbitrary, change for your app!
-        BUF_SIZE = 65536  # lets read stuff in 64kb chunks!
-        if os.path.isfile(file):
-            with open(file, 'rb') as f:
-                while True:
-                    data = f.read(BUF_SIZE)
-                    if not data:
-                        break
-                    sha1.update(data)
-                sha1sum = sha1.hexdigest()
+        Compute the sha1 hashsum of a file.
+        The digest is taken from the persistent hash cache if the file
+        was not changed since it was hashed the last time.
+        '''
+        if not os.path.isfile(file):
+            return "undefined"
+        return cached_digest(file, 'sha1', self.hash_file)
+
+
+    def compute_digests(self, file, algorithms):
+        '''
+        Compute the digests of a file for each of the given algorithms.
+        The file is read at most once, cached digests are not computed again.
+        '''
+        if not os.path.isfile(file):
+            return {algorithm: "undefined" for algorithm in algorithms}
+        return cached_digests(file, algorithms, hash_file_digests)
+
+
+    def compute_fingerprint(self, file, chunks, chunk_size):
+        '''
+        Compute the sampled fingerprint of a file.
+        Return a dictionary with the fingerprint and its parameters.
+        '''
+        algorithm = fingerprint_name(chunks, chunk_size)
+        value = cached_digest(file, algorithm,
+                              lambda f: fingerprint_file(f, chunks, chunk_size))
+        return {'value': value,
+                'algorithm': 'sha1',
+                'size': os.path.getsize(file),
+                'chunks': chunks,
+                'chunkSize': chunk_size}
+
+
+    def is_sampled(self):
+        '''
+        Check if the file is described by a sampled fingerprint
+        instead of a full digest.
+        '''
+        return self.data.get('fingerprint') is not None
+
+
+    def verify(self):
+        '''
+        Check if the file at the URI still matches the recorded digest or
+        sampled fingerprint. Return None if the file does not exist.
+        The file is always read again, the session registry and the hash
+        cache are not used.
+        '''
+        uri = self.data['uri']
+        if not os.path.isfile(uri):
+            return None
+        if self.is_sampled():
+            fingerprint = self.data['fingerprint']
+            if os.path.getsize(uri) != fingerprint['size']:
+                return False
+            current = fingerprint_file(uri, fingerprint['chunks'], fingerprint['chunkSize'],
+                                       fingerprint['algorithm'])
+            return current == fingerprint['value']
+        return self.hash_file(uri) == self.data['sha1']
+
+
+    def hash_file(self, file):
+        '''
+        Read the file and compute its sha1 hashsum.
+        '''
+        return hash_file(file, 'sha1')
+
+
+    def from_xml(self, root, validate=True):
+        '''
+        Populate data attribute from the root of a xml ElementTree object.
+        Cannot use the from_xml of the super class, because there can be
+        several digest elements.
+        '''
+        self.data = defaultdict()
+        if validate and not self.validate_xml(root):
+            print("XML document does not match XML-schema")
+            return
+        self.data['name'] = root.find('name').text
+        self.data['uri'] = root.find('uri').text
+        # Either a full sha1 or a sampled fingerprint
+        sha1_ele = root.find('sha1')
+        fingerprint_ele = root.find('sampledFingerprint')
+        if sha1_ele is not None:
+            self.data['sha1'] = sha1_ele.text
+            self.data['fingerprint'] = None
         else:
-            sha1sum = "undefined"
-        return sha1sum
+            self.data['sha1'] = None
+            self.data['fingerprint'] = {'value': fingerprint_ele.text,
+                                        'algorithm': fingerprint_ele.get('algorithm'),
+                                        'size': int(fingerprint_ele.get('size')),
+                                        'chunks': int(fingerprint_ele.get('chunks')),
+                                        'chunkSize': int(fingerprint_ele.get('chunkSize'))}
+        digests = {}
+        for digest_ele in root.findall('digest'):
+            digests[digest_ele.get('algorithm')] = digest_ele.text
+        self.data['digests'] = digests
 
     
     def to_xml(self, root_tag=None):
@@ -62,7 +162,20 @@ class File(GenericElement):
             root.tag = root_tag
         etree.SubElement(root, "name").text = self.data["name"]
         etree.SubElement(root, "uri").text = self.data["uri"]
-        etree.SubElement(root, "sha1").text = self.data["sha1"]
+        if self.is_sampled():
+            fingerprint = self.data['fingerprint']
+            fingerprint_ele = etree.SubElement(root, "sampledFingerprint")
+            fingerprint_ele.set('algorithm', fingerprint['algorithm'])
+            fingerprint_ele.set('size', str(fingerprint['size']))
+            fingerprint_ele.set('chunks', str(fingerprint['chunks']))
+            fingerprint_ele.set('chunkSize', str(fingerprint['chunkSize']))
+            fingerprint_ele.text = fingerprint['value']
+        else:
+            etree.SubElement(root, "sha1").text = self.data["sha1"]
+        # Additional digests (minOccurs=0)
+        digests = self.data.get('digests') or {}
+        for algorithm in sorted(digests):
+            etree.SubElement(root, "digest", algorithm=algorithm).text = digests[algorithm]
         return root
     
     
@@ -43,7 +43,7 @@ class FileList(GenericElement):
             exit(1)
         for file_ele in root.findall('file'):
             new_file = File()
-            new_file.from_xml(file_ele, validate)
+            new_file.from_xml(file_ele, validate=False)
             self.data['file'].append(new_file)
 
     
@@ -77,6 +77,7 @@ class FileList(GenericElement):
             if not isFile:
                 print("file in fileList is not a valid")
                 exit(1)
+        return True
     
     
     def add_file(self, new_file):
@@ -1,9 +1,11 @@
 import os
+import copy
 import lxml
 from collections import defaultdict
 from lxml import etree
 from dataprov.utils.io import prettify
 from dataprov.definitions import XML_DIR
+from dataprov.utils.schemas import get_schema_registry
 
 class GenericElement:
     '''
@@ -18,13 +20,87 @@ class GenericElement:
         # Empty data attribute
         self.data = defaultdict()
         
+    
+    @property
+    def data(self):
+        '''
+        The content of this element. A deferred element is parsed from its
+        xml subtree on the first access.
+        '''
+        if self.is_deferred():
+            root = self.get_deferred_root()
+            kwargs = self._deferred[1]
+            self._deferred = None
+            self.from_xml(root, validate=False, **kwargs)
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        # Data set explicitly replaces a deferred subtree
+        self._deferred = None
+        self._data = data
+
+
+    def defer_xml(self, root, **kwargs):
+        '''
+        Keep a reference to a valid xml subtree instead of parsing it (lazy mode).
+        The subtree is parsed with from_xml(root, validate=False, **kwargs) on
+        the first access of data. As long as the element is untouched, to_xml
+        returns a copy of the subtree instead of rebuilding it.
+        root can also be a function returning the subtree, which is called
+        when the subtree is needed (e.g. to load it from an object store).
+        '''
+        self._deferred = (root, kwargs)
+
+
+    def get_deferred_root(self):
+        '''
+        Return the xml subtree of a deferred element.
+        '''
+        root, kwargs = self._deferred
+        if callable(root):
+            root = root()
+            self._deferred = (root, kwargs)
+        return root
+
+
+    def is_deferred(self):
+        '''
+        Check if this element was not parsed from its xml subtree yet.
+        '''
+        return self.__dict__.get('_deferred') is not None
+
+
+    def copy_xml(self, root_tag=None):
+        '''
+        Return a copy of the xml subtree of a deferred element.
+        '''
+        root = copy.deepcopy(self.get_deferred_root())
+        root.tag = root_tag or self.element_name
+        root.tail = None
+        return root
+        
         
+    @classmethod
+    def from_data(cls, data):
+        '''
+        Create an element from the content of its data attribute
+        (e.g. decoded from a binary sidecar).
+        '''
+        element = cls()
+        element.data = data
+        return element
+
+
     def from_xml(self, root, validate=True):
         '''
         Populate data attribute from the root of a xml ElementTree object.
         This only works for simple elements like Host.
         Validity is not checked if not validate. This can be the case if validity
         is already checked by a superior element (e.g. dataprov vs. history)
+        Elements always parse their children with validate=False, because the
+        schema of an element covers its whole subtree. A document is therefore
+        validated once at its root.
         '''
         self.data = defaultdict()
         if validate and not self.validate_xml(root):
@@ -46,21 +122,15 @@ class GenericElement:
     def validate_xml(self, root):
         '''
         Validate an lxml object against a the XSD schema of this dataprov element.
+        The compiled schema is taken from the process wide schema registry.
         '''
-        # Read schema file
-        with open(self.schema_file, 'r') as schema_file_handler:
-            xml_schema_doc = etree.parse(schema_file_handler)
-        # Create XML schema
         try:
-            xml_schema = etree.XMLSchema(xml_schema_doc)
+            get_schema_registry().assert_valid(root, self.schema_file)
+            return True
         except lxml.etree.XMLSchemaParseError as e:
             print("Cannot parse XML schema: ", self.schema_file)
             print(e)
             exit(1)
-        # Validate
-        try:
-            xml_schema.assertValid(root)
-            return True
         except etree.DocumentInvalid as e:#, xml_errors:
             print("XML document is not valid!")
             print(e)
@@ -1,12 +1,25 @@
 import subprocess
 from collections import defaultdict
 from dataprov.elements.generic_element import GenericElement
+from dataprov.utils.hashing import new_digest, get_extra_digests
+from dataprov.utils.hash_cache import remember_digests
 
 class GenericOp(GenericElement):
     '''
     This class describes a generic operation and provides basic functions that
     should be implemented by the actual operations.
     '''
+
+    # Operations that run the wrapped command with GenericOp.run can write
+    # the stdout of the command to a file and hash it on the fly
+    supports_stdout_capture = True
+
+    # Operations that run the wrapped command with GenericOp.run can trace
+    # the file accesses of the command to discover its input/output data objects
+    supports_tracing = True
+
+    # Size of the chunks read from the stdout of the wrapped command
+    capture_buffer_size = 1024 * 1024
     
     def __init__(self):
         # Empty data attribute
@@ -18,6 +31,10 @@ class GenericOp(GenericElement):
         # and have to be infered from the actual operation
         self.input_data_objects = []
         self.output_data_objects = []
+        # File the stdout of the wrapped command is written to (optional)
+        self.stdout_file = None
+        # Tracer recording the file accesses of the wrapped command (optional)
+        self.tracer = None
     
     def pre_processing(self):
         '''
@@ -29,11 +46,75 @@ class GenericOp(GenericElement):
         '''
         Run the wrapped command or workflow.
         '''
+        if self.tracer is not None:
+            self.tracer.start()
+        try:
+            if self.stdout_file is not None:
+                self.run_stdout_capture()
+            else:
+                self.run_subprocess()
+        finally:
+            if self.tracer is not None:
+                self.tracer.stop()
+                self.record_traced_data_objects()
+
+    def run_subprocess(self):
+        '''
+        Run the wrapped command in a subprocess and save its output.
+        '''
         # The generic operation can be run via a subprocess and saves the output
-        op_output = subprocess.check_output(' '.join(self.remaining), shell=True)
+        command = ' '.join(self.remaining)
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE)
+        if self.tracer is not None:
+            self.tracer.watch_process(process.pid)
+        op_output, _ = process.communicate()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, command, output=op_output)
         self.output = op_output
         self.executed = True
         print("op_output: ", op_output)    
+
+    def record_traced_data_objects(self):
+        '''
+        Add the files read and written by the wrapped command
+        to the input and output data objects.
+        '''
+        for path in self.tracer.get_read_files():
+            if path not in self.input_data_objects:
+                self.input_data_objects.append(path)
+        for path in self.tracer.get_written_files():
+            if path not in self.output_data_objects:
+                self.output_data_objects.append(path)
+
+    def run_stdout_capture(self):
+        '''
+        Run the wrapped command and pipe its stdout through dataprov into the
+        stdout file. The file content is hashed while it is written, so the
+        digests are known without reading the file again after the run.
+        '''
+        command = ' '.join(self.remaining)
+        algorithms = ['sha1'] + get_extra_digests()
+        digests = [new_digest(algorithm) for algorithm in algorithms]
+        buffer = memoryview(bytearray(self.capture_buffer_size))
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, bufsize=0)
+        if self.tracer is not None:
+            self.tracer.watch_process(process.pid)
+        with process.stdout, open(self.stdout_file, 'wb') as stdout_file:
+            while True:
+                n = process.stdout.readinto(buffer)
+                if not n:
+                    break
+                chunk = buffer[:n]
+                stdout_file.write(chunk)
+                for digest in digests:
+                    digest.update(chunk)
+        returncode = process.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command)
+        remember_digests(self.stdout_file,
+                         {algorithm: digest.hexdigest() for algorithm, digest in zip(algorithms, digests)})
+        self.output = None
+        self.executed = True
     
     def post_processing(self):
         '''
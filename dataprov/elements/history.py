@@ -9,6 +9,9 @@ class History(GenericElement):
     '''
     This class describes the history element of a dataprov object.
     The history consists of a list of operations.
+    Instead of their operations, the history can link the .prov files of
+    input data objects (see Dataprov.iter_operations). Linked histories
+    precede the operations of the history.
     '''
     
     element_name = "history"
@@ -19,42 +22,104 @@ class History(GenericElement):
         self.data = defaultdict(list)
         
         
-    def from_xml(self, root, validate=True):
+    def from_xml(self, root, validate=True, lazy=False, object_store=None):
         '''
         Populate data attribute from the root of a xml ElementTree object.
+        If lazy, each operation keeps its xml subtree and is only parsed when
+        it is accessed. Untouched operations are copied verbatim by to_xml.
+        References to operations (operationRef) are resolved in the object
+        store when the operation is accessed.
+        Links to .prov files (historyLink) are stored in data['link'].
         '''
         self.data = defaultdict(list)
         if validate and not self.validate_xml(root):
             print("XML document does not match XML-schema")
             return
-        for operation_ele in root.findall('operation'):
+        # The subtree is valid now, the children are not validated again
+        for link_ele in root.iterchildren('historyLink'):
+            self.add_link(link_ele.get('path'), link_ele.get('sha1'))
+        for operation_ele in root.iterchildren('operation', 'operationRef'):
             new_operation = Operation()
-            new_operation.from_xml(operation_ele, validate)
+            if operation_ele.tag == 'operationRef':
+                if object_store is None:
+                    raise IOError("History references operations, but there is no object store")
+                new_operation.defer_reference(operation_ele.get('id'), object_store)
+            elif lazy:
+                new_operation.defer_xml(operation_ele, lazy=True)
+            else:
+                new_operation.from_xml(operation_ele, validate=False)
             self.data['operation'].append(new_operation)
     
     
-    def to_xml(self):
+    def to_xml(self, object_store=None):
         '''
         Create a xml ElementTree object from the data attribute.
+        If an object store is given, the operations are put into the store
+        and the history only references them.
         '''
         root = etree.Element(self.element_name)
+        for child in self.iter_xml(object_store):
+            root.append(child)
+        return root
+
+
+    def iter_xml(self, object_store=None):
+        '''
+        Yield the xml elements of the children of the history one at a time
+        (links and operations or references to operations, see to_xml).
+        '''
+        # Linked histories
+        for link in self.data['link']:
+            yield etree.Element('historyLink', path=link['path'], sha1=link['sha1'])
         # Iterate over operations
         for operation in self.data['operation']:
-            new_operation_ele = operation.to_xml()
-            root.append(new_operation_ele)
-        return root
+            if object_store is None:
+                yield operation.to_xml()
+                continue
+            operation_id = operation.get_id()
+            if not object_store.has(operation_id):
+                object_store.put(operation.to_xml())
+            yield etree.Element('operationRef', id=operation_id)
     
     
-    def combine_histories(self, prov_data, applied_operation):
+    def add_link(self, path, sha1):
+        '''
+        Link the history of a .prov file with the given sha1 sum.
+        '''
+        self.data['link'].append({'path': path, 'sha1': sha1})
+
+
+    def combine_histories(self, prov_data, applied_operation, link=False, link_dir=None):
         '''
         Create a new history by combining the history of the
         given provenance data and the applied operation.
+        If link, the history links the .prov files of the provenance data
+        instead of copying their operations. Its size does not depend on the
+        length of the input histories. The links are relative to link_dir
+        (the directory of the new .prov file), so the .prov files can be moved
+        together. Without link_dir, absolute paths are recorded.
+        Inputs with shared ancestry contain the same operations, each
+        operation is only added once (identified by its content ID).
+        Every input history is in topological order, so keeping the first
+        occurrence of each operation keeps the combined history in topological order.
         '''
         self.data = defaultdict(list)
+        operation_ids = set()
         # Iterate over the prov_data, get all operations
         for file, prov in prov_data.items():
-            if prov is not None:
-                for operation in prov.data['history'].data['operation']:
-                    self.data['operation'].append(operation)
+            if prov is not None and link:
+                prov_file = prov.get_file()
+                if prov_file is None:
+                    raise IOError("Cannot link provenance data that was not read from a file: " + file)
+                if link_dir is not None:
+                    prov_file = os.path.relpath(prov_file, link_dir)
+                if not any(link['path'] == prov_file for link in self.data['link']):
+                    self.add_link(prov_file, prov.get_file_digest())
+            elif prov is not None:
+                for operation in prov.iter_operations():
+                    operation_id = operation.get_id()
+                    if operation_id not in operation_ids:
+                        operation_ids.add(operation_id)
+                        self.data['operation'].append(operation)
         # Append the applied operation
-        self.data['operation'].append(applied_operation)
\ No newline at end of file
+        self.data['operation'].append(applied_operation)
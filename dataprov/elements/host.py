@@ -1,5 +1,4 @@
 import os
-import platform
 from dataprov.elements.generic_element import GenericElement
 from dataprov.definitions import XML_DIR
 from lxml import etree
@@ -13,25 +12,34 @@ class Host(GenericElement):
     element_name = "host"
     schema_file = os.path.join(XML_DIR, 'host_element.xsd')
     
-    def __init__(self):
+    def __init__(self, probe=True):
+        '''
+        Initialize this host element.
+        If probe, populate it with information about the local host.
+        '''
         super().__init__()
+        if not probe:
+            return
         # Get information about host and populate the data dictionary
-        dist = platform.linux_distribution()
-        uname = platform.uname()
-        self.data["system"] = platform.system()
-        self.data["dist"] = dist[0]
-        self.data["version"] = dist[1]
-        self.data["codename"] = dist[2]
-        self.data["kernelVersion"] = uname[2]
-        self.data["machine"] = platform.machine()
-        self.data["processor"] = platform.processor()
-        self.data["hostname"] = uname[1]
+        self.data.update(get_local_host_info())
+
+    @classmethod
+    def from_data(cls, data):
+        '''
+        Create a host element from its data, the local host is not probed.
+        '''
+        host = cls(probe=False)
+        host.data = data
+        return host
          
     
     def to_xml(self):
         '''
         Create a xml ElementTree object from the data attribute. 
         '''
+        # Re-emit an untouched subtree without parsing it
+        if self.is_deferred():
+            return self.copy_xml()
         root = etree.Element(self.element_name)
         etree.SubElement(root, "system").text = self.data["system"]
         etree.SubElement(root, "dist").text = self.data["dist"]
@@ -41,4 +49,54 @@ class Host(GenericElement):
         etree.SubElement(root, "machine").text = self.data["machine"]
         etree.SubElement(root, "processor").text = self.data["processor"]
         etree.SubElement(root, "hostname").text = self.data["hostname"]
-        return root
\ No newline at end of file
+        return root
+
+
+# Information about the local host, probed once per process
+_local_host_info = None
+
+
+def get_local_host_info():
+    '''
+    Return a dictionary with the information about the local host.
+    The host is only probed on the first call.
+    '''
+    global _local_host_info
+    if _local_host_info is None:
+        # platform is only imported when the host is probed
+        import platform
+        dist = get_linux_distribution()
+        uname = platform.uname()
+        _local_host_info = {
+            "system": platform.system(),
+            "dist": dist[0],
+            "version": dist[1],
+            "codename": dist[2],
+            "kernelVersion": uname[2],
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "hostname": uname[1],
+        }
+    return _local_host_info
+
+
+def get_linux_distribution():
+    '''
+    Return (name, version, codename) of the Linux distribution.
+    platform.linux_distribution was removed in Python 3.8,
+    newer versions read /etc/os-release.
+    '''
+    import platform
+    if hasattr(platform, 'linux_distribution'):
+        return platform.linux_distribution()
+    os_release = {}
+    try:
+        with open('/etc/os-release') as os_release_file:
+            for line in os_release_file:
+                if '=' in line:
+                    key, value = line.rstrip('\n').split('=', 1)
+                    os_release[key] = value.strip('"')
+    except OSError:
+        pass
+    return (os_release.get('NAME', ''), os_release.get('VERSION_ID', ''),
+            os_release.get('VERSION_CODENAME', ''))
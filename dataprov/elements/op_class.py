@@ -1,25 +1,51 @@
 import os
-import subprocess
+import importlib
 from collections import defaultdict
 from dataprov.elements.generic_element import GenericElement
-from dataprov.elements.command_line import CommandLine
 from dataprov.definitions import XML_DIR
-from dataprov.elements.singularity import Singularity
-# Conditional imports. If the docker, cwltool or snakemake is not installed throw no error
-try:
-    from dataprov.elements.docker import Docker
-except ImportError as e:
-    print(str(e))
-try:
-    from dataprov.elements.cwltool import CWLTool
-except ImportError as e:
-    print(str(e))
-try:
-    from dataprov.elements.snakemake import Snakemake
-except ImportError as e:
-    print(str(e))
 
 
+# Registry of the operation classes: xml tag -> (module, class name).
+# The modules are only imported when an operation class is needed, some of
+# them depend on large optional packages (docker, cwltool, snakemake).
+op_class_registry = {
+    'commandLine': ('dataprov.elements.command_line', 'CommandLine'),
+    'docker': ('dataprov.elements.docker', 'Docker'),
+    'singularity': ('dataprov.elements.singularity', 'Singularity'),
+    'cwltool': ('dataprov.elements.cwltool', 'CWLTool'),
+    'snakemake': ('dataprov.elements.snakemake', 'Snakemake'),
+}
+
+# Executables wrapped by an operation class other than commandLine -> xml tag
+op_class_executables = {
+    'docker': 'docker',
+    'singularity': 'singularity',
+    'cwltool': 'cwltool',
+    'snakemake': 'snakemake',
+}
+
+
+def register_op_class(tag, module, class_name, executable=None):
+    '''
+    Register an operation class for a xml tag and optionally an executable.
+    '''
+    op_class_registry[tag] = (module, class_name)
+    if executable is not None:
+        op_class_executables[executable] = tag
+
+
+def get_op_class(tag):
+    '''
+    Import and return the operation class for a xml tag.
+    Raises ImportError if the optional package needed by the class is not
+    installed and KeyError for unknown tags.
+    '''
+    module, class_name = op_class_registry[tag]
+    try:
+        return getattr(importlib.import_module(module), class_name)
+    except ImportError as e:
+        raise ImportError("Support for " + tag + " is not available: " + str(e))
+
 
 class OpClass(GenericElement):
     '''
@@ -43,17 +69,9 @@ class OpClass(GenericElement):
             # Try to determine the correct opClass
             # (e.g. docker, singularity, commandLine, ...)
             self.executable = remaining[0].split()[0]
-            if self.executable == "docker":
-                self.data['opClass'] = Docker(remaining)
-            elif self.executable == "singularity":
-                self.data['opClass'] = Singularity(remaining)
-            elif self.executable == 'cwltool':
-                self.data['opClass'] = CWLTool(remaining)
-            elif self.executable == 'snakemake':
-                self.data['opClass'] = Snakemake(remaining)
-            else:
-                #Generic command line tool
-                self.data['opClass'] = CommandLine(remaining)
+            # Generic command line tool if there is no special operation class
+            tag = op_class_executables.get(self.executable, 'commandLine')
+            self.data['opClass'] = get_op_class(tag)(remaining)
 
 
     def from_xml(self, root, validate=True):
@@ -66,24 +84,11 @@ class OpClass(GenericElement):
             return
         # Discriminate from child tag which class to use
         child_tag = root[0].tag
-        if child_tag == 'docker':
-            op_class = Docker()
-            docker_ele = root.find('docker')
-            op_class.from_xml(docker_ele, validate)
-        elif child_tag =='singularity':
-            op_class = Singularity()
-            singularity_ele = root.find('singularity')
-            op_class.from_xml(singularity_ele, validate)
-        elif child_tag == 'snakemake':
-            op_class = Snakemake()
-            snakemake_ele = root.find('snakemake')
-            op_class.from_xml(snakemake_ele, validate)
-        elif child_tag == 'commandLine':
-            op_class = CommandLine()
-            command_line_ele = root.find('commandLine')
-            op_class.from_xml(command_line_ele, validate)
-        else:
+        if child_tag not in op_class_registry:
             print("Unknown root tag: ", child_tag)
+            return
+        op_class = get_op_class(child_tag)()
+        op_class.from_xml(root[0], validate=False)
         self.data['opClass'] = op_class
         
         
@@ -91,6 +96,12 @@ class OpClass(GenericElement):
         '''
         Create a xml ElementTree object from the data attribute. 
         '''
+        # Re-emit an untouched subtree without parsing it.
+        # The subtree is the opClass element, return the element of the operation class.
+        if self.is_deferred():
+            op_class_ele = self.copy_xml()[0]
+            op_class_ele.tail = None
+            return op_class_ele
         root = self.data['opClass'].to_xml()
         return root
 
@@ -125,6 +136,27 @@ class OpClass(GenericElement):
         return self.data['opClass'].get_output_data_objects()
 
 
+    def set_stdout_file(self, stdout_file):
+        '''
+        Write the stdout of the wrapped command to stdout_file and hash it on the fly.
+        '''
+        if not self.data['opClass'].supports_stdout_capture:
+            print("Capturing stdout is not supported for: ", self.executable)
+            exit(1)
+        self.data['opClass'].stdout_file = stdout_file
+
+
+    def set_tracer(self, tracer):
+        '''
+        Trace the file accesses of the wrapped command with the given tracer.
+        The traced files are added to the input/output data objects.
+        '''
+        if not self.data['opClass'].supports_tracing:
+            print("Tracing file accesses is not supported for: ", self.executable)
+            exit(1)
+        self.data['opClass'].tracer = tracer
+
+
     def run(self):
         '''
         Run the wrapped command or workflow.
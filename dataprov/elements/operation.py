@@ -1,4 +1,6 @@
 import os
+import copy
+import hashlib
 import datetime
 from collections import defaultdict
 from dataprov.elements.generic_element import GenericElement
@@ -21,28 +23,36 @@ class Operation(GenericElement):
     schema_file = os.path.join(XML_DIR, 'operation_element.xsd')
     
     def __init__(self):
-        super().__init__()      
+        super().__init__()
+        # Content ID, computed when the operation is serialized the first time
+        self.operation_id = None
+        # xml subtree this operation was parsed from (see to_xml)
+        self.source_xml = None
         
-    def from_xml(self, root, validate=True):
+    def from_xml(self, root, validate=True, lazy=False):
         '''
         Populate data attribute from the root of a xml ElementTree object.
+        If lazy, the data object lists, executor, host and opClass keep their
+        xml subtree and are only parsed when they are accessed.
         '''
         self.__init__()
         if validate and not self.validate_xml(root):
             print("XML document does not match XML-schema")
             return
+        # The subtree is valid now, the children are not validated again
+        self.operation_id = self.check_id(root)
         # Input Files (minOccurs=0)
         input_data_objects_ele = root.find('inputDataObjects')
         if input_data_objects_ele is not None:
             input_data_objects = DataObjectList()
-            input_data_objects.from_xml(input_data_objects_ele, validate)
+            self.parse_child(input_data_objects, input_data_objects_ele, lazy)
             self.data['inputDataObjects'] = input_data_objects
         else:
             self.data['inputDataObjects'] = None
         # Target Files
         target_data_objects_ele = root.find('targetDataObjects')
         target_data_objects = DataObjectList()
-        target_data_objects.from_xml(target_data_objects_ele, validate)
+        self.parse_child(target_data_objects, target_data_objects_ele, lazy)
         self.data['targetDataObjects'] = target_data_objects
         # Start time
         start_time_ele = root.find('startTime')
@@ -53,26 +63,58 @@ class Operation(GenericElement):
         # Executor
         executor_ele = root.find('executor')
         executor = Executor()
-        executor.from_xml(executor_ele, validate)
+        self.parse_child(executor, executor_ele, lazy)
         self.data['executor'] = executor
         # Host
         host_ele = root.find('host')
-        host = Host()
-        host.from_xml(host_ele, validate)
+        # Do not probe the local host, the host is read from xml
+        host = Host(probe=False)
+        self.parse_child(host, host_ele, lazy)
         self.data['host'] = host
         # Operation class (opClass)
         op_class_ele = root.find('opClass')
         op_class= OpClass()
-        op_class.from_xml(op_class_ele, validate)
+        self.parse_child(op_class, op_class_ele, lazy)
         self.data['opClass'] = op_class
-        # Message
+        # Message (minOccurs=0)
         message_ele = root.find('message')
-        self.data['message'] = message_ele.text
+        if message_ele is not None:
+            self.data['message'] = message_ele.text or ''
+        else:
+            self.data['message'] = None
+        # Parsed operations are written verbatim
+        self.source_xml = root
+
+    @staticmethod
+    def parse_child(element, root, lazy):
+        '''
+        Parse a valid child element now or defer it until it is accessed.
+        '''
+        if lazy:
+            element.defer_xml(root)
+        else:
+            element.from_xml(root, validate=False)
 
     def to_xml(self):
         '''
         Create a xml ElementTree object from the data attribute.
         '''
+        # Re-emit an untouched subtree without parsing it
+        if self.is_deferred():
+            root = self.copy_xml()
+            if self.operation_id is None:
+                self.operation_id = self.compute_id(root)
+            root.set('id', self.operation_id)
+            return root
+        # Re-emit the subtree of a parsed operation that was not modified since.
+        # Rebuilding it from the parsed fields could change its content, but not its ID.
+        if self.source_xml is not None:
+            root = copy.deepcopy(self.source_xml)
+            root.tail = None
+            if self.operation_id is None:
+                self.operation_id = self.compute_id(root)
+            root.set('id', self.operation_id)
+            return root
         root = etree.Element(self.element_name)
         # Input Data Objects
         if self.data['inputDataObjects']:
@@ -94,26 +136,101 @@ class Operation(GenericElement):
         op_class_ele = etree.SubElement(root, 'opClass')
         op_class_ele.append(self.data['opClass'].to_xml())
         # Message
-        message_ele = etree.SubElement(root, 'message')
-        message_ele.text = self.data['message']
+        if self.data['message'] is not None:
+            message_ele = etree.SubElement(root, 'message')
+            message_ele.text = self.data['message']
+        # Content ID
+        if self.operation_id is None:
+            self.operation_id = self.compute_id(root)
+        root.set('id', self.operation_id)
         return root
+
+    def defer_xml(self, root, **kwargs):
+        '''
+        Keep the xml subtree of this operation (lazy mode), the content ID
+        is available without parsing the subtree.
+        '''
+        super().defer_xml(root, **kwargs)
+        if not callable(root):
+            self.operation_id = self.check_id(root)
+
+    def defer_reference(self, operation_id, object_store):
+        '''
+        Reference an operation stored in an object store.
+        The operation is only loaded from the store when it is accessed.
+        '''
+        self.defer_xml(lambda: object_store.get(operation_id), lazy=True)
+        self.operation_id = operation_id
+
+    def get_id(self):
+        '''
+        Return the content ID of this operation.
+        The ID is computed once, so the operation must be complete
+        (i.e. recorded) when it is called the first time.
+        '''
+        if self.operation_id is None:
+            self.to_xml()
+        return self.operation_id
+
+    @staticmethod
+    def compute_id(root):
+        '''
+        Compute the content ID of an operation element without id attribute:
+        the sha1 sum of its canonical (C14N) serialization.
+        '''
+        if 'id' in root.attrib:
+            root = copy.copy(root)
+            del root.attrib['id']
+        return hashlib.sha1(etree.tostring(root, method='c14n')).hexdigest()
+
+    @classmethod
+    def check_id(cls, root):
+        '''
+        Return the content ID of a parsed operation element. An operation
+        edited after it was recorded does not match its id attribute anymore,
+        it would be deduplicated and stored under a wrong ID.
+        Raises IOError if the id attribute does not match the content.
+        '''
+        operation_id = cls.compute_id(root)
+        recorded_id = root.get('id')
+        if recorded_id is not None and recorded_id != operation_id:
+            raise IOError("Operation does not match its content ID: " + recorded_id)
+        return operation_id
+
+    def mark_modified(self):
+        '''
+        Forget the xml subtree and the content ID of a parsed operation
+        after its data was changed. Both are created again by to_xml.
+        The record_* methods call this, code changing data directly has to
+        call it as well.
+        '''
+        self.source_xml = None
+        self.operation_id = None
         
     def post_processing(self):
         '''
         Perform necessary post processing steps
         '''
+        self.mark_modified()
         self.data['opClass'].post_processing()
        
-    def record_input_data_objects(self, input_provenance_data):
+    def record_input_data_objects(self, input_provenance_data, data_objects=None):
         '''
         Record the input data objects.
+        data_objects optionally maps inputs without provenance data to
+        their data objects created beforehand (e.g. hashed concurrently).
         '''
+        self.mark_modified()
+        if data_objects is None:
+            data_objects = {}
         input_data_objects = DataObjectList()
         if input_provenance_data is not None:
             for input_data_object, provenance_object in input_provenance_data.items():
                 # Check if there is provenance data available
                 if provenance_object is not None:
-                    input_data_objects.add_object(provenance_object.data['target'])
+                    input_data_objects.add_object(provenance_object.target)
+                elif input_data_object in data_objects:
+                    input_data_objects.add_object(data_objects[input_data_object])
                 else:
                     new_object = DataObject(input_data_object)
                     input_data_objects.add_object(new_object)
@@ -125,6 +242,7 @@ class Operation(GenericElement):
         '''
         Record target data objects
         '''
+        self.mark_modified()
         # Check which of the specified target files are present
         target_data_objects = DataObjectList()
         for uri in uris:
@@ -141,6 +259,7 @@ class Operation(GenericElement):
         Record start time in the format:
         YYYY-MM-DDThh:mm:ss
         '''
+        self.mark_modified()
         start_time = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
         self.data['startTime'] = start_time
         
@@ -149,6 +268,7 @@ class Operation(GenericElement):
         Record end time in the format:
         YYYY-MM-DDThh:mm:ss
         '''
+        self.mark_modified()
         end_time = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
         self.data['endTime'] = end_time
         
@@ -156,31 +276,38 @@ class Operation(GenericElement):
         '''
         Record op class.
         '''  
+        self.mark_modified()
         self.data['opClass'] = op_class
                 
     def record_wrapped_command(self, wrapped_command):
         '''
         Record wrapped command
         '''
+        self.mark_modified()
         self.data['wrappedCommand'] = wrapped_command
            
-    def record_host(self):
+    def record_host(self, host=None):
         '''
         Record host system
+        If no host is given, the local host is probed.
         '''
-        host = Host()
+        self.mark_modified()
+        if host is None:
+            host = Host()
         self.data['host'] = host
 
     def record_executor(self, executor):
         '''
         Record executor
         '''
+        self.mark_modified()
         self.data['executor'] = executor
        
     def record_message(self, message):
         '''
         Record message
         '''
+        self.mark_modified()
         self.data['message'] = message
         
     def get_target_data_object(self, target_data_object):
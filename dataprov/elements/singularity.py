@@ -61,7 +61,7 @@ class Singularity(GenericOp):
         # Singularity Container
         singularity_container_ele = root.find('singularityContainer')
         singularity_container = SingularityContainer()
-        singularity_container.from_xml(singularity_container_ele, validate)
+        singularity_container.from_xml(singularity_container_ele, validate=False)
         self.data['singularityContainer'] = singularity_container
 
     def to_xml(self):
@@ -20,6 +20,11 @@ class Snakemake(GenericOp):
     
     element_name = "snakemake"
     schema_file = os.path.join(XML_DIR, 'snakemake_element.xsd')
+
+    # The workflow is run with the snakemake API, not as a subprocess
+    supports_stdout_capture = False
+    # Input/output data objects are taken from the workflow description
+    supports_tracing = False
     
     def __init__(self, remaining=None):
         super().__init__()
@@ -111,12 +116,12 @@ class Snakemake(GenericOp):
         self.data['snakemakeVersion'] = root.find('snakemakeVersion').text
         # Snakefile
         snakefile = File()
-        snakefile.from_xml(root.find('snakefile'), validate)
+        snakefile.from_xml(root.find('snakefile'), validate=False)
         self.data['snakefile'] = snakefile
         # Configfile
         if root.find('configFile') is not None:
             config_file = File()
-            config_file.from_xml(root.find('configFile'), validate)
+            config_file.from_xml(root.find('configFile'), validate=False)
             self.data['configFile'] = config_file
         else:
             self.data['configFile'] = None
@@ -124,7 +129,7 @@ class Snakemake(GenericOp):
         self.data['step'] = []
         for step in root.findall('step'):
             command_line = CommandLine()
-            command_line.from_xml(step, validate)
+            command_line.from_xml(step, validate=False)
             self.data['step'].append(step)
 
 
@@ -150,18 +155,6 @@ class Snakemake(GenericOp):
         return root
         
         
-    def validate_xml(self, root):
-        '''
-        Validate an lxml object against a the XSD schema of this dataprov element.
-        '''
-        # Read schema file
-        with open(self.schema_file, 'r') as schema_file_handler:
-            xml_schema_doc = etree.parse(schema_file_handler)
-        # Create XML schema
-        xml_schema = etree.XMLSchema(xml_schema_doc)
-        # Validate
-        return xml_schema.validate(root)
-        
     def run(self):
         '''
         Run the wrapped command or workflow.
@@ -0,0 +1,267 @@
+'''
+In-process recording of provenance metadata.
+
+Python pipelines producing files in-process can record their provenance
+without wrapping a command line:
+
+    import dataprov
+
+    with dataprov.record(inputs=["reads.fastq"], outputs=["counts.tsv"],
+                         message="Count reads"):
+        count_reads("reads.fastq", "counts.tsv")
+
+    @dataprov.record(inputs=["counts.tsv"], outputs=["plot.svg"])
+    def plot():
+        ...
+
+When the block (or the decorated function) finishes without an exception,
+an operation is recorded and a .prov file is written for each output, as
+by `dataprov run`. The executor config, the host information and the
+provenance of the inputs are only read once per process: .prov files read
+or written by earlier blocks are reused as long as they did not change.
+'''
+import os
+import sys
+import copy
+import platform
+import threading
+from collections import OrderedDict
+from contextlib import ContextDecorator
+from dataprov.elements.dataprov import Dataprov
+from dataprov.elements.data_object import DataObject
+from dataprov.elements.executor import Executor
+from dataprov.elements.operation import Operation
+from dataprov.elements.op_class import OpClass
+from dataprov.elements.command_line import CommandLine
+from dataprov.utils.io import find_prov_file
+from dataprov.utils.binary import sidecars_enabled
+from dataprov.utils.object_store import get_configured_object_store
+
+
+# Default place for personal information
+EXECUTOR_CONFIG_FILE = os.path.join(os.path.expanduser("~"), ".dataprov/executor.conf")
+
+# Provenance data read or written in this process: .prov file -> (stat key, Dataprov object)
+_provenance_cache = OrderedDict()
+_provenance_cache_lock = threading.Lock()
+
+# Maximal number of cached Dataprov objects
+provenance_cache_size = 256
+
+
+def get_stat_key(path):
+    stat = os.stat(path)
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def cache_provenance(prov_file, dataprov):
+    '''
+    Keep the provenance data of a .prov file for later blocks.
+    '''
+    key = get_stat_key(prov_file)
+    with _provenance_cache_lock:
+        _provenance_cache[prov_file] = (key, dataprov)
+        _provenance_cache.move_to_end(prov_file)
+        while len(_provenance_cache) > provenance_cache_size:
+            _provenance_cache.popitem(last=False)
+
+
+def load_provenance(data_object, link=False):
+    '''
+    Return the Dataprov object of the .prov file of a data object or None
+    if there is no .prov file. The file is only read again if it changed
+    since it was read or written by this process.
+    Raises IOError if the provenance data or its references cannot be read.
+    '''
+    prov_file = find_prov_file(data_object)
+    if prov_file is None:
+        return None
+    prov_file = os.path.abspath(prov_file)
+    key = get_stat_key(prov_file)
+    with _provenance_cache_lock:
+        cached = _provenance_cache.get(prov_file)
+        if cached is not None and cached[0] == key:
+            _provenance_cache.move_to_end(prov_file)
+            return cached[1]
+    # Lazy: most of the inherited history is only copied to the new provenance
+    # Linked histories are not read at all
+    dataprov = Dataprov(prov_file, stream=link, lazy=True)
+    # Missing or changed references fail the block before it runs
+    dataprov.check_references()
+    cache_provenance(prov_file, dataprov)
+    return dataprov
+
+
+def clear_provenance_cache():
+    '''
+    Forget the provenance data read or written by this process.
+    '''
+    with _provenance_cache_lock:
+        _provenance_cache.clear()
+
+
+def python_op_class(command):
+    '''
+    Return the opClass describing Python code run by the interpreter of
+    this process. The version is taken from the interpreter, no tool is probed.
+    '''
+    command_line = CommandLine()
+    command_line.data['command'] = command
+    command_line.data['toolPath'] = sys.executable
+    command_line.data['toolVersion'] = "Python " + platform.python_version()
+    op_class = OpClass()
+    op_class.data['opClass'] = command_line
+    return op_class
+
+
+def as_paths(paths):
+    '''
+    Return a list of absolute paths, paths is a path or a list of paths.
+    '''
+    if paths is None:
+        return []
+    if isinstance(paths, (str, bytes, os.PathLike)):
+        paths = [paths]
+    return [os.path.abspath(os.fsdecode(path)) for path in paths]
+
+
+class Recorder(ContextDecorator):
+    '''
+    Context manager and decorator recording the work done in its block as
+    an operation (see record). The written .prov files are listed in
+    prov_files after the block.
+    '''
+
+    def __init__(self, inputs=None, outputs=None, message="", command=None,
+                 executor=None, link=False, compress=None, validate=True):
+        self.inputs = as_paths(inputs)
+        self.outputs = as_paths(outputs)
+        self.message = message
+        self.command = command
+        self.executor_config_file = executor or EXECUTOR_CONFIG_FILE
+        self.link = link
+        self.compress = compress
+        self.validate = validate
+        self.operation = None
+        self.input_provenance_data = None
+        self.input_objects = None
+        self.prov_files = []
+
+    def _recreate_cm(self):
+        # Each call of a decorated function is recorded by its own recorder
+        recorder = copy.copy(self)
+        recorder.inputs = list(self.inputs)
+        recorder.outputs = list(self.outputs)
+        recorder.prov_files = []
+        return recorder
+
+    def __call__(self, function):
+        if self.command is None:
+            self.command = function.__module__ + "." + function.__qualname__
+        return super().__call__(function)
+
+    def __enter__(self):
+        self.operation = Operation()
+        self.input_provenance_data = OrderedDict()
+        self.input_objects = {}
+        # Only read the executor config if it changed since the last block
+        if not os.path.exists(self.executor_config_file):
+            raise IOError("No personal information found at " + self.executor_config_file)
+        self.operation.record_executor(Executor(self.executor_config_file))
+        # The local host is probed once per process
+        self.operation.record_host()
+        command = self.command
+        if command is None:
+            command = " ".join([os.path.basename(sys.executable)] + sys.argv)
+        self.operation.record_op_class(python_op_class(command))
+        for input_data_object in self.inputs:
+            self.read_input(input_data_object)
+        self.operation.record_message(self.message)
+        self.operation.record_start_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Failed blocks are not recorded
+        if exc_type is not None:
+            return False
+        self.operation.record_end_time()
+        self.operation.record_input_data_objects(self.input_provenance_data, self.input_objects)
+        for output_data_object in self.outputs:
+            if not os.path.exists(output_data_object):
+                raise IOError("Output data object does not exist: " + output_data_object)
+        self.operation.record_target_data_objects(self.outputs)
+        self.write_provenance()
+        return False
+
+    def add_input(self, path):
+        '''
+        Add an input data object used in the block.
+        '''
+        for input_data_object in as_paths(path):
+            self.inputs.append(input_data_object)
+            if self.operation is not None:
+                self.read_input(input_data_object)
+
+    def add_output(self, path):
+        '''
+        Add an output data object written in the block.
+        '''
+        for output_data_object in as_paths(path):
+            if output_data_object not in self.outputs:
+                self.outputs.append(output_data_object)
+
+    def read_input(self, input_data_object):
+        '''
+        Read the provenance data of an input data object, hash the input
+        if it has no provenance data.
+        '''
+        if input_data_object in self.input_provenance_data:
+            return
+        if not os.path.exists(input_data_object):
+            raise IOError("Input data object does not exist: " + input_data_object)
+        provenance_object = load_provenance(input_data_object, self.link)
+        self.input_provenance_data[input_data_object] = provenance_object
+        if provenance_object is None:
+            self.input_objects[input_data_object] = DataObject(input_data_object)
+
+    def write_provenance(self):
+        '''
+        Write the .prov file of each output data object.
+        Raises IOError if the provenance data is not valid.
+        '''
+        if self.validate and not self.operation.validate_xml(self.operation.to_xml()):
+            raise IOError("Recorded operation is not valid")
+        object_store = get_configured_object_store()
+        for output_data_object in self.outputs:
+            new_dataprov = Dataprov()
+            new_dataprov.create_provenance(output_data_object, self.input_provenance_data,
+                                           self.operation, self.link)
+            if self.validate and not new_dataprov.validate_target():
+                raise IOError("Resulting dataprov object is not valid: " + output_data_object)
+            output_xml_file = new_dataprov.get_xml_file_path(self.compress)
+            new_dataprov.write_xml(output_xml_file, self.compress, object_store)
+            if sidecars_enabled():
+                try:
+                    new_dataprov.write_sidecar(output_xml_file)
+                except ValueError as e:
+                    print("Cannot write binary sidecar: ", e)
+            # Later blocks reading the output reuse the provenance data
+            new_dataprov.prov_file = os.path.abspath(output_xml_file)
+            cache_provenance(new_dataprov.prov_file, new_dataprov)
+            self.prov_files.append(output_xml_file)
+
+
+def record(inputs=None, outputs=None, message="", **kwargs):
+    '''
+    Record the provenance of the work done in a with block or by a
+    decorated function: inputs and outputs are paths (or lists of paths)
+    of the data objects read and written, message is recorded with the
+    operation. Further keyword arguments:
+     - command: description of the operation (default: the command line of
+       the Python process, or the name of the decorated function)
+     - executor: executor config file (default: ~/.dataprov/executor.conf)
+     - link: link the .prov files of the inputs instead of copying their history
+     - compress: write compressed .prov files ('gz' or 'xz')
+     - validate: validate the provenance data before it is written
+    '''
+    return Recorder(inputs=inputs, outputs=outputs, message=message, **kwargs)
@@ -0,0 +1,260 @@
+import gc
+import sys
+import struct
+import importlib
+from array import array
+from collections import defaultdict
+from dataprov.utils.io import atomic_write
+
+
+# Sidecar of a .prov file: <file>.prov.bin
+SIDECAR_SUFFIX = '.bin'
+
+# Header: magic, format version, sha1 of the xml file (raw), length of the string table
+HEADER = struct.Struct('<8sH20sI')
+MAGIC = b'DPROVBIN'
+VERSION = 2
+
+# Token types, stored in the lowest 3 bits of each token of the body
+NONE, STR, INT, LIST, DICT, ELEMENT, BOOL = range(7)
+TYPE_BITS = 3
+TYPE_MASK = (1 << TYPE_BITS) - 1
+
+# Kinds of dictionaries (the default_factory of defaultdicts)
+DICT_KINDS = (dict, defaultdict, list)
+
+# Element classes are only loaded from this package
+ELEMENT_PACKAGE = 'dataprov.elements.'
+
+# Write sidecars for written .prov files
+_write_sidecars = False
+
+
+def configure_sidecars(write=False):
+    '''
+    Write binary sidecars beside written .prov files.
+    Existing sidecars are always used for reading.
+    '''
+    global _write_sidecars
+    _write_sidecars = write
+
+
+def sidecars_enabled():
+    '''
+    Check if binary sidecars are written.
+    '''
+    return _write_sidecars
+
+
+def get_sidecar_path(prov_file):
+    '''
+    Return the path of the binary sidecar of a .prov file.
+    '''
+    return prov_file + SIDECAR_SUFFIX
+
+
+class Encoder:
+    '''
+    Compact binary serialization of dataprov elements.
+
+    The body is a flat array of 32 bit tokens, the lowest bits of a token
+    give its type, the remaining bits its value: an index into the string
+    table, the length of a list or dictionary (followed by its items) or the
+    class of an element (followed by its data attribute). Only the data of
+    elements is stored, i.e. the content described by the schema, not the
+    state of a run (e.g. the output of a wrapped command). Each string is stored
+    only once in the string table, so repeated paths, hostnames and executor
+    names cost one token per occurrence.
+    '''
+
+    def __init__(self):
+        self.strings = {}
+        self.tokens = array('I')
+
+    def string_index(self, string):
+        '''
+        Return the index of a string in the string table, add it if needed.
+        '''
+        index = self.strings.get(string)
+        if index is None:
+            if '\0' in string:
+                raise ValueError("Cannot encode strings containing NUL characters")
+            index = len(self.strings)
+            self.strings[string] = index
+        return index
+
+    def token(self, token_type, value):
+        self.tokens.append(value << TYPE_BITS | token_type)
+
+    def encode(self, value):
+        '''
+        Append a value to the body.
+        Raises ValueError for values that cannot be encoded.
+        '''
+        # Local import, the elements use the utils
+        from dataprov.elements.generic_element import GenericElement
+        if value is None:
+            self.token(NONE, 0)
+        elif isinstance(value, str):
+            self.token(STR, self.string_index(value))
+        elif isinstance(value, bool):
+            self.token(BOOL, int(value))
+        elif isinstance(value, int):
+            self.token(INT, self.string_index(str(value)))
+        elif isinstance(value, list):
+            self.token(LIST, len(value))
+            for item in value:
+                self.encode(item)
+        elif isinstance(value, dict):
+            kind = dict
+            if isinstance(value, defaultdict):
+                kind = list if value.default_factory is list else defaultdict
+                if value.default_factory not in (None, list):
+                    raise ValueError("Cannot encode defaultdict of " + repr(value.default_factory))
+            self.token(DICT, len(value) << 2 | DICT_KINDS.index(kind))
+            for key, item in value.items():
+                self.encode(key)
+                self.encode(item)
+        elif isinstance(value, GenericElement):
+            cls = type(value)
+            if not cls.__module__.startswith(ELEMENT_PACKAGE):
+                raise ValueError("Cannot encode element class " + cls.__module__ + "." + cls.__name__)
+            # Deferred elements are parsed, their data is encoded
+            data = value.data
+            self.token(ELEMENT, self.string_index(cls.__module__ + ":" + cls.__name__))
+            self.encode(data)
+        else:
+            raise ValueError("Cannot encode value of type " + type(value).__name__)
+
+    def to_bytes(self, xml_digest):
+        '''
+        Return the encoded document, xml_digest is the sha1 sum of the xml file.
+        '''
+        strings = '\0'.join(self.strings).encode('utf-8')
+        tokens = self.tokens
+        if sys.byteorder == 'big':
+            tokens = array('I', tokens)
+            tokens.byteswap()
+        return (HEADER.pack(MAGIC, VERSION, bytes.fromhex(xml_digest), len(strings))
+                + strings + tokens.tobytes())
+
+
+class Decoder:
+    '''
+    Decoder of the binary serialization (see Encoder).
+    '''
+
+    def __init__(self, strings, tokens):
+        self.strings = strings
+        self.tokens = tokens
+        self.classes = {}
+
+    def get_class(self, name):
+        '''
+        Return the element class with the given module:name.
+        Only element classes of this package are loaded.
+        '''
+        cls = self.classes.get(name)
+        if cls is None:
+            from dataprov.elements.generic_element import GenericElement
+            module_name, _, class_name = name.partition(':')
+            if not module_name.startswith(ELEMENT_PACKAGE):
+                raise ValueError("Invalid element class: " + name)
+            cls = getattr(importlib.import_module(module_name), class_name)
+            if not (isinstance(cls, type) and issubclass(cls, GenericElement)):
+                raise ValueError("Invalid element class: " + name)
+            self.classes[name] = cls
+        return cls
+
+    def decode(self):
+        '''
+        Return the decoded body.
+        '''
+        # Hot loop: local names instead of attribute lookups
+        strings = self.strings
+        get_class = self.get_class
+        next_token = iter(self.tokens).__next__
+
+        def decode_value():
+            token = next_token()
+            token_type = token & TYPE_MASK
+            value = token >> TYPE_BITS
+            if token_type == STR:
+                return strings[value]
+            elif token_type == NONE:
+                return None
+            elif token_type == DICT:
+                kind = DICT_KINDS[value & 3]
+                if kind is dict:
+                    result = {}
+                elif kind is list:
+                    result = defaultdict(list)
+                else:
+                    result = defaultdict()
+                for i in range(value >> 2):
+                    key = decode_value()
+                    result[key] = decode_value()
+                return result
+            elif token_type == LIST:
+                return [decode_value() for i in range(value)]
+            elif token_type == ELEMENT:
+                cls = get_class(strings[value])
+                return cls.from_data(decode_value())
+            elif token_type == INT:
+                return int(strings[value])
+            elif token_type == BOOL:
+                return bool(value)
+            raise ValueError("Invalid token type: " + str(token_type))
+
+        # The decoded objects are all alive, a garbage collection
+        # while creating them would not find anything
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return decode_value()
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+
+def write_sidecar(element, prov_file, xml_digest):
+    '''
+    Write the binary sidecar of a .prov file.
+    The sidecar is written to a temporary file first, readers never see a
+    partial sidecar. Raises ValueError if the element cannot be encoded.
+    '''
+    encoder = Encoder()
+    encoder.encode(element)
+    content = encoder.to_bytes(xml_digest)
+    with atomic_write(get_sidecar_path(prov_file)) as sidecar_file:
+        sidecar_file.write(content)
+
+
+def read_sidecar(prov_file, xml_digest):
+    '''
+    Return the element stored in the binary sidecar of a .prov file.
+    Return None if there is no sidecar, if it was written for another version
+    of the .prov file (the sha1 sums of the xml file differ) or if it cannot
+    be read. The xml file stays the canonical format.
+    '''
+    sidecar = get_sidecar_path(prov_file)
+    try:
+        with open(sidecar, 'rb') as sidecar_file:
+            content = sidecar_file.read()
+    except OSError:
+        return None
+    if len(content) < HEADER.size:
+        return None
+    magic, version, digest, strings_size = HEADER.unpack_from(content)
+    if magic != MAGIC or version != VERSION or digest.hex() != xml_digest:
+        return None
+    try:
+        start = HEADER.size
+        strings = content[start:start + strings_size].decode('utf-8').split('\0')
+        tokens = array('I')
+        tokens.frombytes(content[start + strings_size:])
+        if sys.byteorder == 'big':
+            tokens.byteswap()
+        return Decoder(strings, tokens).decode()
+    except (ValueError, IndexError, KeyError, StopIteration, ImportError, AttributeError):
+        return None
@@ -0,0 +1,84 @@
+import heapq
+import pickle
+
+
+class ExternalSorter:
+    '''
+    Sort an arbitrary number of records with bounded memory.
+    At most batch_size records are held in memory. A full batch is sorted
+    and spilled to a temporary file (a sorted run). Iterating over the sorter
+    merges the sorted runs and the last batch.
+    Records have to be picklable.
+    '''
+
+    def __init__(self, key, batch_size=100000, directory=None):
+        self.key = key
+        self.batch_size = batch_size
+        self.directory = directory
+        self.batch = []
+        self.runs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, record):
+        '''
+        Add a record.
+        '''
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self.spill()
+
+    def spill(self):
+        '''
+        Sort the records in memory and write them to a new sorted run.
+        '''
+        if not self.batch:
+            return
+        # tempfile is only imported for large trees, not on start-up
+        import tempfile
+        self.batch.sort(key=self.key)
+        run = tempfile.TemporaryFile(prefix="dataprov_sort_", dir=self.directory)
+        pickler = pickle.Pickler(run, pickle.HIGHEST_PROTOCOL)
+        for record in self.batch:
+            pickler.dump(record)
+            # Do not keep references to the spilled records
+            pickler.clear_memo()
+        run.flush()
+        self.runs.append(run)
+        self.batch = []
+
+    @staticmethod
+    def read_run(run):
+        '''
+        Yield the records of a sorted run.
+        '''
+        run.seek(0)
+        unpickler = pickle.Unpickler(run)
+        while True:
+            try:
+                yield unpickler.load()
+            except EOFError:
+                return
+
+    def __iter__(self):
+        '''
+        Yield all records in sorted order.
+        '''
+        self.batch.sort(key=self.key)
+        if not self.runs:
+            return iter(self.batch)
+        runs = [self.read_run(run) for run in self.runs]
+        return heapq.merge(*runs, iter(self.batch), key=self.key)
+
+    def close(self):
+        '''
+        Remove the temporary files.
+        '''
+        for run in self.runs:
+            run.close()
+        self.runs = []
+        self.batch = []
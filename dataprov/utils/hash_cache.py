@@ -0,0 +1,388 @@
+import os
+import time
+import threading
+from dataprov.utils.io import mkdir_p
+from dataprov.definitions import HASH_CACHE_FILE
+
+
+class HashCache:
+    '''
+    Persistent cache of file digests.
+    The cache is a SQLite database (per default at ~/.dataprov/hashcache.sqlite).
+    A digest is keyed by the device, inode, size, mtime and ctime of the file
+    (in nanoseconds), so a cached digest is only reused as long as the file
+    was not touched since it was hashed. Several dataprov processes can share
+    the same cache file at the same time.
+    '''
+
+    # Default maximal number of cached digests
+    default_max_entries = 100000
+    # Seconds to wait for a lock held by another process
+    timeout = 60.0
+    # Check the size limit after this number of stored digests
+    evict_interval = 64
+    # Files modified less than this number of seconds before they were hashed
+    # are not cached. Their mtime may not change if they are written again
+    # within the resolution of the file system timestamps.
+    racy_window = 2.0
+
+    def __init__(self, path=HASH_CACHE_FILE, max_entries=None):
+        self.path = path
+        if max_entries is None:
+            max_entries = self.default_max_entries
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.disabled = False
+        self.connection = None
+        self.lock = threading.Lock()
+
+
+    def connect(self):
+        '''
+        Open the database and create the table if needed.
+        '''
+        if self.connection is not None:
+            return self.connection
+        # sqlite3 is only imported when the cache is used, not on start-up
+        import sqlite3
+        mkdir_p(os.path.dirname(self.path))
+        # Autocommit mode, every statement is a transaction of its own
+        connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+        # WAL allows readers and one writer to access the cache concurrently
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS digests ("
+                           "dev INTEGER, ino INTEGER, size INTEGER, "
+                           "mtime_ns INTEGER, ctime_ns INTEGER, "
+                           "algorithm TEXT, digest TEXT, path TEXT, "
+                           "last_used REAL, "
+                           "PRIMARY KEY (dev, ino, size, mtime_ns, ctime_ns, algorithm))")
+        connection.execute("CREATE INDEX IF NOT EXISTS digests_last_used "
+                           "ON digests (last_used)")
+        self.connection = connection
+        return connection
+
+
+    def close(self):
+        '''
+        Close the database connection.
+        '''
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+    @staticmethod
+    def stat_key(stat):
+        '''
+        Return the cache key of a os.stat_result.
+        '''
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns)
+
+
+    def lookup(self, stat, algorithm):
+        '''
+        Return the cached digest for a os.stat_result or None.
+        '''
+        key = self.stat_key(stat)
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute("SELECT digest FROM digests WHERE dev=? AND ino=? AND size=? "
+                                     "AND mtime_ns=? AND ctime_ns=? AND algorithm=?",
+                                     key + (algorithm,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            connection.execute("UPDATE digests SET last_used=? WHERE dev=? AND ino=? AND size=? "
+                               "AND mtime_ns=? AND ctime_ns=? AND algorithm=?",
+                               (time.time(),) + key + (algorithm,))
+            return row[0]
+
+
+    def store(self, stat, algorithm, digest, path):
+        '''
+        Store the digest of a file described by a os.stat_result.
+        Outdated digests of the same inode are removed.
+        '''
+        import sqlite3
+        key = self.stat_key(stat)
+        with self.lock:
+            connection = self.connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute("DELETE FROM digests WHERE dev=? AND ino=? AND algorithm=?",
+                                   (stat.st_dev, stat.st_ino, algorithm))
+                connection.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   key + (algorithm, digest, path, time.time()))
+                connection.execute("COMMIT")
+            except sqlite3.Error:
+                connection.execute("ROLLBACK")
+                raise
+            self.stores += 1
+            if self.stores % self.evict_interval == 1:
+                self._evict(connection, self.max_entries)
+
+
+    def evict(self, max_entries=None):
+        '''
+        Remove the least recently used digests until at most max_entries are left.
+        '''
+        if max_entries is None:
+            max_entries = self.max_entries
+        with self.lock:
+            return self._evict(self.connect(), max_entries)
+
+
+    def _evict(self, connection, max_entries):
+        cursor = connection.execute("DELETE FROM digests WHERE rowid IN "
+                                    "(SELECT rowid FROM digests ORDER BY last_used DESC "
+                                    "LIMIT -1 OFFSET ?)", (max_entries,))
+        return cursor.rowcount
+
+
+    def purge(self):
+        '''
+        Remove all cached digests.
+        '''
+        with self.lock:
+            connection = self.connect()
+            cursor = connection.execute("DELETE FROM digests")
+            removed = cursor.rowcount
+            connection.execute("VACUUM")
+            return removed
+
+
+    def info(self):
+        '''
+        Return a dictionary with information about the cache.
+        '''
+        with self.lock:
+            connection = self.connect()
+            entries = connection.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+            algorithms = connection.execute("SELECT algorithm, COUNT(*) FROM digests "
+                                            "GROUP BY algorithm").fetchall()
+        size = 0
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                size += os.path.getsize(self.path + suffix)
+        return {'path': self.path,
+                'entries': entries,
+                'maxEntries': self.max_entries,
+                'algorithms': dict(algorithms),
+                'size': size}
+
+
+    def get_digest(self, file, algorithm, compute):
+        '''
+        Return the digest of a file.
+        compute(file) is only called if there is no cached digest for the file.
+        '''
+        digests = self.get_digests(file, [algorithm],
+                                   lambda f, algorithms: {algorithm: compute(f)})
+        return digests[algorithm]
+
+
+    def get_digests(self, file, algorithms, compute):
+        '''
+        Return a dictionary with the digest of a file for each algorithm.
+        compute(file, algorithms) is called once with the algorithms without
+        cached digest and returns a dictionary of the computed digests.
+        A broken or inaccessible cache must not break the provenance recording,
+        so the cache is disabled on the first database error.
+        '''
+        if self.disabled:
+            return compute(file, algorithms)
+        import sqlite3
+        stat_before = os.stat(file)
+        digests = {}
+        try:
+            for algorithm in algorithms:
+                digest = self.lookup(stat_before, algorithm)
+                if digest is not None:
+                    digests[algorithm] = digest
+        except (sqlite3.Error, OSError) as e:
+            self.disable(e)
+        missing = [algorithm for algorithm in algorithms if algorithm not in digests]
+        if not missing:
+            return digests
+        computed = compute(file, missing)
+        # Do not cache the digests if the file was changed while hashing it
+        # or if it was modified too recently
+        stat_after = os.stat(file)
+        if not self.disabled and \
+           self.stat_key(stat_before) == self.stat_key(stat_after) and \
+           time.time() - stat_after.st_mtime > self.racy_window:
+            try:
+                for algorithm in missing:
+                    self.store(stat_after, algorithm, computed[algorithm], file)
+            except (sqlite3.Error, OSError) as e:
+                self.disable(e)
+        digests.update(computed)
+        return digests
+
+
+    def disable(self, error):
+        '''
+        Stop using the cache for the rest of this process.
+        '''
+        print("Hash cache not usable, continue without it: ", self.path)
+        print(error)
+        self.disabled = True
+
+
+# The process wide hash cache
+_hash_cache = None
+_hash_cache_enabled = True
+_hash_cache_lock = threading.Lock()
+
+# Session registry: digests known to this process, keyed by
+# (real path, stat key, algorithm). Every element constructor looks up
+# digests here first, so each file is hashed at most once per invocation.
+_session_digests = {}
+# Statistics about the digests requested in this process
+_session_stats = {'requests': 0, 'sessionHits': 0, 'hashed': 0}
+
+
+def configure_hash_cache(path=None, max_entries=None, enabled=True):
+    '''
+    Configure the process wide hash cache.
+    '''
+    global _hash_cache, _hash_cache_enabled
+    with _hash_cache_lock:
+        if _hash_cache is not None:
+            _hash_cache.close()
+        _hash_cache = None
+        _hash_cache_enabled = enabled
+        if enabled:
+            _hash_cache = HashCache(path or HASH_CACHE_FILE, max_entries)
+
+
+def get_hash_cache():
+    '''
+    Return the process wide hash cache or None if the cache is disabled.
+    '''
+    global _hash_cache
+    with _hash_cache_lock:
+        if _hash_cache is None and _hash_cache_enabled:
+            _hash_cache = HashCache()
+        return _hash_cache
+
+
+def session_key(file, stat):
+    '''
+    Return the key of a file in the session registry.
+    '''
+    return (os.path.realpath(file),) + HashCache.stat_key(stat)
+
+
+def remember_digests(file, digests, stat=None):
+    '''
+    Remember digests of a file for the rest of this process, as long as the
+    file is not changed. Used for digests computed while dataprov wrote the
+    file itself (e.g. the captured stdout of the wrapped command).
+    '''
+    if stat is None:
+        stat = os.stat(file)
+    key = session_key(file, stat)
+    with _hash_cache_lock:
+        for algorithm, digest in digests.items():
+            _session_digests[key + (algorithm,)] = digest
+
+
+def get_session_stats():
+    '''
+    Return statistics about the digests requested in this process:
+    requests is the number of digest requests, sessionHits the number of
+    requests answered by the session registry, hashed the number of files
+    that were actually read. hashesAvoided is requests minus hashed.
+    '''
+    with _hash_cache_lock:
+        stats = dict(_session_stats)
+    stats['hashesAvoided'] = stats['requests'] - stats['hashed']
+    return stats
+
+
+def get_counters():
+    '''
+    Return the counters of this process: the session statistics (see
+    get_session_stats) and the hits and misses of the hash cache.
+    Worker processes pass them to their parent (see add_counters).
+    '''
+    with _hash_cache_lock:
+        counters = dict(_session_stats)
+        hash_cache = _hash_cache
+    if hash_cache is not None:
+        with hash_cache.lock:
+            counters['cacheHits'] = hash_cache.hits
+            counters['cacheMisses'] = hash_cache.misses
+    return counters
+
+
+def add_counters(counters):
+    '''
+    Add counters of another process (see get_counters) to the counters of
+    this process.
+    '''
+    with _hash_cache_lock:
+        for name in _session_stats:
+            _session_stats[name] += counters.get(name, 0)
+        hash_cache = _hash_cache
+    if hash_cache is not None:
+        with hash_cache.lock:
+            hash_cache.hits += counters.get('cacheHits', 0)
+            hash_cache.misses += counters.get('cacheMisses', 0)
+
+
+def cached_digest(file, algorithm, compute):
+    '''
+    Return the digest of a file, use the session registry and the process
+    wide hash cache if possible.
+    compute(file) computes the digest if it is not known.
+    '''
+    digests = cached_digests(file, [algorithm],
+                             lambda f, algorithms: {algorithm: compute(f)})
+    return digests[algorithm]
+
+
+def cached_digests(file, algorithms, compute):
+    '''
+    Return a dictionary with the digest of a file for each algorithm,
+    use the session registry and the process wide hash cache if possible.
+    compute(file, algorithms) computes the digests that are not known
+    in a single pass.
+    '''
+    stat = os.stat(file)
+    key = session_key(file, stat)
+    digests = {}
+    with _hash_cache_lock:
+        _session_stats['requests'] += 1
+        for algorithm in algorithms:
+            if key + (algorithm,) in _session_digests:
+                digests[algorithm] = _session_digests[key + (algorithm,)]
+        if len(digests) == len(algorithms):
+            _session_stats['sessionHits'] += 1
+            return digests
+    missing = [algorithm for algorithm in algorithms if algorithm not in digests]
+
+    def compute_and_count(file, algorithms):
+        with _hash_cache_lock:
+            _session_stats['hashed'] += 1
+        return compute(file, algorithms)
+
+    hash_cache = get_hash_cache()
+    if hash_cache is None:
+        computed = compute_and_count(file, missing)
+    else:
+        computed = hash_cache.get_digests(file, missing, compute_and_count)
+    # Only remember the digests if the file was not changed meanwhile
+    stat_after = os.stat(file)
+    if HashCache.stat_key(stat_after) == HashCache.stat_key(stat):
+        remember_digests(file, computed, stat_after)
+    digests.update(computed)
+    return digests
@@ -0,0 +1,125 @@
+import os
+import time
+import threading
+import functools
+from dataprov.utils import hash_cache
+
+
+# Kinds of worker pools that can hash files
+pool_types = ["thread", "process"]
+
+# Process wide settings of the hashing engine
+_settings = {'workers': None,
+             'pool': "thread",
+             'debug': False}
+_settings_lock = threading.Lock()
+
+
+def configure_hash_pool(workers=None, pool="thread", debug=False):
+    '''
+    Configure the process wide hashing engine.
+    workers is the number of parallel workers (default: number of CPUs),
+    pool is one of pool_types.
+    '''
+    if pool not in pool_types:
+        raise ValueError("Unknown hash pool type: " + str(pool))
+    if workers is not None and workers < 1:
+        raise ValueError("Number of hash workers has to be positive: " + str(workers))
+    with _settings_lock:
+        _settings['workers'] = workers
+        _settings['pool'] = pool
+        _settings['debug'] = debug
+
+
+def get_hash_workers():
+    '''
+    Return the number of parallel hash workers.
+    '''
+    workers = _settings['workers']
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def _init_process_worker(cache_path, cache_max_entries, cache_enabled):
+    '''
+    Initialize a worker process.
+    A SQLite connection must not be used across fork(),
+    so each worker opens its own connection to the hash cache.
+    '''
+    hash_cache.configure_hash_cache(path=cache_path,
+                                    max_entries=cache_max_entries,
+                                    enabled=cache_enabled)
+
+
+def _hash_in_process_worker(compute, file):
+    '''
+    Run compute(file) in a worker process. Return the result and the
+    counters of the hash cache it changed, which are added to the counters
+    of the parent process.
+    '''
+    before = hash_cache.get_counters()
+    result = compute(file)
+    after = hash_cache.get_counters()
+    return result, {name: after[name] - before.get(name, 0) for name in after}
+
+
+def hash_files(files, compute):
+    '''
+    Compute compute(file) for each file in files with a pool of workers.
+    Return a list of (file, hash) tuples in the order of files, so the
+    result does not depend on the order the workers finish.
+    For a process pool compute has to be picklable.
+    '''
+    files = list(files)
+    workers = min(get_hash_workers(), max(len(files), 1))
+    start = time.time()
+    if workers == 1:
+        hashes = [compute(file) for file in files]
+    elif _settings['pool'] == "process":
+        # multiprocessing is only imported when it is used
+        from concurrent.futures import ProcessPoolExecutor
+        current_cache = hash_cache.get_hash_cache()
+        if current_cache is not None and not current_cache.disabled:
+            initargs = (current_cache.path, current_cache.max_entries, True)
+        else:
+            initargs = (None, None, False)
+        # Hand out chunks of files to reduce the inter process communication
+        chunksize = max(1, len(files) // (workers * 16))
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_process_worker,
+                                 initargs=initargs) as executor:
+            results = list(executor.map(functools.partial(_hash_in_process_worker, compute),
+                                        files, chunksize=chunksize))
+        # The statistics of the workers are reported by this process
+        hashes = []
+        for result, counters in results:
+            hashes.append(result)
+            hash_cache.add_counters(counters)
+    else:
+        # concurrent.futures is only imported when it is used
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            hashes = list(executor.map(compute, files))
+    if _settings['debug']:
+        report_throughput(files, time.time() - start, workers)
+    return list(zip(files, hashes))
+
+
+def report_throughput(files, seconds, workers):
+    '''
+    Print the hashing throughput.
+    '''
+    total_bytes = 0
+    for file in files:
+        try:
+            total_bytes += os.path.getsize(file)
+        except OSError:
+            continue
+    megabytes = total_bytes / (1024 * 1024)
+    seconds = max(seconds, 1e-9)
+    print("Hashed {} files ({:.1f} MB) in {:.3f} s with {} {} worker(s): "
+          "{:.1f} files/s, {:.1f} MB/s".format(len(files), megabytes, seconds,
+                                                 workers, _settings['pool'],
+                                                 len(files) / seconds,
+                                                 megabytes / seconds))
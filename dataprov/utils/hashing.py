@@ -0,0 +1,419 @@
+import os
+import mmap
+import configparser
+import hashlib
+import threading
+# xxhash is optional, it provides a very fast non-cryptographic fingerprint
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+# Ways to read a file for hashing
+io_strategies = ["readinto", "mmap", "read"]
+
+# Process wide settings of the hashing I/O
+_settings = {
+    # Strategy used for files that are large enough and on a local file system
+    'strategy': "readinto",
+    # Minimal file size for mmap, smaller files are read with readinto
+    'mmapMinSize': 16 * 1024 * 1024,
+    # Drop the pages of huge files from the page cache after hashing them,
+    # so hashing huge inputs does not evict the pages other tools depend on
+    'dropPageCache': True,
+    # Minimal file size for dropping pages from the page cache
+    'dontneedMinSize': 256 * 1024 * 1024,
+    # Digests recorded for files in addition to sha1
+    'extraDigests': [],
+    # Files of at least this size are described by a sampled fingerprint
+    # instead of a full digest. None always computes the full digest.
+    'fingerprintMinSize': None,
+    # Number and size of the chunks hashed for a sampled fingerprint
+    'fingerprintChunks': 16,
+    'fingerprintChunkSize': 1024 * 1024,
+}
+
+# Registry of digest algorithms. Maps the name used in the provenance
+# metadata to a function returning a new hashlib-like digest object.
+_digest_algorithms = {}
+
+# Aliases for digest algorithms, resolved when a digest is configured
+_digest_aliases = {}
+
+# Buffer size is a multiple of the file system block size within these bounds
+MIN_BUFFER_SIZE = 64 * 1024
+MAX_BUFFER_SIZE = 8 * 1024 * 1024
+BLOCKS_PER_READ = 256
+
+# Drop pages from the page cache in windows of this size while reading
+DONTNEED_WINDOW = 64 * 1024 * 1024
+
+# File systems on which mmap is not used
+REMOTE_FILESYSTEMS = ("nfs", "nfs4", "cifs", "smb3", "smbfs", "afs", "ceph",
+                      "glusterfs", "lustre", "gpfs", "beegfs", "sshfs")
+
+_local = threading.local()
+_mounts = None
+_mounts_lock = threading.Lock()
+
+
+def configure_hashing(strategy="readinto", mmap_min_size=None, drop_page_cache=True):
+    '''
+    Configure the process wide hashing I/O.
+    strategy is one of io_strategies.
+    '''
+    if strategy not in io_strategies:
+        raise ValueError("Unknown hashing I/O strategy: " + str(strategy))
+    _settings['strategy'] = strategy
+    if mmap_min_size is not None:
+        _settings['mmapMinSize'] = mmap_min_size
+    _settings['dropPageCache'] = drop_page_cache
+
+
+def register_digest(name, constructor):
+    '''
+    Register a digest algorithm.
+    constructor() has to return an object with update() and hexdigest().
+    '''
+    _digest_algorithms[name] = constructor
+
+
+def resolve_digest(name):
+    '''
+    Return the registered name of a digest algorithm or alias.
+    '''
+    name = _digest_aliases.get(name, name)
+    if name not in _digest_algorithms:
+        raise ValueError("Unknown digest algorithm: " + str(name) +
+                         " (available: " + ", ".join(get_digest_algorithms()) + ")")
+    return name
+
+
+def get_digest_algorithms():
+    '''
+    Return the names of all registered digest algorithms and aliases.
+    '''
+    return sorted(list(_digest_algorithms) + list(_digest_aliases))
+
+
+def new_digest(name):
+    '''
+    Create a new digest object of a registered algorithm.
+    '''
+    return _digest_algorithms[resolve_digest(name)]()
+
+
+def configure_digests(algorithms):
+    '''
+    Configure the digests recorded for files in addition to sha1.
+    '''
+    extra_digests = []
+    for algorithm in algorithms:
+        algorithm = resolve_digest(algorithm)
+        if algorithm != 'sha1' and algorithm not in extra_digests:
+            extra_digests.append(algorithm)
+    _settings['extraDigests'] = extra_digests
+
+
+def get_extra_digests():
+    '''
+    Return the configured digests recorded in addition to sha1.
+    '''
+    return list(_settings['extraDigests'])
+
+
+register_digest('sha1', hashlib.sha1)
+register_digest('sha256', hashlib.sha256)
+register_digest('sha512', hashlib.sha512)
+register_digest('md5', hashlib.md5)
+# BLAKE2b with a reduced digest size is a fast fingerprint for cache keys
+register_digest('blake2b-64', lambda: hashlib.blake2b(digest_size=8))
+register_digest('blake2b-128', lambda: hashlib.blake2b(digest_size=16))
+if xxhash is not None:
+    register_digest('xxh64', xxhash.xxh64)
+    if hasattr(xxhash, 'xxh3_64'):
+        register_digest('xxh3-64', xxhash.xxh3_64)
+        _digest_aliases['fast'] = 'xxh3-64'
+    else:
+        _digest_aliases['fast'] = 'xxh64'
+else:
+    _digest_aliases['fast'] = 'blake2b-64'
+
+
+def configure_fingerprint(min_size=None, chunks=None, chunk_size=None):
+    '''
+    Configure the sampled fingerprint mode. Files with at least min_size bytes
+    are described by a fingerprint over their size and chunks sampled at fixed
+    offsets. min_size=None disables the fingerprint mode.
+    '''
+    if chunks is not None and chunks < 2:
+        raise ValueError("A sampled fingerprint needs at least 2 chunks: " + str(chunks))
+    if chunk_size is not None and chunk_size < 1:
+        raise ValueError("Fingerprint chunk size has to be positive: " + str(chunk_size))
+    _settings['fingerprintMinSize'] = min_size
+    if chunks is not None:
+        _settings['fingerprintChunks'] = chunks
+    if chunk_size is not None:
+        _settings['fingerprintChunkSize'] = chunk_size
+
+
+def read_fingerprint_config(config_file):
+    '''
+    Read the fingerprint thresholds from the [fingerprint] section of a
+    config file (e.g. ~/.dataprov/executor.conf):
+
+    [fingerprint]
+    minSize = 107374182400
+    chunks = 16
+    chunkSize = 1048576
+
+    Return a dictionary with the keyword arguments for configure_fingerprint.
+    '''
+    settings = {}
+    if not os.path.exists(config_file):
+        return settings
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    if not config.has_section('fingerprint'):
+        return settings
+    for option, keyword in (('minSize', 'min_size'),
+                            ('chunks', 'chunks'),
+                            ('chunkSize', 'chunk_size')):
+        value = config.get('fingerprint', option, fallback='').strip()
+        if value:
+            settings[keyword] = int(value)
+    return settings
+
+
+def get_fingerprint_settings(size):
+    '''
+    Return (chunks, chunk_size) if a file of the given size is described by
+    a sampled fingerprint, otherwise None.
+    Files that are not larger than the sampled chunks are always fully hashed.
+    '''
+    min_size = _settings['fingerprintMinSize']
+    chunks = _settings['fingerprintChunks']
+    chunk_size = _settings['fingerprintChunkSize']
+    if min_size is None or size < min_size or size <= chunks * chunk_size:
+        return None
+    return (chunks, chunk_size)
+
+
+def fingerprint_name(chunks, chunk_size, algorithm='sha1'):
+    '''
+    Return the name of a sampled fingerprint, e.g. for the hash cache.
+    '''
+    return "sampled-" + algorithm + ":" + str(chunks) + ":" + str(chunk_size)
+
+
+def get_fingerprint_offsets(size, chunks, chunk_size):
+    '''
+    Return the offsets of the sampled chunks: the head, the tail
+    and chunks - 2 equally strided chunks in between.
+    '''
+    last = size - chunk_size
+    return [last * i // (chunks - 1) for i in range(chunks)]
+
+
+def fingerprint_file(file, chunks, chunk_size, algorithm='sha1'):
+    '''
+    Compute a sampled fingerprint of a file. The digest covers the parameters,
+    the file size and chunks read with positional reads at fixed offsets.
+    It is not a digest of the whole content: changes outside of the sampled
+    chunks that keep the size are not detected.
+    '''
+    digest = new_digest(algorithm)
+    with open(file, 'rb', buffering=0) as f:
+        fd = f.fileno()
+        size = os.fstat(fd).st_size
+        header = "dataprov-sampled-fingerprint chunks=" + str(chunks) + \
+                 " chunkSize=" + str(chunk_size) + " size=" + str(size) + "\n"
+        digest.update(header.encode('ascii'))
+        buffer = get_buffer(chunk_size)
+        for offset in get_fingerprint_offsets(size, chunks, chunk_size):
+            if hasattr(os, 'pread'):
+                data = os.pread(fd, chunk_size, offset)
+                digest.update(data)
+            else:
+                f.seek(offset)
+                n = f.readinto(buffer)
+                digest.update(buffer[:n])
+    return digest.hexdigest()
+
+
+def get_buffer_size(stat):
+    '''
+    Return the read buffer size for a file based on its file system block size.
+    '''
+    block_size = getattr(stat, 'st_blksize', 0) or 4096
+    size = block_size * BLOCKS_PER_READ
+    return max(MIN_BUFFER_SIZE, min(MAX_BUFFER_SIZE, size))
+
+
+def get_buffer(size):
+    '''
+    Return a preallocated buffer of the given size for the current thread.
+    '''
+    buffers = getattr(_local, 'buffers', None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    buffer = buffers.get(size)
+    if buffer is None:
+        buffer = buffers[size] = memoryview(bytearray(size))
+    return buffer
+
+
+def get_filesystem_type(path):
+    '''
+    Return the type of the file system the path is located on
+    (according to /proc/mounts) or None if it cannot be determined.
+    '''
+    global _mounts
+    with _mounts_lock:
+        if _mounts is None:
+            _mounts = []
+            try:
+                with open('/proc/mounts', 'r') as mounts_file:
+                    for line in mounts_file:
+                        fields = line.split()
+                        if len(fields) >= 3:
+                            mount_point = fields[1].replace('\\040', ' ')
+                            _mounts.append((mount_point, fields[2]))
+            except OSError:
+                pass
+            # Longest mount point first
+            _mounts.sort(key=lambda m: len(m[0]), reverse=True)
+    real_path = os.path.realpath(path)
+    for mount_point, fs_type in _mounts:
+        if real_path == mount_point or \
+           real_path.startswith(mount_point.rstrip('/') + '/'):
+            return fs_type
+    return None
+
+
+def is_local_file(path):
+    '''
+    Check if a file is located on a local file system.
+    '''
+    fs_type = get_filesystem_type(path)
+    if fs_type is None:
+        return False
+    return fs_type not in REMOTE_FILESYSTEMS and not fs_type.startswith("fuse")
+
+
+def fadvise(fd, offset, length, advice):
+    '''
+    Give advice about the access pattern of a file, ignore it where
+    posix_fadvise is not available.
+    '''
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, offset, length, advice)
+        except OSError:
+            pass
+
+
+def hash_file(file, algorithm='sha1', strategy=None):
+    '''
+    Read a file once and return the hex digest.
+    strategy is one of io_strategies, per default the configured strategy is used.
+    '''
+    digest = new_digest(algorithm)
+    update_digests(file, [digest], strategy)
+    return digest.hexdigest()
+
+
+def hash_file_digests(file, algorithms, strategy=None):
+    '''
+    Read a file once and return a dictionary with the hex digest
+    of each of the given algorithms.
+    '''
+    digests = [new_digest(algorithm) for algorithm in algorithms]
+    update_digests(file, digests, strategy)
+    return {algorithm: digest.hexdigest() for algorithm, digest in zip(algorithms, digests)}
+
+
+def update_digests(file, digests, strategy=None):
+    '''
+    Read a file once and feed its content into each of the hashlib-like digests.
+    '''
+    if strategy is None:
+        strategy = _settings['strategy']
+    with open(file, 'rb', buffering=0) as f:
+        fd = f.fileno()
+        stat = os.fstat(fd)
+        drop_pages = _settings['dropPageCache'] and stat.st_size >= _settings['dontneedMinSize']
+        if hasattr(os, 'POSIX_FADV_SEQUENTIAL'):
+            fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        if strategy == "mmap" and stat.st_size >= max(_settings['mmapMinSize'], 1) and \
+           is_local_file(file):
+            _update_mmap(fd, stat, digests, drop_pages)
+        elif strategy == "read":
+            _update_read(f, fd, digests, drop_pages)
+        else:
+            _update_readinto(f, fd, stat, digests, drop_pages)
+        if drop_pages and hasattr(os, 'POSIX_FADV_DONTNEED'):
+            fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def _drop_window(fd, offset, dropped):
+    '''
+    Drop already hashed pages from the page cache once a window is complete.
+    Return the new offset up to which pages were dropped.
+    '''
+    if offset - dropped >= DONTNEED_WINDOW and hasattr(os, 'POSIX_FADV_DONTNEED'):
+        fadvise(fd, dropped, offset - dropped, os.POSIX_FADV_DONTNEED)
+        return offset
+    return dropped
+
+
+def _update_readinto(f, fd, stat, digests, drop_pages):
+    buffer = get_buffer(get_buffer_size(stat))
+    offset = 0
+    dropped = 0
+    while True:
+        n = f.readinto(buffer)
+        if not n:
+            break
+        chunk = buffer[:n]
+        for digest in digests:
+            digest.update(chunk)
+        offset += n
+        if drop_pages:
+            dropped = _drop_window(fd, offset, dropped)
+
+
+def _update_mmap(fd, stat, digests, drop_pages):
+    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+        if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        view = memoryview(mapped)
+        try:
+            step = get_buffer_size(stat) * 4
+            dropped = 0
+            for offset in range(0, stat.st_size, step):
+                chunk = view[offset:offset + step]
+                for digest in digests:
+                    digest.update(chunk)
+                chunk.release()
+                if drop_pages:
+                    dropped = _drop_window(fd, offset + step, dropped)
+        finally:
+            view.release()
+
+
+def _update_read(f, fd, digests, drop_pages):
+    # The plain read loop allocates a new bytes object for every chunk.
+    # It is kept for comparison in the benchmarks.
+    offset = 0
+    dropped = 0
+    while True:
+        data = f.read(65536)
+        if not data:
+            break
+        for digest in digests:
+            digest.update(data)
+        offset += len(data)
+        if drop_pages:
+            dropped = _drop_window(fd, offset, dropped)
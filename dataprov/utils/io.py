@@ -1,8 +1,10 @@
 import os
+import gzip
+import lzma
 import errno
+import threading
+from contextlib import contextmanager
 from lxml import etree
-from xml.etree import ElementTree
-from xml.dom import minidom
 
 def mkdir_p(path):
     '''
@@ -21,15 +23,169 @@ def prettify(elem):
     '''
     Return a pretty-printed XML string for the Element.
     '''
+    # Only needed for printing, not imported on start-up
+    from xml.etree import ElementTree
+    from xml.dom import minidom
     rough_string = ElementTree.tostring(elem, 'utf-8')
     reparsed = minidom.parseString(rough_string)
     return reparsed.toprettyxml(indent="  ")
 
 
-def write_xml(root, output_file):
+# Supported compressions of .prov files: magic number, suffix and open function
+compressions = {
+    'gz': (b'\x1f\x8b', '.gz', gzip.open),
+    'xz': (b'\xfd7zXZ\x00', '.xz', lzma.open),
+}
+
+# Errors raised while reading corrupted compressed files
+decompression_errors = (EOFError, OSError, lzma.LZMAError)
+
+# Suffixes of provenance files
+PROV_SUFFIX = '.prov'
+PROV_SUFFIXES = [PROV_SUFFIX] + [PROV_SUFFIX + suffix for magic, suffix, open_function in compressions.values()]
+
+
+def get_compression_suffix(compression=None):
+    '''
+    Return the file suffix of a compression (e.g. '.gz'), '' for None.
+    '''
+    if compression is None:
+        return ''
+    return compressions[compression][1]
+
+
+def detect_compression(path):
+    '''
+    Return the compression of a file detected by its magic number
+    (a key of compressions) or None for uncompressed files.
+    '''
+    with open(path, 'rb') as f:
+        header = f.read(max(len(magic) for magic, suffix, open_function in compressions.values()))
+    for compression, (magic, suffix, open_function) in compressions.items():
+        if header.startswith(magic):
+            return compression
+    return None
+
+
+def open_xml(path):
+    '''
+    Open a xml file for reading in binary mode. Compressed files are
+    detected by their magic number and decompressed while they are read,
+    the decompressed content is never kept in memory as a whole.
+    '''
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path, 'rb')
+    return compressions[compression][2](path, 'rb')
+
+
+def find_prov_file(data_object):
+    '''
+    Return the provenance file of a data object (<data object>.prov,
+    .prov.gz or .prov.xz) or None. If there are several, the most recently
+    modified one is returned.
+    '''
+    prov_files = [data_object + suffix for suffix in PROV_SUFFIXES
+                  if os.path.exists(data_object + suffix)]
+    if not prov_files:
+        return None
+    return max(prov_files, key=os.path.getmtime)
+
+
+# umask of the process where it cannot be read from /proc (see get_umask)
+_umask = None
+_umask_lock = threading.Lock()
+
+
+def get_umask():
+    '''
+    Return the umask of the process. It is read from /proc/self/status
+    (Linux 4.7 or newer): setting it with os.umask to read it would race with
+    other threads creating files. Without /proc it is read once with
+    os.umask and cached.
+    '''
+    global _umask
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+    with _umask_lock:
+        if _umask is None:
+            _umask = os.umask(0)
+            os.umask(_umask)
+        return _umask
+
+
+@contextmanager
+def atomic_write(output_file, compression=None):
+    '''
+    Open output_file for writing in binary mode, compressed if compression is
+    given (a key of compressions). The content is written to a temporary file
+    in the same directory, which replaces output_file when the block is left
+    without an error. Concurrent readers see the old or the new file, but
+    never a partial one. On errors the temporary file is removed.
+    '''
+    # tempfile is only imported when a file is written, not on start-up
+    import tempfile
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        # mkstemp creates files only accessible by the owner
+        os.chmod(tmp_path, 0o666 & ~get_umask())
+        with os.fdopen(fd, 'wb') as output:
+            if compression is None:
+                yield output
+            else:
+                with compressions[compression][2](output, 'wb') as compressed_output:
+                    yield compressed_output
+        os.replace(tmp_path, output_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_xml(root, output_file, compression=None):
+    '''
+    Write an lxml Element to file (atomically, see atomic_write).
+    compression is None or a key of compressions.
+    '''
+    s = etree.tostring(root, pretty_print=True)
+    with atomic_write(output_file, compression) as xml_file:
+        xml_file.write(s)
+
+
+def write_indented(xf, element, level):
+    '''
+    Write an element to an lxml xmlfile, pretty printed like the element at
+    the given nesting level of a document written by write_xml.
+    '''
+    xf.write('\n' + '  ' * level)
+    etree.indent(element, level=level)
+    element.tail = None
+    xf.write(element)
+
+
+def iter_elements(source, tag, schema=None):
     '''
-    Write an lxml Element to file.
+    Parse a XML file (path or file object) incrementally and yield each
+    element with the given tag as soon as it is complete. Yielded elements and their preceding siblings
+    are removed from the tree afterwards, so the memory usage does not depend
+    on the size of the document. Consumers keeping an element have to
+    remove it from its parent, detached elements are not cleared.
+    Whitespace between elements is dropped, as when reading a whole document.
+    If a compiled schema is given, the document is validated while it is
+    parsed, an invalid document raises etree.XMLSyntaxError where the
+    violation is found.
     '''
-    with open(output_file, 'w') as xml_file:
-        s = etree.tostring(root, pretty_print=True).decode('ascii')
-        xml_file.write(s)        
\ No newline at end of file
+    for event, element in etree.iterparse(source, events=('end',), tag=tag,
+                                          remove_blank_text=True, schema=schema):
+        yield element
+        if element.getparent() is None:
+            continue
+        element.clear()
+        parent = element.getparent()
+        while element.getprevious() is not None:
+            del parent[0]
@@ -0,0 +1,171 @@
+import os
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from lxml import etree
+from dataprov.definitions import XML_DIR
+from dataprov.utils.io import atomic_write
+from dataprov.utils.schemas import get_schema_registry
+
+
+# Directory of an object store, relative to the directory it belongs to
+OBJECT_STORE_DIR = os.path.join('.dataprov', 'objects')
+
+# Schema of the stored operation elements
+OPERATION_SCHEMA_FILE = os.path.join(XML_DIR, 'operation_element.xsd')
+
+
+class ObjectStore:
+    '''
+    Content addressed store of operation elements, similar to the object
+    database of git. Each operation is stored once in the file
+    objects/<first two characters of the id>/<rest of the id>, where the id is
+    the content ID of the operation (see Operation.compute_id).
+    .prov files can reference stored operations instead of embedding them.
+    Loaded operations are kept in a LRU cache.
+    '''
+
+    # Default maximal number of cached operation elements
+    default_cache_size = 1024
+
+    def __init__(self, path, cache_size=None):
+        self.path = os.path.abspath(path)
+        if cache_size is None:
+            cache_size = self.default_cache_size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_object_path(self, operation_id):
+        '''
+        Return the path of the file storing an operation.
+        '''
+        return os.path.join(self.path, operation_id[:2], operation_id[2:])
+
+    def has(self, operation_id):
+        '''
+        Check if an operation is stored.
+        '''
+        with self.lock:
+            if operation_id in self.cache:
+                return True
+        return os.path.exists(self.get_object_path(operation_id))
+
+    def put(self, root):
+        '''
+        Store an operation element with id attribute and return its id.
+        Objects are immutable, an operation that is already stored is not
+        written again. Objects are written to a temporary file first, so
+        concurrent readers never see a partial object.
+        Raises IOError if the id does not match the content of the operation.
+        '''
+        operation_id = root.get('id')
+        if operation_id is None or self.compute_id(root) != operation_id:
+            raise IOError("Operation does not match its content ID: " + str(operation_id))
+        object_path = self.get_object_path(operation_id)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            with atomic_write(object_path) as object_file:
+                object_file.write(etree.tostring(root, encoding='utf-8'))
+        return operation_id
+
+    def get(self, operation_id):
+        '''
+        Return the stored operation element with the given id.
+        The content of the object is checked against its id and the
+        operation schema, objects are stored outside of the validated .prov files.
+        Raises IOError if the operation is not stored, corrupted or invalid.
+        '''
+        with self.lock:
+            root = self.cache.get(operation_id)
+            if root is not None:
+                self.cache.move_to_end(operation_id)
+                return root
+        object_path = self.get_object_path(operation_id)
+        try:
+            parser = etree.XMLParser(remove_blank_text=True)
+            root = etree.parse(object_path, parser).getroot()
+        except (OSError, etree.XMLSyntaxError) as e:
+            raise IOError("Operation " + operation_id + " not found in object store " + self.path + ": " + str(e))
+        if root.get('id') != operation_id or self.compute_id(root) != operation_id:
+            raise IOError("Corrupted object in object store: " + object_path)
+        try:
+            get_schema_registry().assert_valid(root, OPERATION_SCHEMA_FILE)
+        except etree.DocumentInvalid as e:
+            raise IOError("Invalid object in object store: " + object_path + ": " + str(e))
+        with self.lock:
+            self.cache[operation_id] = root
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return root
+
+    @staticmethod
+    def compute_id(root):
+        '''
+        Compute the content ID of an operation element with id attribute.
+        '''
+        root = copy.deepcopy(root)
+        del root.attrib['id']
+        return hashlib.sha1(etree.tostring(root, method='c14n')).hexdigest()
+
+
+# Object store configured for this process (e.g. via --object-store)
+_object_store = None
+_object_stores = {}
+_object_store_lock = threading.Lock()
+
+
+def configure_object_store(path=None):
+    '''
+    Use the object store at path for reading and writing .prov files.
+    If path is None, object stores are discovered (see find_object_store).
+    '''
+    global _object_store
+    _object_store = open_object_store(path) if path is not None else None
+
+
+def get_configured_object_store():
+    '''
+    Return the configured object store or None.
+    '''
+    return _object_store
+
+
+def open_object_store(path):
+    '''
+    Return the object store at path. Each store is opened once per process,
+    so all files referencing it share its cache.
+    '''
+    path = os.path.abspath(path)
+    with _object_store_lock:
+        object_store = _object_stores.get(path)
+        if object_store is None:
+            object_store = ObjectStore(path)
+            _object_stores[path] = object_store
+        return object_store
+
+
+def find_object_store(file, recorded_path=None):
+    '''
+    Return the object store used for a .prov file: the configured store,
+    the store recorded in the file (recorded_path, relative to the directory
+    of the file, see Dataprov.write_xml) or the first .dataprov/objects
+    directory in the directory of the file or one of its parents (like git
+    finds its repository). Return None if there is no object store.
+    '''
+    if _object_store is not None:
+        return _object_store
+    directory = os.path.dirname(os.path.abspath(file))
+    if recorded_path is not None:
+        path = os.path.join(directory, recorded_path)
+        if os.path.isdir(path):
+            return open_object_store(path)
+    while True:
+        path = os.path.join(directory, OBJECT_STORE_DIR)
+        if os.path.isdir(path):
+            return open_object_store(path)
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
@@ -0,0 +1,80 @@
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ProbeRunner:
+    '''
+    Run independent metadata probes (e.g. host information, tool versions,
+    container inspection, hashing of input data objects) concurrently on a
+    thread pool. Most probes wait for subprocesses or I/O, so the time until
+    all results are available approaches the time of the slowest probe
+    instead of the sum of all probes.
+    The time of each probe is recorded for the debug output.
+    '''
+
+    def __init__(self, workers=None):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dataprov-probe")
+        self.futures = OrderedDict()
+        self.timings = OrderedDict()
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+
+    def run(self, name, function, *args, **kwargs):
+        '''
+        Run function(*args, **kwargs) as the probe with the given name in the
+        calling thread and return its result.
+        '''
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.timings[name] = (start - self.start, time.perf_counter() - start)
+
+
+    def submit(self, name, function, *args, **kwargs):
+        '''
+        Start function(*args, **kwargs) as the probe with the given name
+        on the thread pool.
+        '''
+        self.futures[name] = self.pool.submit(self.run, name, function, *args, **kwargs)
+
+
+    def result(self, name):
+        '''
+        Wait for the probe with the given name and return its result.
+        Exceptions of the probe (including SystemExit) are raised here.
+        '''
+        return self.futures[name].result()
+
+
+    def shutdown(self):
+        '''
+        Wait for all probes and stop the thread pool.
+        '''
+        self.pool.shutdown(wait=True)
+
+
+    def report(self):
+        '''
+        Print the start (relative to the creation of the runner) and the
+        duration of each finished probe.
+        '''
+        with self.lock:
+            timings = list(self.timings.items())
+        print("Metadata probes (start / duration in seconds):")
+        for name, (start, seconds) in timings:
+            print("  {:<24} {:>8.3f} {:>8.3f}".format(name, start, seconds))
+        print("  {:<24} {:>8} {:>8.3f} (sum of probes: {:.3f})".format(
+            "total", "", time.perf_counter() - self.start, sum(seconds for name, (start, seconds) in timings)))
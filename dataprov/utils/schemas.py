@@ -0,0 +1,101 @@
+import os
+import glob
+import threading
+from lxml import etree
+from dataprov.definitions import XML_DIR
+
+
+class SchemaRegistry:
+    '''
+    Process wide registry of compiled XML schemas.
+    Each schema file is parsed and compiled once, the first time an element
+    is validated against it. The registry can be used from several threads:
+    compiling is serialized, and each schema has its own lock, because a
+    compiled schema keeps the error log of the last validation.
+    '''
+
+    def __init__(self):
+        self.schemas = {}
+        self.lock = threading.Lock()
+        self.compiled = 0
+
+    def get_schema(self, schema_file):
+        '''
+        Return (schema, lock) of a schema file, compile it if needed.
+        Raises etree.XMLSchemaParseError if the schema cannot be compiled.
+        '''
+        schema_file = os.path.abspath(schema_file)
+        entry = self.schemas.get(schema_file)
+        if entry is not None:
+            return entry
+        with self.lock:
+            entry = self.schemas.get(schema_file)
+            if entry is None:
+                xml_schema_doc = etree.parse(schema_file)
+                entry = (etree.XMLSchema(xml_schema_doc), threading.Lock())
+                self.schemas[schema_file] = entry
+                self.compiled += 1
+        return entry
+
+    def assert_valid(self, root, schema_file):
+        '''
+        Validate an lxml object against a schema file.
+        Raises etree.DocumentInvalid if the object is not valid.
+        '''
+        xml_schema, lock = self.get_schema(schema_file)
+        with lock:
+            xml_schema.assertValid(root)
+
+    def prewarm(self, schema_files=None):
+        '''
+        Compile the given schema files (default: all element schemas in
+        dataprov/xml). Schemas that cannot be compiled are skipped, the error
+        is reported when an element is validated against them.
+        '''
+        if schema_files is None:
+            schema_files = get_element_schema_files()
+        for schema_file in schema_files:
+            try:
+                self.get_schema(schema_file)
+            except (OSError, etree.XMLSchemaParseError, etree.XMLSyntaxError):
+                continue
+
+    def clear(self):
+        '''
+        Remove all compiled schemas.
+        '''
+        with self.lock:
+            self.schemas = {}
+
+
+def get_element_schema_files():
+    '''
+    Return the schema files of all dataprov elements.
+    '''
+    return sorted(glob.glob(os.path.join(XML_DIR, '*_element.xsd')) +
+                  glob.glob(os.path.join(XML_DIR, '*', '*_element.xsd')))
+
+
+# The process wide schema registry
+_schema_registry = SchemaRegistry()
+
+
+def get_schema_registry():
+    '''
+    Return the process wide schema registry.
+    '''
+    return _schema_registry
+
+
+def prewarm_schemas(schema_files=None, background=False):
+    '''
+    Compile the element schemas before they are needed.
+    If background, compile them in a daemon thread and return the thread,
+    e.g. to overlap the compilation with the wrapped command.
+    '''
+    if not background:
+        _schema_registry.prewarm(schema_files)
+        return None
+    thread = threading.Thread(target=_schema_registry.prewarm, args=(schema_files,), daemon=True)
+    thread.start()
+    return thread
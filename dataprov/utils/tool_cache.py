@@ -0,0 +1,209 @@
+import os
+import time
+import threading
+import subprocess
+from dataprov.utils.io import mkdir_p
+from dataprov.utils.hash_cache import HashCache
+from dataprov.definitions import TOOL_CACHE_FILE
+
+
+# Version recorded if the version of a tool cannot be determined
+UNKNOWN_VERSION = 'unknown'
+
+# Options tried in this order to print the version of a tool
+version_options = ['--version', '-v']
+
+
+class ToolCache:
+    '''
+    Persistent cache of the versions of command line tools.
+    The cache is a SQLite database (per default at ~/.dataprov/toolcache.sqlite).
+    A version is keyed by the path the tool is invoked with and the device,
+    inode, size, mtime and ctime of the resolved binary, so tools are only
+    probed again after they were installed or updated. Symlinks to the same
+    multi-call binary (e.g. busybox) are different tools. Like the hash
+    cache, the cache file can be shared by several dataprov processes.
+    '''
+
+    # Seconds to wait for a lock held by another process
+    timeout = 60.0
+
+    def __init__(self, path=TOOL_CACHE_FILE):
+        self.path = path
+        self.disabled = False
+        self.connection = None
+        self.lock = threading.Lock()
+
+
+    def connect(self):
+        '''
+        Open the database and create the table if needed.
+        '''
+        if self.connection is not None:
+            return self.connection
+        # sqlite3 is only imported when the cache is used, not on start-up
+        import sqlite3
+        mkdir_p(os.path.dirname(self.path))
+        connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        # The tools table of older versions was keyed by the resolved path only
+        connection.execute("DROP TABLE IF EXISTS tools")
+        connection.execute("CREATE TABLE IF NOT EXISTS tool_versions ("
+                           "path TEXT PRIMARY KEY, dev INTEGER, ino INTEGER, size INTEGER, "
+                           "mtime_ns INTEGER, ctime_ns INTEGER, version TEXT, last_used REAL)")
+        self.connection = connection
+        return connection
+
+
+    def close(self):
+        '''
+        Close the database connection.
+        '''
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+    def lookup(self, path, stat):
+        '''
+        Return the cached version of the tool invoked with path or None.
+        stat describes the resolved binary.
+        '''
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute("SELECT version FROM tool_versions WHERE path=? AND dev=? AND ino=? "
+                                     "AND size=? AND mtime_ns=? AND ctime_ns=?",
+                                     (path,) + HashCache.stat_key(stat)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE tool_versions SET last_used=? WHERE path=?", (time.time(), path))
+            return row[0]
+
+
+    def store(self, path, stat, version):
+        '''
+        Store the version of the tool invoked with path.
+        '''
+        with self.lock:
+            self.connect().execute("INSERT OR REPLACE INTO tool_versions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (path,) + HashCache.stat_key(stat) + (version, time.time()))
+
+
+    def purge(self):
+        '''
+        Remove all cached versions.
+        '''
+        with self.lock:
+            cursor = self.connect().execute("DELETE FROM tool_versions")
+            return cursor.rowcount
+
+
+    def disable(self, error):
+        '''
+        Stop using the cache for the rest of this process.
+        '''
+        print("Tool cache not usable, continue without it: ", self.path)
+        print(error)
+        self.disabled = True
+
+
+# The process wide tool cache
+_tool_cache = None
+_tool_cache_enabled = True
+_tool_cache_lock = threading.Lock()
+# Seconds a version probe may take
+_probe_timeout = 10.0
+# Versions known to this process, keyed by (invoked path, stat key of the resolved binary)
+_session_versions = {}
+
+
+def configure_tool_cache(path=None, enabled=True, timeout=None):
+    '''
+    Configure the process wide tool cache and the timeout of version probes.
+    '''
+    global _tool_cache, _tool_cache_enabled, _probe_timeout
+    with _tool_cache_lock:
+        if _tool_cache is not None:
+            _tool_cache.close()
+        _tool_cache = None
+        _tool_cache_enabled = enabled
+        if enabled:
+            _tool_cache = ToolCache(path or TOOL_CACHE_FILE)
+        if timeout is not None:
+            _probe_timeout = timeout
+
+
+def get_tool_cache():
+    '''
+    Return the process wide tool cache or None if the cache is disabled.
+    '''
+    global _tool_cache
+    with _tool_cache_lock:
+        if _tool_cache is None and _tool_cache_enabled:
+            _tool_cache = ToolCache()
+        return _tool_cache
+
+
+def probe_tool_version(tool_path, timeout=None):
+    '''
+    Run the tool with the options of version_options until one succeeds and
+    return its output. A probe is killed after timeout seconds, the tool is
+    not probed again after a timeout. Return UNKNOWN_VERSION if no probe
+    succeeds.
+    '''
+    if timeout is None:
+        timeout = _probe_timeout
+    for option in version_options:
+        try:
+            output = subprocess.run([tool_path, option], stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                    timeout=timeout, check=True).stdout
+            return output.decode('utf-8', errors='replace')
+        except subprocess.TimeoutExpired:
+            # The tool probably started real work, do not start it again
+            break
+        except (OSError, subprocess.SubprocessError):
+            continue
+    return UNKNOWN_VERSION
+
+
+def get_tool_version(tool_path):
+    '''
+    Return the version of the tool at tool_path (see probe_tool_version).
+    The tool is only probed if its version is neither known to this process
+    nor in the tool cache.
+    Multi-call binaries print the version of the tool they are invoked as,
+    so the invoked path is part of the key, not only the resolved binary.
+    '''
+    if tool_path is None:
+        return UNKNOWN_VERSION
+    path = os.path.abspath(tool_path)
+    try:
+        # Stat of the resolved binary, changes when the tool is updated
+        stat = os.stat(path)
+    except OSError:
+        return UNKNOWN_VERSION
+    key = (path,) + HashCache.stat_key(stat)
+    version = _session_versions.get(key)
+    if version is not None:
+        return version
+    import sqlite3
+    tool_cache = get_tool_cache()
+    if tool_cache is not None and not tool_cache.disabled:
+        try:
+            version = tool_cache.lookup(path, stat)
+        except (sqlite3.Error, OSError) as e:
+            tool_cache.disable(e)
+    if version is None:
+        version = probe_tool_version(tool_path)
+        if tool_cache is not None and not tool_cache.disabled:
+            try:
+                tool_cache.store(path, stat, version)
+            except (sqlite3.Error, OSError) as e:
+                tool_cache.disable(e)
+    _session_versions[key] = version
+    return version
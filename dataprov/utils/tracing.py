@@ -0,0 +1,324 @@
+import os
+import sys
+import errno
+import struct
+import select
+import threading
+
+
+# Ways to trace the file accesses of the wrapped command
+trace_methods = ["auto", "inotify", "proc"]
+
+# Files created by dataprov itself are never recorded
+IGNORED_SUFFIXES = (".prov",)
+IGNORED_NAMES = (".shalist",)
+
+
+class Tracer:
+    '''
+    Base class of the tracers recording which files the wrapped command reads
+    and writes. Only regular files below one of the root directories are
+    recorded. A file that was read and written is an output.
+    '''
+
+    def __init__(self, roots):
+        self.roots = [os.path.realpath(root) for root in roots]
+        self.read_files = set()
+        self.written_files = set()
+        self.lock = threading.Lock()
+
+    def start(self):
+        '''
+        Start tracing, before the wrapped command is started.
+        '''
+        return
+
+    def watch_process(self, pid):
+        '''
+        Trace the process tree with the given root process.
+        '''
+        return
+
+    def stop(self):
+        '''
+        Stop tracing, after the wrapped command finished.
+        '''
+        return
+
+    def in_roots(self, path):
+        '''
+        Check if a path is located below one of the root directories.
+        '''
+        for root in self.roots:
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+                return True
+        return False
+
+    def record(self, path, written):
+        '''
+        Record an access to a file.
+        '''
+        name = os.path.basename(path)
+        if name in IGNORED_NAMES or name.endswith(IGNORED_SUFFIXES):
+            return
+        if not self.in_roots(path):
+            return
+        with self.lock:
+            if written:
+                self.written_files.add(path)
+            else:
+                self.read_files.add(path)
+
+    def get_read_files(self):
+        '''
+        Return the existing files that were read, but not written.
+        '''
+        with self.lock:
+            files = self.read_files - self.written_files
+        return sorted(f for f in files if os.path.isfile(f))
+
+    def get_written_files(self):
+        '''
+        Return the existing files that were written
+        (temporary files removed by the command are not returned).
+        '''
+        with self.lock:
+            files = set(self.written_files)
+        return sorted(f for f in files if os.path.isfile(f))
+
+
+class InotifyTracer(Tracer):
+    '''
+    Trace file accesses with inotify watches on every directory below the roots.
+    inotify does not report which process accessed a file, so accesses by
+    other processes in the watched directories are recorded, too.
+    '''
+
+    IN_ACCESS = 0x00000001
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_CLOSE_NOWRITE = 0x00000010
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    WATCH_MASK = IN_ACCESS | IN_MODIFY | IN_CLOSE_WRITE | IN_CLOSE_NOWRITE | \
+                 IN_MOVED_TO | IN_CREATE
+    WRITE_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    READ_MASK = IN_ACCESS | IN_CLOSE_NOWRITE
+
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, roots):
+        super().__init__(roots)
+        self.libc = load_libc()
+        self.fd = None
+        self.watches = {}
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    @classmethod
+    def is_available(cls):
+        '''
+        Check if inotify can be used on this system.
+        '''
+        libc = load_libc()
+        return sys.platform.startswith('linux') and libc is not None and \
+               hasattr(libc, 'inotify_init1')
+
+    def start(self):
+        import ctypes
+        fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.fd = fd
+        for root in self.roots:
+            self.add_tree(root)
+        self.thread = threading.Thread(target=self.read_loop, daemon=True)
+        self.thread.start()
+
+    def add_tree(self, path):
+        '''
+        Watch a directory and all its subdirectories.
+        '''
+        for root, dirnames, filenames in os.walk(path):
+            if not self.add_watch(root):
+                dirnames[:] = []
+
+    def add_watch(self, directory):
+        import ctypes
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                print("Cannot watch more directories (fs.inotify.max_user_watches), not traced: ", directory)
+            return False
+        self.watches[wd] = directory
+        return True
+
+    def read_loop(self):
+        while not self.stop_event.is_set():
+            readable, _, _ = select.select([self.fd], [], [], 0.1)
+            if readable:
+                self.read_events()
+        # Events are queued synchronously, read the rest after the command finished
+        self.read_events()
+
+    def read_events(self):
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                self.handle_event(wd, mask, os.fsdecode(name))
+
+    def handle_event(self, wd, mask, name):
+        if mask & self.IN_Q_OVERFLOW:
+            print("inotify event queue overflow, some file accesses were not traced")
+            return
+        directory = self.watches.get(wd)
+        if directory is None or not name:
+            return
+        path = os.path.join(directory, name)
+        if mask & self.IN_ISDIR:
+            # Watch new directories created by the command
+            if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                self.add_tree(path)
+            return
+        if mask & self.WRITE_MASK:
+            self.record(path, True)
+        elif mask & self.READ_MASK:
+            self.record(path, False)
+
+    def stop(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class ProcTracer(Tracer):
+    '''
+    Trace file accesses by polling /proc/<pid>/fd of the wrapped process tree.
+    Files that are opened and closed between two polls are missed.
+    '''
+
+    # Seconds between two polls
+    interval = 0.01
+
+    def __init__(self, roots):
+        super().__init__(roots)
+        self.pid = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    @classmethod
+    def is_available(cls):
+        return os.path.isdir('/proc/self/fd')
+
+    def watch_process(self, pid):
+        self.pid = pid
+        self.thread = threading.Thread(target=self.poll_loop, daemon=True)
+        self.thread.start()
+
+    def poll_loop(self):
+        while not self.stop_event.is_set():
+            for pid in self.get_process_tree(self.pid):
+                self.poll_process(pid)
+            self.stop_event.wait(self.interval)
+
+    def get_process_tree(self, root_pid):
+        '''
+        Return the pids of a process and all its descendants.
+        '''
+        pids = []
+        todo = [root_pid]
+        while todo:
+            pid = todo.pop()
+            pids.append(pid)
+            try:
+                for tid in os.listdir('/proc/%d/task' % pid):
+                    with open('/proc/%d/task/%s/children' % (pid, tid)) as children_file:
+                        todo.extend(int(child) for child in children_file.read().split())
+            except (OSError, ValueError):
+                continue
+        return pids
+
+    def poll_process(self, pid):
+        fd_dir = '/proc/%d/fd' % pid
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            return
+        for fd in fds:
+            try:
+                path = os.readlink(os.path.join(fd_dir, fd))
+                if not path.startswith('/'):
+                    continue
+                with open('/proc/%d/fdinfo/%s' % (pid, fd)) as fdinfo:
+                    flags = 0
+                    for line in fdinfo:
+                        if line.startswith('flags:'):
+                            flags = int(line.split()[1], 8)
+                            break
+            except (OSError, ValueError):
+                continue
+            # O_WRONLY or O_RDWR
+            self.record(path, (flags & 0o3) != 0)
+
+    def stop(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+
+_libc = None
+
+
+def load_libc():
+    '''
+    Load the C library, return None if it is not available.
+    ctypes is only imported when a tracer is created, not on start-up.
+    '''
+    global _libc
+    if _libc is None:
+        import ctypes
+        import ctypes.util
+        try:
+            _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        except OSError:
+            return None
+    return _libc
+
+
+def create_tracer(method="auto", roots=None):
+    '''
+    Create a tracer for the given method (one of trace_methods).
+    'auto' uses inotify if available and falls back to polling /proc.
+    '''
+    if method not in trace_methods:
+        raise ValueError("Unknown trace method: " + str(method))
+    if roots is None:
+        roots = [os.getcwd()]
+    if method in ("auto", "inotify") and InotifyTracer.is_available():
+        return InotifyTracer(roots)
+    if method == "inotify":
+        print("inotify is not available, trace file accesses via /proc")
+    if not ProcTracer.is_available():
+        raise OSError("Tracing file accesses is only supported on Linux")
+    return ProcTracer(roots)
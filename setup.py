@@ -9,7 +9,8 @@ setup(name='dataprov',
       license='TODO',
       packages=find_packages(),
       entry_points = {
-          'console_scripts': ['dataprov=dataprov.__main__:main']
+          'console_scripts': ['dataprov=dataprov.client:main',
+                              'dataprovd=dataprov.daemon:main']
       },
       install_requires=[
           'argparse',
@@ -0,0 +1,83 @@
+import os
+import sys
+import subprocess
+import pytest
+from dataprov.utils.hash_cache import configure_hash_cache
+from dataprov.utils.tool_cache import configure_tool_cache
+
+
+# Root of the repository, put on the PYTHONPATH of the dataprov processes
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executor config with empty optional fields (middleName, suffix)
+EXECUTOR_CONFIG = '''[executor]
+title = Dr.
+firstName = Jane
+middleName =
+surname = Doe
+suffix =
+mail = jane.doe@example.org
+
+[affiliations]
+affiliation1 = University
+'''
+
+
+@pytest.fixture
+def home(tmp_path):
+    '''
+    Home directory with an executor config.
+    '''
+    home = tmp_path / 'home'
+    (home / '.dataprov').mkdir(parents=True)
+    (home / '.dataprov' / 'executor.conf').write_text(EXECUTOR_CONFIG)
+    return home
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    workdir = tmp_path / 'work'
+    workdir.mkdir()
+    return workdir
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(tmp_path):
+    '''
+    Keep the persistent caches of in-process tests out of the home directory.
+    '''
+    configure_hash_cache(path=str(tmp_path / 'hashcache.sqlite'))
+    configure_tool_cache(path=str(tmp_path / 'toolcache.sqlite'))
+    yield
+    configure_hash_cache(enabled=False)
+    configure_tool_cache(enabled=False)
+
+
+@pytest.fixture
+def dataprov_env(home):
+    '''
+    Environment of dataprov processes: the test home directory, this
+    repository on the PYTHONPATH and no daemon.
+    '''
+    env = dict(os.environ, HOME=str(home), DATAPROV_NO_DAEMON='1')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get('PYTHONPATH')]))
+    env.pop('DATAPROV_SOCKET', None)
+    return env
+
+
+@pytest.fixture
+def dataprov_cli(workdir, dataprov_env):
+    '''
+    Run `python -m dataprov <args>` in the working directory.
+    Returns the CompletedProcess with stdout and stderr combined.
+    With check, a non-zero exit code fails the test.
+    '''
+    def run(*args, check=True):
+        result = subprocess.run([sys.executable, '-m', 'dataprov'] + list(args),
+                                cwd=str(workdir), env=dataprov_env,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                universal_newlines=True)
+        if check and result.returncode != 0:
+            raise AssertionError("dataprov " + " ".join(args) + " failed:\n" + result.stdout)
+        return result
+    return run
@@ -0,0 +1,38 @@
+import os
+from lxml import etree
+from dataprov.elements.dataprov import Dataprov
+from dataprov.utils.binary import get_sidecar_path, read_sidecar
+from dataprov.utils.hashing import hash_file
+
+
+def canonical_file(path):
+    parser = etree.XMLParser(remove_blank_text=True)
+    return etree.tostring(etree.parse(path, parser).getroot(), method='c14n')
+
+
+def test_sidecar_round_trip_of_run(dataprov_cli, workdir):
+    (workdir / 'input.txt').write_text("input\n")
+    result = dataprov_cli('--binary-sidecar', '-i', 'input.txt', '-o', 'output.txt',
+                          'run', 'cp', 'input.txt', 'output.txt')
+    assert "Cannot write binary sidecar" not in result.stdout
+    prov_file = str(workdir / 'output.txt.prov')
+    assert os.path.exists(get_sidecar_path(prov_file))
+
+    decoded = read_sidecar(prov_file, hash_file(prov_file))
+    assert isinstance(decoded, Dataprov)
+    # The decoded provenance data serializes to the content of the xml file
+    assert etree.tostring(decoded.to_xml(), method='c14n') == canonical_file(prov_file)
+    operation = decoded.data['history'].data['operation'][0]
+    assert operation.get_id() == etree.parse(prov_file).find('history/operation').get('id')
+
+
+def test_sidecar_of_changed_file_is_ignored(dataprov_cli, workdir):
+    (workdir / 'input.txt').write_text("input\n")
+    dataprov_cli('--binary-sidecar', '-o', 'output.txt', 'run', 'cp', 'input.txt', 'output.txt')
+    prov_file = str(workdir / 'output.txt.prov')
+    with open(prov_file, 'a') as xml_file:
+        xml_file.write("\n")
+    assert read_sidecar(prov_file, hash_file(prov_file)) is None
+    # The xml file is parsed instead
+    dataprov = Dataprov(prov_file)
+    assert dataprov.target.get_uri() == str(workdir / 'output.txt')
@@ -0,0 +1,32 @@
+import pytest
+from dataprov.elements.dataprov import Dataprov
+from dataprov.utils.io import detect_compression, find_prov_file
+
+
+@pytest.mark.parametrize('compression', ['gz', 'xz'])
+def test_compressed_prov_files(dataprov_cli, workdir, compression):
+    (workdir / 'src').write_text("src\n")
+    dataprov_cli('--compress', compression, '-o', 'a', 'run', 'cp', 'src', 'a')
+    prov_file = str(workdir / ('a.prov.' + compression))
+    assert detect_compression(prov_file) == compression
+    assert find_prov_file(str(workdir / 'a')) == prov_file
+    dataprov_cli('validate', '--verify', prov_file)
+
+    # The compressed provenance of an input is read
+    dataprov_cli('-i', 'a', '-o', 'b', 'run', 'cp', 'a', 'b')
+    dataprov = Dataprov(str(workdir / 'b.prov'))
+    assert len(dataprov.data['history'].data['operation']) == 2
+
+    # Compressed files are detected by their content, not by their name
+    renamed = workdir / 'renamed.prov'
+    (workdir / ('a.prov.' + compression)).rename(renamed)
+    assert len(list(Dataprov(str(renamed), stream=True).iter_operations())) == 1
+
+
+def test_corrupted_compressed_file(dataprov_cli, workdir):
+    (workdir / 'src').write_text("src\n")
+    dataprov_cli('--compress', 'gz', '-o', 'a', 'run', 'cp', 'src', 'a')
+    prov_file = workdir / 'a.prov.gz'
+    prov_file.write_bytes(prov_file.read_bytes()[:-20])
+    result = dataprov_cli('validate', str(prov_file), check=False)
+    assert result.returncode == 1
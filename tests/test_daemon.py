@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import socket
+import subprocess
+import pytest
+from dataprov import client
+from dataprov.daemon import open_socket
+
+
+@pytest.fixture
+def no_daemon_env(monkeypatch):
+    monkeypatch.delenv(client.NO_DAEMON_ENV, raising=False)
+
+
+def test_peer_uid():
+    left, right = socket.socketpair(socket.AF_UNIX)
+    with left, right:
+        assert client.get_peer_uid(left) == os.getuid()
+
+
+def test_client_checks_peer_before_sending(tmp_path, monkeypatch, no_daemon_env):
+    socket_path = str(tmp_path / 'dataprovd.sock')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(1)
+    with server:
+        connection = client.connect(socket_path)
+        assert connection is not None
+        connection.close()
+        server.accept()[0].close()
+
+        # A socket of another user is not used, nothing is sent to it
+        monkeypatch.setattr(client, 'get_peer_uid', lambda connection: os.getuid() + 1)
+        assert client.connect(socket_path) is None
+        peer, address = server.accept()
+        with peer:
+            assert peer.recv(1) == b''
+
+
+def test_private_dir(tmp_path):
+    private_dir = tmp_path / 'private'
+    private_dir.mkdir(0o700)
+    client.check_private_dir(str(private_dir))
+    private_dir.chmod(0o755)
+    with pytest.raises(OSError):
+        client.check_private_dir(str(private_dir))
+    link = tmp_path / 'link'
+    private_dir.chmod(0o700)
+    link.symlink_to(private_dir)
+    with pytest.raises(OSError):
+        client.check_private_dir(str(link))
+
+
+def test_default_socket_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv(client.SOCKET_ENV, raising=False)
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    private_dir = tmp_path / 'dataprovd'
+    monkeypatch.setattr('dataprov.daemon.get_private_dir', lambda: str(private_dir))
+    socket_path = str(private_dir / 'dataprovd.sock')
+    with open_socket(socket_path):
+        assert private_dir.stat().st_mode & 0o777 == 0o700
+        assert os.stat(socket_path).st_mode & 0o777 == 0o600
+    os.remove(socket_path)
+
+    # A directory accessible by others is not used
+    private_dir.chmod(0o777)
+    with pytest.raises(OSError):
+        open_socket(socket_path)
+
+
+def test_call_in_daemon(dataprov_env, workdir, tmp_path):
+    socket_path = str(tmp_path / 'dataprovd.sock')
+    env = dict(dataprov_env, DATAPROV_SOCKET=socket_path)
+    daemon = subprocess.Popen([sys.executable, '-m', 'dataprov.daemon'], env=env,
+                              stdout=subprocess.DEVNULL)
+    try:
+        start = time.time()
+        while not os.path.exists(socket_path):
+            assert daemon.poll() is None and time.time() - start < 30
+            time.sleep(0.05)
+        env.pop('DATAPROV_NO_DAEMON')
+        (workdir / 'input.txt').write_text("input\n")
+        result = subprocess.run([sys.executable, '-m', 'dataprov.client', '-i', 'input.txt',
+                                 '-o', 'output.txt', 'run', 'cp', 'input.txt', 'output.txt'],
+                                cwd=str(workdir), env=env, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, universal_newlines=True)
+        assert result.returncode == 0, result.stdout
+        assert (workdir / 'output.txt.prov').exists()
+        result = subprocess.run([sys.executable, '-m', 'dataprov.client', 'validate', 'missing.prov'],
+                                cwd=str(workdir), env=env, stdout=subprocess.DEVNULL)
+        assert result.returncode == 1
+    finally:
+        daemon.terminate()
+        daemon.wait()
@@ -0,0 +1,132 @@
+import os
+import time
+import pytest
+from dataprov.elements.directory import Directory
+from dataprov.utils.hash_cache import configure_hash_cache
+from dataprov.utils.external_sort import ExternalSorter
+
+
+def make_old(root):
+    '''
+    Move the mtime of the files out of the racy window (see Directory.racy_window).
+    '''
+    mtime = time.time() - 3600
+    for directory, dirnames, filenames in os.walk(str(root)):
+        for filename in filenames:
+            os.utime(os.path.join(directory, filename), (mtime, mtime))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / 'tree'
+    (root / 'sub' / 'deeper').mkdir(parents=True)
+    (root / 'a.txt').write_text("a\n")
+    (root / 'sub' / 'b.txt').write_text("b\n")
+    (root / 'sub' / 'deeper' / 'c.txt').write_text("c\n")
+    make_old(root)
+    return root
+
+
+@pytest.fixture
+def hashed_files(monkeypatch):
+    '''
+    Record the files hashed by Directory, the shalist is the only cache.
+    '''
+    configure_hash_cache(enabled=False)
+    hashed = []
+    compute_hash = Directory.compute_hash
+    def record_hash(self, file):
+        hashed.append(os.path.basename(file))
+        return compute_hash(self, file)
+    monkeypatch.setattr(Directory, 'compute_hash', record_hash)
+    return hashed
+
+
+def test_shalist_reuses_unchanged_files(tree, hashed_files):
+    sha1 = Directory(str(tree)).data['sha1']
+    assert sorted(hashed_files) == ['a.txt', 'b.txt', 'c.txt']
+
+    del hashed_files[:]
+    assert Directory(str(tree)).data['sha1'] == sha1
+    assert hashed_files == []
+
+    # Only changed and new files are hashed again
+    (tree / 'sub' / 'deeper' / 'c.txt').write_text("changed\n")
+    (tree / 'sub' / 'new.txt').write_text("new\n")
+    changed_sha1 = Directory(str(tree)).data['sha1']
+    assert sorted(hashed_files) == ['c.txt', 'new.txt']
+    assert changed_sha1 != sha1
+
+    # The digest only depends on names and content
+    os.remove(str(tree / Directory.shalist_name))
+    assert Directory(str(tree)).data['sha1'] == changed_sha1
+
+
+def test_shalist_lists_the_tree(tree, hashed_files):
+    Directory(str(tree))
+    with open(str(tree / Directory.shalist_name)) as shalist:
+        lines = shalist.read().splitlines()
+    assert lines[0] == Directory.shalist_header
+    paths = [line.split('\t')[-1] for line in lines[1:]]
+    assert paths == ['.', 'a.txt', 'sub', os.path.join('sub', 'b.txt'), os.path.join('sub', 'deeper'),
+                     os.path.join('sub', 'deeper', 'c.txt')]
+
+
+def test_shalist_escapes_names(tree, hashed_files):
+    names = ['tab\tname', 'new\nline', 'carriage\rreturn', 'percent%09sign']
+    for name in names:
+        (tree / 'sub' / name).write_text(name)
+    make_old(tree)
+    sha1 = Directory(str(tree)).data['sha1']
+    with open(str(tree / Directory.shalist_name)) as shalist:
+        lines = shalist.read().splitlines()
+    # One line per entry: the root, 3 directories, 3 + 4 files
+    assert len(lines) == 1 + 3 + 7
+    assert all(len(line.split('\t')) in (3, 7) for line in lines[1:])
+
+    del hashed_files[:]
+    assert Directory(str(tree)).data['sha1'] == sha1
+    assert hashed_files == []
+
+
+def test_external_sorter_merges_runs(tmp_path):
+    records = [(i * 7919) % 1000 for i in range(1000)]
+    with ExternalSorter(lambda record: record, batch_size=64, directory=str(tmp_path)) as sorter:
+        for record in records:
+            sorter.add(record)
+        assert len(sorter.runs) == 1000 // 64
+        assert len(sorter.batch) < 64
+        assert list(sorter) == sorted(records)
+
+
+def test_shalist_of_spilled_tree(tree, hashed_files, monkeypatch):
+    sha1 = Directory(str(tree)).data['sha1']
+    os.remove(str(tree / Directory.shalist_name))
+    # The listing and the entries are spilled to sorted runs
+    monkeypatch.setattr(Directory, 'batch_size', 2)
+    assert Directory(str(tree)).data['sha1'] == sha1
+
+
+
+def test_interrupted_shalist_write_keeps_previous(tree, hashed_files):
+    directory = Directory(str(tree))
+    shalist = tree / Directory.shalist_name
+    content = shalist.read_bytes()
+
+    def interrupted_entries():
+        yield '.', ('D', directory.data['sha1'])
+        raise KeyboardInterrupt()
+    with pytest.raises(KeyboardInterrupt):
+        directory.write_shalist(str(shalist), interrupted_entries())
+    assert shalist.read_bytes() == content
+    assert sorted(os.listdir(str(tree))) == ['.shalist', 'a.txt', 'sub']
+
+
+def test_recently_modified_files_are_hashed_again(tree, hashed_files):
+    # Written within the resolution of the timestamps after it was hashed,
+    # a file can change without changing its metadata
+    (tree / 'recent.txt').write_text("recent\n")
+    Directory(str(tree))
+    del hashed_files[:]
+    Directory(str(tree))
+    assert hashed_files == ['recent.txt']
@@ -0,0 +1,95 @@
+import pytest
+from dataprov.elements.file import File
+from dataprov.elements.data_object import DataObject
+from dataprov.elements.dataprov import Dataprov
+from dataprov.utils import hashing
+from dataprov.utils.hashing import configure_fingerprint, get_fingerprint_offsets, fingerprint_name
+from dataprov.utils.hash_cache import remember_digests
+
+
+@pytest.fixture
+def fingerprint_mode():
+    configure_fingerprint(min_size=1000, chunks=4, chunk_size=10)
+    yield
+    configure_fingerprint(min_size=None, chunks=16, chunk_size=1024 * 1024)
+
+
+def test_offsets_cover_head_and_tail():
+    assert get_fingerprint_offsets(100, 4, 10) == [0, 30, 60, 90]
+
+
+def test_large_files_are_sampled(fingerprint_mode, tmp_path):
+    small = tmp_path / 'small'
+    small.write_bytes(b'x' * 999)
+    assert not File(str(small)).is_sampled()
+
+    large = tmp_path / 'large'
+    large.write_bytes(b'x' * 1000)
+    file = File(str(large))
+    assert file.is_sampled()
+    assert file.data['sha1'] is None
+    fingerprint = file.data['fingerprint']
+    assert (fingerprint['size'], fingerprint['chunks'], fingerprint['chunkSize']) == (1000, 4, 10)
+
+    # The element is valid and can be read again
+    root = file.to_xml()
+    assert file.validate_xml(root)
+    parsed = File()
+    parsed.from_xml(root)
+    assert parsed.data['fingerprint'] == fingerprint
+    assert parsed.verify()
+
+
+def test_fingerprint_detects_sampled_changes(fingerprint_mode, tmp_path):
+    path = tmp_path / 'large'
+    path.write_bytes(b'x' * 1000)
+    file = File(str(path))
+    # Head and tail are sampled, a change in between the chunks is not detected
+    path.write_bytes(b'x' * 500 + b'y' + b'x' * 499)
+    assert file.verify()
+    path.write_bytes(b'y' + b'x' * 999)
+    assert not file.verify()
+    path.write_bytes(b'x' * 1001)
+    assert not file.verify()
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        configure_fingerprint(chunks=1)
+    with pytest.raises(ValueError):
+        configure_fingerprint(chunk_size=0)
+    assert hashing._settings['fingerprintMinSize'] is None
+
+
+def test_verify_reads_the_file(tmp_path):
+    path = tmp_path / 'file'
+    path.write_bytes(b'content')
+    file = File(str(path))
+    assert file.verify()
+    path.write_bytes(b'changed')
+    # A digest known for the current state of the file is not trusted
+    remember_digests(str(path), {'sha1': file.data['sha1']})
+    assert not file.verify()
+
+
+def test_verify_reads_sampled_files(fingerprint_mode, tmp_path):
+    path = tmp_path / 'large'
+    path.write_bytes(b'x' * 1000)
+    file = File(str(path))
+    path.write_bytes(b'y' * 1000)
+    algorithm = fingerprint_name(4, 10)
+    remember_digests(str(path), {algorithm: file.data['fingerprint']['value']})
+    assert not file.verify()
+
+
+def test_dag_nodes_of_sampled_files(fingerprint_mode, tmp_path):
+    nodes = set()
+    for directory in ('a', 'b'):
+        path = tmp_path / directory / 'large'
+        path.parent.mkdir()
+        path.write_bytes(directory.encode() * 1000)
+        data_object = DataObject(str(path))
+        nodes.add(Dataprov.get_node_name(data_object))
+    # Same name, different content
+    assert len(nodes) == 2
+    assert all(not node.endswith(':None') for node in nodes)
@@ -0,0 +1,104 @@
+import pytest
+from dataprov.elements.file import File
+from dataprov.elements.data_object import DataObject
+from dataprov.utils.hash_cache import HashCache, configure_hash_cache, get_session_stats
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = HashCache(str(tmp_path / 'cache.sqlite'))
+    # Files written by the tests are younger than the racy window
+    monkeypatch.setattr(cache, 'racy_window', -1.0)
+    yield cache
+    cache.close()
+
+
+def make_counter():
+    calls = []
+    def compute(file):
+        calls.append(file)
+        with open(file, 'rb') as f:
+            return f.read().decode()
+    return calls, compute
+
+
+def test_digest_is_reused(cache, tmp_path):
+    path = tmp_path / 'file'
+    path.write_text("content")
+    calls, compute = make_counter()
+    assert cache.get_digest(str(path), 'sha1', compute) == "content"
+    assert cache.get_digest(str(path), 'sha1', compute) == "content"
+    assert calls == [str(path)]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # The cache is shared with other processes through the database
+    other = HashCache(cache.path)
+    assert other.get_digest(str(path), 'sha1', compute) == "content"
+    assert len(calls) == 1
+    other.close()
+
+
+def test_changed_file_is_hashed_again(cache, tmp_path):
+    path = tmp_path / 'file'
+    path.write_text("content")
+    calls, compute = make_counter()
+    cache.get_digest(str(path), 'sha1', compute)
+    path.write_text("changed")
+    assert cache.get_digest(str(path), 'sha1', compute) == "changed"
+    assert len(calls) == 2
+    # The outdated digest of the inode was replaced
+    assert cache.info()['entries'] == 1
+
+
+def test_recently_modified_file_is_not_cached(cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'racy_window', 3600.0)
+    path = tmp_path / 'file'
+    path.write_text("content")
+    calls, compute = make_counter()
+    cache.get_digest(str(path), 'sha1', compute)
+    cache.get_digest(str(path), 'sha1', compute)
+    assert len(calls) == 2
+
+
+def test_evict_keeps_recently_used(cache, tmp_path):
+    calls, compute = make_counter()
+    for i in range(5):
+        path = tmp_path / str(i)
+        path.write_text(str(i))
+        cache.get_digest(str(path), 'sha1', compute)
+    assert cache.evict(max_entries=2) == 3
+    assert cache.info()['entries'] == 2
+    del calls[:]
+    cache.get_digest(str(tmp_path / '4'), 'sha1', compute)
+    assert calls == []
+
+
+def test_broken_cache_is_disabled(tmp_path, capsys):
+    cache_path = tmp_path / 'cache.sqlite'
+    cache_path.write_text("not a database")
+    cache = HashCache(str(cache_path))
+    path = tmp_path / 'file'
+    path.write_text("content")
+    calls, compute = make_counter()
+    assert cache.get_digest(str(path), 'sha1', compute) == "content"
+    assert cache.disabled
+    assert "Hash cache not usable" in capsys.readouterr().out
+
+
+def test_session_hashes_each_file_once(tmp_path):
+    configure_hash_cache(enabled=False)
+    path = tmp_path / 'file'
+    path.write_text("content")
+    before = get_session_stats()
+    sha1 = File(str(path)).data['sha1']
+    assert File(str(path)).data['sha1'] == sha1
+    DataObject(str(path))
+    stats = get_session_stats()
+    assert stats['requests'] - before['requests'] == 3
+    assert stats['hashed'] - before['hashed'] == 1
+    assert stats['sessionHits'] - before['sessionHits'] == 2
+
+    # A changed file is hashed again
+    path.write_text("changed content")
+    assert File(str(path)).data['sha1'] != sha1
+    assert get_session_stats()['hashed'] - before['hashed'] == 2
@@ -0,0 +1,34 @@
+import pytest
+from dataprov.elements.directory import Directory
+from dataprov.utils.hash_cache import get_session_stats, get_hash_cache
+from dataprov.utils.hash_pool import configure_hash_pool, hash_files
+
+
+@pytest.fixture(params=["thread", "process"])
+def pool(request):
+    configure_hash_pool(workers=2, pool=request.param)
+    yield request.param
+    configure_hash_pool()
+
+
+def make_tree(root, count):
+    root.mkdir()
+    for i in range(count):
+        (root / ('file' + str(i))).write_text(str(i))
+
+
+def test_hash_files_keeps_order(pool, tmp_path):
+    files = [str(tmp_path / str(i)) for i in range(20)]
+    assert hash_files(files, len) == [(file, len(file)) for file in files]
+
+
+def test_statistics_of_workers(pool, tmp_path):
+    make_tree(tmp_path / 'tree', 10)
+    before = get_session_stats()
+    Directory(str(tmp_path / 'tree'))
+    stats = get_session_stats()
+    # The files and the written shalist
+    assert stats['requests'] - before['requests'] == 11
+    assert stats['hashed'] - before['hashed'] == 10
+    assert get_hash_cache().misses == 10
+
@@ -0,0 +1,95 @@
+import hashlib
+import pytest
+from dataprov.utils import hashing
+from dataprov.elements.dataprov import Dataprov
+from dataprov.utils.hashing import configure_hashing, hash_file, io_strategies
+from dataprov.utils.hashing import hash_file_digests, register_digest, resolve_digest
+from dataprov.utils.hashing import configure_digests, get_digest_algorithms, get_extra_digests
+
+
+@pytest.fixture(autouse=True)
+def hashing_settings():
+    '''
+    Restore the process wide hashing settings after each test.
+    '''
+    settings = dict(hashing._settings)
+    yield
+    hashing._settings.clear()
+    hashing._settings.update(settings)
+
+
+@pytest.mark.parametrize('strategy', io_strategies)
+@pytest.mark.parametrize('size', [0, 1, hashing.MIN_BUFFER_SIZE, 3 * hashing.MIN_BUFFER_SIZE + 7])
+def test_strategies_compute_the_digest(strategy, size, tmp_path):
+    content = bytes(range(256)) * (size // 256) + b'x' * (size % 256)
+    path = tmp_path / 'file'
+    path.write_bytes(content)
+    # mmap is used for every non-empty file
+    configure_hashing(strategy=strategy, mmap_min_size=0)
+    assert hash_file(str(path)) == hashlib.sha1(content).hexdigest()
+
+
+def test_drop_page_cache(tmp_path, monkeypatch):
+    content = b'x' * (3 * hashing.MIN_BUFFER_SIZE)
+    path = tmp_path / 'file'
+    path.write_bytes(content)
+    monkeypatch.setitem(hashing._settings, 'dontneedMinSize', 0)
+    monkeypatch.setattr(hashing, 'DONTNEED_WINDOW', hashing.MIN_BUFFER_SIZE)
+    for strategy in io_strategies:
+        configure_hashing(strategy=strategy, mmap_min_size=0, drop_page_cache=True)
+        assert hash_file(str(path)) == hashlib.sha1(content).hexdigest()
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        configure_hashing(strategy="unknown")
+
+
+def test_buffer_size_follows_block_size():
+    class Stat:
+        st_blksize = 4096
+    assert hashing.get_buffer_size(Stat()) == 4096 * hashing.BLOCKS_PER_READ
+    Stat.st_blksize = 1024 * 1024
+    assert hashing.get_buffer_size(Stat()) == hashing.MAX_BUFFER_SIZE
+    Stat.st_blksize = 0
+    assert hashing.get_buffer_size(Stat()) >= hashing.MIN_BUFFER_SIZE
+
+
+def test_digests_in_one_pass(tmp_path, monkeypatch):
+    content = b'content' * 1000
+    path = tmp_path / 'file'
+    path.write_bytes(content)
+    opened = []
+    real_open = open
+    def counting_open(file, *args, **kwargs):
+        opened.append(file)
+        return real_open(file, *args, **kwargs)
+    monkeypatch.setattr('builtins.open', counting_open)
+    digests = hash_file_digests(str(path), ['sha1', 'sha256', 'md5'])
+    assert opened == [str(path)]
+    assert digests == {'sha1': hashlib.sha1(content).hexdigest(),
+                       'sha256': hashlib.sha256(content).hexdigest(),
+                       'md5': hashlib.md5(content).hexdigest()}
+
+
+def test_digest_registry():
+    register_digest('test-sha224', hashlib.sha224)
+    try:
+        assert 'test-sha224' in get_digest_algorithms()
+        configure_digests(['sha1', 'test-sha224', 'fast', 'test-sha224'])
+        # sha1 is always recorded, aliases are resolved
+        assert get_extra_digests() == ['test-sha224', resolve_digest('fast')]
+    finally:
+        del hashing._digest_algorithms['test-sha224']
+    with pytest.raises(ValueError):
+        configure_digests(['unknown'])
+
+
+def test_extra_digests_are_recorded(dataprov_cli, workdir):
+    (workdir / 'input.txt').write_text("input\n")
+    dataprov_cli('--digest', 'sha256', '-i', 'input.txt', '-o', 'output.txt',
+                 'run', 'cp', 'input.txt', 'output.txt')
+    target = Dataprov(str(workdir / 'output.txt.prov')).target.data['dataObject']
+    assert target.data['digests'] == {'sha256': hashlib.sha256(b"input\n").hexdigest()}
+    assert target.data['sha1'] == hashlib.sha1(b"input\n").hexdigest()
+    dataprov_cli('validate', '--verify', 'output.txt.prov')
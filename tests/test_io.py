@@ -0,0 +1,52 @@
+import os
+import pytest
+from dataprov.elements.dataprov import Dataprov
+from dataprov.utils.io import atomic_write, get_umask, write_xml
+
+
+@pytest.fixture
+def umask():
+    previous = os.umask(0o027)
+    yield 0o027
+    os.umask(previous)
+
+
+def test_get_umask(umask):
+    assert get_umask() == umask
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/status'), reason="needs /proc")
+def test_get_umask_does_not_set_the_umask(umask, monkeypatch):
+    # Setting the umask, even temporarily, affects files created by other threads
+    calls = []
+    monkeypatch.setattr(os, 'umask', lambda mask: calls.append(mask))
+    assert get_umask() == umask
+    assert calls == []
+
+
+def test_atomic_write_applies_umask(umask, tmp_path):
+    path = str(tmp_path / 'output')
+    with atomic_write(path) as output:
+        output.write(b'content')
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~umask
+
+
+def test_atomic_write_keeps_old_file_on_error(tmp_path):
+    path = tmp_path / 'output'
+    path.write_bytes(b'old')
+    with pytest.raises(RuntimeError):
+        with atomic_write(str(path)) as output:
+            output.write(b'partial')
+            raise RuntimeError("failed")
+    assert path.read_bytes() == b'old'
+    assert os.listdir(str(tmp_path)) == ['output']
+
+
+def test_incremental_writer_matches_document(dataprov_cli, workdir):
+    (workdir / 'src').write_text("src\n")
+    dataprov_cli('-o', 'a', 'run', 'cp', 'src', 'a')
+    dataprov_cli('-i', 'a', '-o', 'b', 'run', 'cp', 'a', 'b')
+    dataprov = Dataprov(str(workdir / 'b.prov'))
+    dataprov.write_xml(str(workdir / 'incremental.prov'))
+    write_xml(dataprov.to_xml(), str(workdir / 'document.prov'))
+    assert (workdir / 'incremental.prov').read_bytes() == (workdir / 'document.prov').read_bytes()
@@ -0,0 +1,23 @@
+from lxml import etree
+from dataprov.elements.dataprov import Dataprov
+
+
+def test_lazy_document(dataprov_cli, workdir):
+    (workdir / 'input.txt').write_text("input\n")
+    dataprov_cli('-o', 'a.txt', 'run', 'cp', 'input.txt', 'a.txt')
+    dataprov_cli('-i', 'a.txt', '-o', 'b.txt', 'run', 'cp', 'a.txt', 'b.txt')
+    prov_file = str(workdir / 'b.txt.prov')
+    eager = etree.tostring(Dataprov(prov_file).to_xml(), method='c14n')
+
+    dataprov = Dataprov(prov_file, lazy=True)
+    operations = dataprov.data['history'].data['operation']
+    assert len(operations) == 2
+    assert all(operation.is_deferred() for operation in operations)
+    # Untouched elements are copied, not rebuilt
+    assert etree.tostring(dataprov.to_xml(), method='c14n') == eager
+    assert all(operation.is_deferred() for operation in operations)
+
+    # The subtree is parsed on the first access
+    assert operations[0].get_target_data_object(str(workdir / 'a.txt')) is not None
+    assert not operations[0].is_deferred()
+    assert etree.tostring(dataprov.to_xml(), method='c14n') == eager
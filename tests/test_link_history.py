@@ -0,0 +1,54 @@
+import pytest
+from lxml import etree
+from dataprov.elements.dataprov import Dataprov
+
+
+@pytest.fixture
+def linked_chain(dataprov_cli, workdir):
+    (workdir / 'src').write_text("src\n")
+    dataprov_cli('-o', 'a', 'run', 'cp', 'src', 'a')
+    dataprov_cli('--link-history', '-i', 'a', '-o', 'b', 'run', 'cp', 'a', 'b')
+    dataprov_cli('--link-history', '-i', 'a', '-i', 'b', '-o', 'c', 'run', 'cp', 'b', 'c')
+    return workdir
+
+
+def test_history_is_linked(linked_chain):
+    history_ele = etree.parse(str(linked_chain / 'c.prov')).find('history')
+    links = history_ele.findall('historyLink')
+    # Relative to the linking .prov file
+    assert sorted(link.get('path') for link in links) == ['a.prov', 'b.prov']
+    assert len(history_ele.findall('operation')) == 1
+
+    # a.prov is linked twice, its operation is only followed once
+    operations = list(Dataprov(str(linked_chain / 'c.prov')).iter_operations())
+    assert len(operations) == 3
+    operations = list(Dataprov(str(linked_chain / 'c.prov'), stream=True).iter_operations())
+    assert len(operations) == 3
+
+
+def test_changed_link_is_rejected(linked_chain, dataprov_cli):
+    prov_file = linked_chain / 'a.prov'
+    prov_file.write_text(prov_file.read_text().replace('Jane', 'John'))
+    with pytest.raises(IOError):
+        list(Dataprov(str(linked_chain / 'c.prov')).iter_operations())
+    result = dataprov_cli('validate', 'c.prov', check=False)
+    assert result.returncode == 1
+
+
+def test_changed_link_is_reported_before_run(linked_chain, dataprov_cli):
+    (linked_chain / 'src').write_text("changed\n")
+    # Rerunning the upstream step replaces a.prov, which b.prov and c.prov link
+    dataprov_cli('-o', 'a', 'run', 'cp', 'src', 'a')
+    result = dataprov_cli('-i', 'c', '-o', 'd', 'run', 'cp', 'c', 'd', check=False)
+    assert result.returncode == 1
+    assert "Linked provenance file does not match the recorded sha1" in result.stdout
+    assert "Traceback" not in result.stdout
+    # The command was not run
+    assert not (linked_chain / 'd').exists()
+
+
+def test_linked_files_can_be_moved(linked_chain, tmp_path):
+    moved = tmp_path / 'moved'
+    linked_chain.rename(moved)
+    operations = list(Dataprov(str(moved / 'c.prov')).iter_operations())
+    assert len(operations) == 3
@@ -0,0 +1,121 @@
+import os
+import pytest
+from lxml import etree
+from dataprov.elements.dataprov import Dataprov
+from dataprov.elements.operation import Operation
+from dataprov.utils.object_store import ObjectStore, find_object_store, open_object_store
+
+
+def run_with_store(dataprov_cli, workdir, store):
+    (workdir / 'src').write_text("src\n")
+    dataprov_cli('-o', 'a', 'run', 'cp', 'src', 'a')
+    dataprov_cli('--object-store', store, '-i', 'a', '-o', 'b', 'run', 'cp', 'a', 'b')
+    return str(workdir / 'b.prov')
+
+
+def test_store_is_recorded(dataprov_cli, workdir, tmp_path):
+    store = str(tmp_path / 'store')
+    prov_file = run_with_store(dataprov_cli, workdir, store)
+    history_ele = etree.parse(prov_file).find('history')
+    assert history_ele.get('objectStore') == os.path.join('..', 'store')
+    assert len(history_ele.findall('operationRef')) == 2
+    assert find_object_store(prov_file, history_ele.get('objectStore')).path == store
+
+    # The store is found without --object-store
+    dataprov_cli('validate', '--verify', 'b.prov')
+    dataprov = Dataprov(prov_file)
+    assert len(dataprov.data['history'].data['operation']) == 2
+    dataprov_cli('pack', 'b.prov')
+    history_ele = etree.parse(prov_file).find('history')
+    assert history_ele.get('objectStore') is None
+    assert len(history_ele.findall('operation')) == 2
+
+
+def test_missing_store_raises(dataprov_cli, workdir, tmp_path):
+    store = tmp_path / 'store'
+    prov_file = run_with_store(dataprov_cli, workdir, str(store))
+    store.rename(tmp_path / 'moved')
+    with pytest.raises(IOError):
+        Dataprov(prov_file)
+
+
+def test_corrupted_object_is_reported_before_run(dataprov_cli, workdir, tmp_path):
+    store = str(tmp_path / 'store')
+    prov_file = run_with_store(dataprov_cli, workdir, store)
+    operation_id = etree.parse(prov_file).find('history/operationRef').get('id')
+    object_path = ObjectStore(store).get_object_path(operation_id)
+    with open(object_path, 'rb') as object_file:
+        content = object_file.read()
+    with open(object_path, 'wb') as object_file:
+        object_file.write(content.replace(b'Jane', b'John'))
+
+    result = dataprov_cli('-i', 'b', '-o', 'c', 'run', 'touch', 'c', check=False)
+    assert result.returncode == 1
+    assert "Corrupted object in object store" in result.stdout
+    # The command was not run
+    assert not (workdir / 'c').exists()
+
+    with open(prov_file, 'rb') as xml_file:
+        packed = xml_file.read()
+    result = dataprov_cli('pack', 'b.prov', check=False)
+    assert result.returncode == 1
+    assert "Corrupted object in object store" in result.stdout
+    with open(prov_file, 'rb') as xml_file:
+        assert xml_file.read() == packed
+
+
+def test_put_checks_the_content_id(dataprov_cli, workdir, tmp_path):
+    (workdir / 'src').write_text("src\n")
+    dataprov_cli('-o', 'a', 'run', 'cp', 'src', 'a')
+    operation_ele = etree.parse(str(workdir / 'a.prov')).find('history/operation')
+    object_store = ObjectStore(str(tmp_path / 'store'))
+    operation_ele.find('message').text = "edited"
+    with pytest.raises(IOError):
+        object_store.put(operation_ele)
+    assert not object_store.has(operation_ele.get('id'))
+
+    # An edited input is not stored under its stale id
+    prov_file = workdir / 'a.prov'
+    prov_file.write_text(prov_file.read_text().replace('Jane', 'John'))
+    result = dataprov_cli('--object-store', str(tmp_path / 'store'), '-i', 'a', '-o', 'b',
+                          'run', 'cp', 'a', 'b', check=False)
+    assert result.returncode == 1
+    assert not object_store.has(operation_ele.get('id'))
+
+
+def test_invalid_object_is_rejected(dataprov_cli, workdir, tmp_path):
+    store = str(tmp_path / 'store')
+    prov_file = run_with_store(dataprov_cli, workdir, store)
+    object_store = ObjectStore(store)
+    operation_id = etree.parse(prov_file).find('history/operationRef').get('id')
+    operation_ele = etree.parse(object_store.get_object_path(operation_id)).getroot()
+    # An invalid operation with a matching content ID
+    operation_ele.remove(operation_ele.find('executor'))
+    etree.SubElement(operation_ele, 'unexpected')
+    del operation_ele.attrib['id']
+    invalid_id = Operation.compute_id(operation_ele)
+    operation_ele.set('id', invalid_id)
+    object_store.put(operation_ele)
+    with open(prov_file) as xml_file:
+        content = xml_file.read()
+    with open(prov_file, 'w') as xml_file:
+        xml_file.write(content.replace(operation_id, invalid_id))
+
+    result = dataprov_cli('validate', 'b.prov', check=False)
+    assert result.returncode == 1
+    assert "Invalid object in object store" in result.stdout
+    result = dataprov_cli('pack', 'b.prov', check=False)
+    assert result.returncode == 1
+    assert etree.parse(prov_file).find('history/operationRef') is not None
+
+
+def test_to_xml_records_the_relative_store_path(dataprov_cli, workdir, tmp_path):
+    store = str(tmp_path / 'store')
+    prov_file = run_with_store(dataprov_cli, workdir, store)
+    dataprov = Dataprov(prov_file)
+    root = dataprov.to_xml(open_object_store(store))
+    assert root.find('history').get('objectStore') == os.path.join('..', 'store')
+    # Like write_xml, relative to the file the document is written to
+    output_file = str(workdir / 'sub' / 'b.prov')
+    root = dataprov.to_xml(open_object_store(store), output_file)
+    assert root.find('history').get('objectStore') == os.path.join('..', '..', 'store')
@@ -0,0 +1,70 @@
+import pytest
+from lxml import etree
+from dataprov.elements.dataprov import Dataprov
+from dataprov.elements.operation import Operation
+
+
+def read_operation(prov_file):
+    parser = etree.XMLParser(remove_blank_text=True)
+    return etree.parse(prov_file, parser).find('history/operation')
+
+
+def test_parsed_operation_keeps_its_content(dataprov_cli, workdir):
+    (workdir / 'input.txt').write_text("input\n")
+    dataprov_cli('-o', 'output.txt', 'run', 'cp', 'input.txt', 'output.txt')
+    operation_ele = read_operation(str(workdir / 'output.txt.prov'))
+    # The executor config has empty optional fields
+    assert operation_ele.find('executor/middleName') is not None
+
+    operation = Operation()
+    operation.from_xml(operation_ele)
+    root = operation.to_xml()
+    assert etree.tostring(root, method='c14n') == etree.tostring(operation_ele, method='c14n')
+    assert Operation.compute_id(root) == operation_ele.get('id')
+
+    # Modified operations get a new content ID
+    operation.record_message("changed")
+    root = operation.to_xml()
+    assert root.get('id') != operation_ele.get('id')
+    assert Operation.compute_id(root) == root.get('id')
+
+
+def test_stream_mode_keeps_operation_content(dataprov_cli, workdir):
+    (workdir / 'input.txt').write_text("input\n")
+    dataprov_cli('-o', 'output.txt', 'run', 'cp', 'input.txt', 'output.txt')
+    prov_file = str(workdir / 'output.txt.prov')
+    operation_ele = read_operation(prov_file)
+    operation = list(Dataprov(prov_file, stream=True).iter_operations())[0]
+    assert etree.tostring(operation.to_xml(), method='c14n') == etree.tostring(operation_ele, method='c14n')
+
+
+def test_chained_runs_validate(dataprov_cli, workdir, tmp_path):
+    store = str(tmp_path / 'store')
+    (workdir / 'src').write_text("src\n")
+    dataprov_cli('-o', 'a', 'run', 'cp', 'src', 'a')
+    dataprov_cli('--link-history', '-i', 'a', '-o', 'b', 'run', 'cp', 'a', 'b')
+    dataprov_cli('--object-store', store, '-i', 'b', '-o', 'c', 'run', 'cp', 'b', 'c')
+    result = dataprov_cli('--object-store', store, 'validate', '--verify', 'c.prov')
+    assert "XML is valid!" in result.stdout
+    # The stored operations are read again by the next run
+    dataprov_cli('--object-store', store, '-i', 'c', '-o', 'd', 'run', 'cp', 'c', 'd')
+    dataprov_cli('--object-store', store, 'validate', '--verify', 'd.prov')
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_edited_operation_is_rejected(dataprov_cli, workdir, lazy):
+    (workdir / 'input.txt').write_text("input\n")
+    dataprov_cli('-o', 'output.txt', 'run', 'cp', 'input.txt', 'output.txt')
+    prov_file = workdir / 'output.txt.prov'
+    # Still valid, but the id does not match the content anymore
+    prov_file.write_text(prov_file.read_text().replace('Jane', 'John'))
+    with pytest.raises(IOError):
+        Dataprov(str(prov_file), lazy=lazy)
+    with pytest.raises(IOError):
+        list(Dataprov(str(prov_file), stream=True).iter_operations())
+
+    result = dataprov_cli('-i', 'output.txt', '-o', 'copy.txt', 'run', 'cp', 'output.txt', 'copy.txt',
+                          check=False)
+    assert result.returncode == 1
+    assert "Operation does not match its content ID" in result.stdout
+    assert not (workdir / 'copy.txt').exists()
@@ -0,0 +1,32 @@
+import time
+import pytest
+from dataprov.utils.probes import ProbeRunner
+
+
+def test_probes_run_concurrently():
+    with ProbeRunner() as probes:
+        start = time.perf_counter()
+        for name in ('first', 'second', 'third'):
+            probes.submit(name, time.sleep, 0.2)
+        for name in ('first', 'second', 'third'):
+            probes.result(name)
+        assert time.perf_counter() - start < 0.5
+        assert probes.run('inline', sum, [1, 2]) == 3
+    assert set(probes.timings) == {'first', 'second', 'third', 'inline'}
+
+
+def test_probe_errors_are_raised_by_result():
+    def fail():
+        raise SystemExit(1)
+    with ProbeRunner() as probes:
+        probes.submit('failing', fail)
+        with pytest.raises(SystemExit):
+            probes.result('failing')
+
+
+def test_probe_report(dataprov_cli, workdir):
+    (workdir / 'input.txt').write_text("input\n")
+    result = dataprov_cli('--debug', '-i', 'input.txt', '-o', 'output.txt', 'run', 'cp', 'input.txt', 'output.txt')
+    assert "Metadata probes" in result.stdout
+    for probe in ('host', 'inputs', 'executor', 'opClass'):
+        assert "  " + probe + " " in result.stdout
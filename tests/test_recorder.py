@@ -0,0 +1,56 @@
+import pytest
+import dataprov
+from dataprov.elements.dataprov import Dataprov
+
+
+@pytest.fixture
+def executor(home):
+    return str(home / '.dataprov' / 'executor.conf')
+
+
+def test_record_block(executor, tmp_path):
+    source = tmp_path / 'source.txt'
+    source.write_text("source\n")
+    first = tmp_path / 'first.txt'
+    second = tmp_path / 'second.txt'
+    with dataprov.record(inputs=str(source), outputs=[str(first)], message="first",
+                         executor=executor) as recorder:
+        first.write_text(source.read_text())
+    assert recorder.prov_files == [str(first) + '.prov']
+
+    with dataprov.record(inputs=str(first), executor=executor) as recorder:
+        second.write_text(first.read_text())
+        recorder.add_output(str(second))
+    history = Dataprov(str(second) + '.prov').data['history'].data['operation']
+    assert len(history) == 2
+    assert history[0].data['message'] == "first"
+    assert history[1].get_target_data_object(str(second)) is not None
+
+
+def test_record_decorator(executor, tmp_path):
+    output = tmp_path / 'output.txt'
+
+    @dataprov.record(outputs=str(output), executor=executor)
+    def write_output():
+        output.write_text("output\n")
+
+    write_output()
+    operation = Dataprov(str(output) + '.prov').data['history'].data['operation'][0]
+    command = operation.data['opClass'].data['opClass'].data['command']
+    assert command.endswith('write_output')
+    # Each call is recorded on its own
+    write_output()
+    assert len(Dataprov(str(output) + '.prov').data['history'].data['operation']) == 1
+
+
+def test_failed_block_is_not_recorded(executor, tmp_path):
+    output = tmp_path / 'output.txt'
+    with pytest.raises(RuntimeError):
+        with dataprov.record(outputs=str(output), executor=executor):
+            output.write_text("partial\n")
+            raise RuntimeError("failed")
+    assert not (tmp_path / 'output.txt.prov').exists()
+
+    with pytest.raises(IOError):
+        with dataprov.record(outputs=str(tmp_path / 'missing.txt'), executor=executor):
+            pass
@@ -0,0 +1,43 @@
+from lxml import etree
+from dataprov.utils.schemas import SchemaRegistry, get_element_schema_files
+from dataprov.elements.host import Host
+from dataprov.elements.dataprov import Dataprov
+from dataprov.elements.generic_element import GenericElement
+
+
+def test_element_schemas_compile():
+    registry = SchemaRegistry()
+    for schema_file in get_element_schema_files():
+        registry.get_schema(schema_file)
+    assert registry.compiled == len(get_element_schema_files())
+
+
+def test_schemas_are_compiled_once():
+    registry = SchemaRegistry()
+    schema_file = get_element_schema_files()[0]
+    assert registry.get_schema(schema_file) is registry.get_schema(schema_file)
+    assert registry.compiled == 1
+
+
+def test_element_is_validated():
+    host = Host()
+    root = host.to_xml()
+    assert host.validate_xml(root)
+    etree.SubElement(root, 'unexpected')
+    assert not host.validate_xml(root)
+
+
+def test_document_is_validated_once(dataprov_cli, workdir, monkeypatch):
+    (workdir / 'input.txt').write_text("input\n")
+    dataprov_cli('-o', 'a.txt', 'run', 'cp', 'input.txt', 'a.txt')
+    dataprov_cli('-i', 'a.txt', '-o', 'b.txt', 'run', 'cp', 'a.txt', 'b.txt')
+    validated = []
+    validate_xml = GenericElement.validate_xml
+    def record_validation(self, root):
+        validated.append(root.tag)
+        return validate_xml(self, root)
+    monkeypatch.setattr(GenericElement, 'validate_xml', record_validation)
+    dataprov = Dataprov(str(workdir / 'b.txt.prov'))
+    assert len(dataprov.data['history'].data['operation']) == 2
+    # The subtrees are covered by the schema of the root element
+    assert validated == ['dataprov']
@@ -0,0 +1,18 @@
+import sys
+import subprocess
+import pytest
+
+
+# Modules only needed by some commands, they are imported where they are used
+lazy_modules = ['sqlite3', 'ctypes', 'concurrent.futures', 'tempfile', 'platform', 'subprocess',
+                'docker', 'ruamel.yaml', 'graphviz', 'dataprov.utils.probes',
+                'dataprov.utils.tool_cache']
+
+
+@pytest.mark.parametrize('module', ['dataprov.__main__', 'dataprov.client'])
+def test_lazy_imports(dataprov_env, module):
+    code = ("import sys, " + module + "\n"
+            "print(' '.join(m for m in " + repr(lazy_modules) + " if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], env=dataprov_env,
+                            stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    assert result.stdout.split() == []
@@ -0,0 +1,14 @@
+import hashlib
+import pytest
+from dataprov.elements.dataprov import Dataprov
+
+
+@pytest.mark.parametrize('size', [0, 5, 3 * 1024 * 1024 + 1])
+def test_stdout_is_hashed_while_writing(dataprov_cli, workdir, size):
+    result = dataprov_cli('--debug', '--stdout-to', 'output.bin', 'run', 'head', '-c', str(size), '/dev/zero')
+    content = b'\0' * size
+    assert (workdir / 'output.bin').read_bytes() == content
+    target = Dataprov(str(workdir / 'output.bin.prov')).target.data['dataObject']
+    assert target.data['sha1'] == hashlib.sha1(content).hexdigest()
+    # The digest computed while writing is used, the output is not read again
+    assert "Files hashed:  0" in result.stdout
@@ -0,0 +1,40 @@
+import pytest
+from dataprov.elements.dataprov import Dataprov
+
+
+@pytest.fixture
+def prov_file(dataprov_cli, workdir):
+    (workdir / 'input.txt').write_text("input\n")
+    dataprov_cli('-o', 'output.txt', 'run', 'cp', 'input.txt', 'output.txt')
+    dataprov_cli('-i', 'output.txt', '-o', 'copy.txt', 'run', 'cp', 'output.txt', 'copy.txt')
+    return workdir / 'copy.txt.prov'
+
+
+def test_stream_reader(prov_file, workdir):
+    dataprov = Dataprov(str(prov_file), stream=True)
+    assert dataprov.target.get_uri() == str(workdir / 'copy.txt')
+    operations = list(dataprov.iter_operations())
+    assert len(operations) == 2
+    assert operations[1].get_target_data_object(str(workdir / 'copy.txt')) is not None
+
+
+def remove_history(content):
+    start = content.index('<history>')
+    end = content.index('</history>') + len('</history>')
+    return content[:start] + content[end:]
+
+
+@pytest.mark.parametrize('invalidate', [
+    # Unexpected child of the history, after the last operation
+    lambda content: content.replace('</history>', '<unexpected/></history>'),
+    # Unexpected child of the root
+    lambda content: content.replace('<history>', '<unexpected/><history>'),
+    remove_history,
+])
+def test_stream_reader_validates_document(prov_file, dataprov_cli, invalidate):
+    prov_file.write_text(invalidate(prov_file.read_text()))
+    with pytest.raises(IOError):
+        list(Dataprov(str(prov_file), stream=True).iter_operations())
+    result = dataprov_cli('validate', str(prov_file), check=False)
+    assert result.returncode == 1
+    assert "XML is not valid!" in result.stdout
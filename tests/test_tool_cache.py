@@ -0,0 +1,76 @@
+import os
+import pytest
+from dataprov.utils import tool_cache
+from dataprov.utils.tool_cache import configure_tool_cache, get_tool_version, probe_tool_version
+from dataprov.utils.tool_cache import UNKNOWN_VERSION
+
+
+def make_tool(path, script):
+    path.write_text("#!/bin/sh\necho probe >> " + str(path) + ".calls\n" + script)
+    path.chmod(0o755)
+    return str(path)
+
+
+def count_probes(tool):
+    if not os.path.exists(tool + '.calls'):
+        return 0
+    with open(tool + '.calls') as calls:
+        return len(calls.readlines())
+
+
+@pytest.fixture
+def session_versions(monkeypatch):
+    '''
+    Start with an empty session registry of tool versions.
+    '''
+    monkeypatch.setattr(tool_cache, '_session_versions', {})
+
+
+def test_version_is_cached_across_runs(tmp_path, session_versions):
+    tool = make_tool(tmp_path / 'tool', 'echo "tool 1.0"\n')
+    assert get_tool_version(tool) == "tool 1.0\n"
+    assert get_tool_version(tool) == "tool 1.0\n"
+    assert count_probes(tool) == 1
+
+    # Another process finds the version in the cache
+    tool_cache._session_versions.clear()
+    configure_tool_cache(path=tool_cache.get_tool_cache().path)
+    assert get_tool_version(tool) == "tool 1.0\n"
+    assert count_probes(tool) == 1
+
+    # An updated tool is probed again
+    make_tool(tmp_path / 'tool', 'echo "tool 2.0"\n')
+    os.remove(tool + '.calls')
+    assert get_tool_version(tool) == "tool 2.0\n"
+    assert count_probes(tool) == 1
+
+
+def test_failing_probes(tmp_path, session_versions):
+    # The first option fails, the next one is tried
+    tool = make_tool(tmp_path / 'tool', '[ "$1" = "-v" ] || exit 1\necho "tool 1.0"\n')
+    assert probe_tool_version(tool) == "tool 1.0\n"
+    assert count_probes(tool) == 2
+    assert get_tool_version(str(tmp_path / 'missing')) == UNKNOWN_VERSION
+    assert get_tool_version(None) == UNKNOWN_VERSION
+
+
+def test_probe_timeout(tmp_path, session_versions):
+    tool = make_tool(tmp_path / 'tool', 'sleep 10\n')
+    assert probe_tool_version(tool, timeout=0.2) == UNKNOWN_VERSION
+    # A tool that does not answer is not started again
+    assert count_probes(tool) == 1
+
+
+def test_symlinks_to_multi_call_binary(tmp_path, session_versions):
+    # Like busybox, the tool prints the version of the name it is called as
+    tool = make_tool(tmp_path / 'multicall', 'echo "$(basename "$0") 1.0"\n')
+    (tmp_path / 'cp-like').symlink_to(tool)
+    (tmp_path / 'ls-like').symlink_to(tool)
+    assert get_tool_version(str(tmp_path / 'ls-like')) == "ls-like 1.0\n"
+    assert get_tool_version(str(tmp_path / 'cp-like')) == "cp-like 1.0\n"
+
+    # Also across processes
+    tool_cache._session_versions.clear()
+    assert get_tool_version(str(tmp_path / 'cp-like')) == "cp-like 1.0\n"
+    assert get_tool_version(str(tmp_path / 'ls-like')) == "ls-like 1.0\n"
+    assert count_probes(tool) == 2
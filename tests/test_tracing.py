@@ -0,0 +1,39 @@
+import os
+import pytest
+from dataprov.elements.dataprov import Dataprov
+from dataprov.utils.tracing import Tracer, InotifyTracer, create_tracer
+
+
+def test_tracer_records_files_below_roots(tmp_path):
+    root = tmp_path / 'root'
+    root.mkdir()
+    for name in ('input', 'output', 'updated'):
+        (root / name).write_text(name)
+    (tmp_path / 'outside').write_text("outside")
+    tracer = Tracer([str(root)])
+    tracer.record(str(root / 'input'), False)
+    tracer.record(str(root / 'updated'), False)
+    tracer.record(str(root / 'updated'), True)
+    tracer.record(str(root / 'output'), True)
+    tracer.record(str(root / 'removed'), True)
+    tracer.record(str(tmp_path / 'outside'), False)
+    assert tracer.get_read_files() == [str(root / 'input')]
+    # A file that was read and written is an output, removed files are ignored
+    assert tracer.get_written_files() == [str(root / 'output'), str(root / 'updated')]
+
+
+def test_unknown_trace_method():
+    with pytest.raises(ValueError):
+        create_tracer("unknown")
+
+
+@pytest.mark.skipif(not InotifyTracer.is_available(), reason="needs inotify")
+def test_traced_run(dataprov_cli, workdir):
+    (workdir / 'input.txt').write_text("input\n")
+    dataprov_cli('--trace', '--trace-method', 'inotify', 'run', 'cp', 'input.txt', 'output.txt')
+    dataprov = Dataprov(str(workdir / 'output.txt.prov'))
+    operation = dataprov.data['history'].data['operation'][-1]
+    inputs = [data_object.get_uri() for data_object in operation.data['inputDataObjects'].data['objects']]
+    assert inputs == [str(workdir / 'input.txt')]
+    # The input itself gets no provenance file
+    assert not os.path.exists(str(workdir / 'input.txt.prov'))